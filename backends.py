@@ -0,0 +1,242 @@
+"""Generation backends behind baseline_generator.generate_humor.
+
+The model name picks the backend: "local" or "local:<model>" runs a model on this machine's CPU
+(see LocalBackend); every other name goes to the OpenAI API. Each backend declares what it can do
+and how it wants to be driven:
+
+- `vision` / `json_mode`: whether it accepts images and JSON-mode requests
+- `max_pack`: rows per packed JSON request it handles well (None = whatever the caller asks)
+- `batch_size`: prompts it generates in one call of `complete_batch`
+- `slot(model)`: context manager capping its requests in flight
+- `resilient`: whether calls go through resilience.call (deadlines, hedging, circuit breaker)
+- `needs_key`: whether it needs an API key
+"""
+import os
+import threading
+from contextlib import contextmanager
+import key_pool
+import model_router
+
+LOCAL = "local"
+# Model used for plain "local": a GGUF file path (llama.cpp) or a Hugging Face model id (transformers)
+LOCAL_MODEL = os.getenv("MWAHAHA_LOCAL_MODEL", "Qwen/Qwen2.5-0.5B-Instruct")
+LOCAL_THREADS = int(os.getenv("MWAHAHA_LOCAL_THREADS", str(os.cpu_count() or 4)))
+# Prompts per forward pass with transformers; llama.cpp takes one at a time
+LOCAL_BATCH = int(os.getenv("MWAHAHA_LOCAL_BATCH", "8"))
+LOCAL_CONTEXT = 4096
+
+class Reply:
+    def __init__(self, text, finish_reason=None, prompt_tokens=None, completion_tokens=None):
+        self.text = text
+        self.finish_reason = finish_reason
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+
+    def fill(self, stats):
+        """Copies the finish reason and token usage into a generate_humor stats dict."""
+        if stats is None:
+            return
+        stats['finish_reason'] = self.finish_reason
+        if self.prompt_tokens is not None:
+            stats['prompt_tokens'] = self.prompt_tokens
+            stats['completion_tokens'] = self.completion_tokens
+
+class Backend:
+    vision = False
+    json_mode = False
+    max_pack = 1
+    batch_size = 1
+    resilient = False
+    needs_key = False
+
+    def slot(self, model):
+        raise NotImplementedError
+
+    def complete(self, messages, model, max_tokens, temperature, stop=None, json_mode=False, timeout=None, api_key=None,
+                 stats=None):
+        """Returns a Reply for one chat request."""
+        raise NotImplementedError
+
+    def stream(self, messages, model, max_tokens, temperature, stop=None, json_mode=False, api_key=None, stats=None):
+        """Yields text deltas for one chat request and fills `stats` with the finish reason and usage."""
+        reply = self.complete(messages, model, max_tokens, temperature, stop, json_mode, api_key=api_key, stats=stats)
+        reply.fill(stats)
+        yield reply.text
+
+    def complete_batch(self, conversations, model, max_tokens, temperature, stop=None):
+        """Returns one Reply per conversation."""
+        return [self.complete(messages, model, max_tokens, temperature, stop) for messages in conversations]
+
+class OpenAIBackend(Backend):
+    """The OpenAI API, through the pooled clients and API keys. Budgets come from model_router.LIMITS."""
+    vision = True
+    json_mode = True
+    max_pack = None
+    resilient = True
+    needs_key = True
+
+    def slot(self, model):
+        return model_router.budget(model)
+
+    def _kwargs(self, stop, json_mode):
+        kwargs = {}
+        if json_mode:
+            kwargs['response_format'] = {"type": "json_object"}
+        if stop:
+            kwargs['stop'] = stop
+        return kwargs
+
+    def complete(self, messages, model, max_tokens, temperature, stop=None, json_mode=False, timeout=None, api_key=None,
+                 stats=None):
+        response = key_pool.call(lambda client: client.chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            timeout=timeout,
+            **self._kwargs(stop, json_mode)
+        ), api_key, stats)
+        usage = response.usage
+        return Reply(response.choices[0].message.content, response.choices[0].finish_reason,
+                     usage.prompt_tokens if usage is not None else None,
+                     usage.completion_tokens if usage is not None else None)
+
+    def stream(self, messages, model, max_tokens, temperature, stop=None, json_mode=False, api_key=None, stats=None):
+        response = key_pool.call(lambda client: client.chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stream=True,
+            stream_options={"include_usage": True},
+            **self._kwargs(stop, json_mode)
+        ), api_key, stats)
+        for chunk in response:
+            if chunk.usage is not None:
+                stats['prompt_tokens'] = chunk.usage.prompt_tokens
+                stats['completion_tokens'] = chunk.usage.completion_tokens
+            if not chunk.choices:
+                continue
+            if chunk.choices[0].finish_reason:
+                stats['finish_reason'] = chunk.choices[0].finish_reason
+            if chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+def _cut_at_stop(text, stop):
+    """Truncates at the earliest stop sequence. Returns (text, whether one was found)."""
+    cuts = [text.index(s) for s in stop or [] if s in text]
+    return (text[:min(cuts)], True) if cuts else (text, False)
+
+class LocalBackend(Backend):
+    """A small model on this machine's CPU, for drafts, smoke runs and offline template work. Text only.
+
+    A path ending in .gguf is loaded with llama.cpp (`pip install llama-cpp-python`); anything else
+    is a Hugging Face model id loaded with transformers (`pip install transformers torch`). The model
+    is loaded on first use. One request runs at a time, using LOCAL_THREADS threads; transformers
+    generates up to LOCAL_BATCH prompts per forward pass. With transformers, streaming yields the
+    whole reply at once.
+    """
+    max_pack = 1
+
+    def __init__(self, model_id):
+        self.model_id = model_id
+        self.gguf = model_id.endswith(".gguf")
+        self.batch_size = 1 if self.gguf else LOCAL_BATCH
+        self.json_mode = self.gguf
+        self._model = None
+        self._tokenizer = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def slot(self, model):
+        with self._lock:
+            yield
+
+    def _load(self):
+        if self._model is not None:
+            return
+        if self.gguf:
+            try:
+                from llama_cpp import Llama
+            except ImportError:
+                raise RuntimeError("llama-cpp-python is not installed (pip install llama-cpp-python)")
+            self._model = Llama(model_path=self.model_id, n_ctx=LOCAL_CONTEXT, n_threads=LOCAL_THREADS, verbose=False)
+            return
+        try:
+            import torch
+            from transformers import AutoModelForCausalLM, AutoTokenizer
+        except ImportError:
+            raise RuntimeError("transformers and torch are not installed (pip install transformers torch)")
+        torch.set_num_threads(LOCAL_THREADS)
+        tokenizer = AutoTokenizer.from_pretrained(self.model_id)
+        # Left padding, so every prompt of a batch ends where its generation starts
+        tokenizer.padding_side = "left"
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        self._model = AutoModelForCausalLM.from_pretrained(self.model_id).eval()
+        self._tokenizer = tokenizer
+
+    def complete(self, messages, model, max_tokens, temperature, stop=None, json_mode=False, timeout=None, api_key=None,
+                 stats=None):
+        self._load()
+        if self.gguf:
+            kwargs = {'response_format': {"type": "json_object"}} if json_mode else {}
+            response = self._model.create_chat_completion(messages=messages, max_tokens=max_tokens, temperature=temperature,
+                                                          stop=stop, **kwargs)
+            usage = response.get('usage') or {}
+            return Reply(response['choices'][0]['message']['content'], response['choices'][0]['finish_reason'],
+                         usage.get('prompt_tokens'), usage.get('completion_tokens'))
+        return self.complete_batch([messages], model, max_tokens, temperature, stop)[0]
+
+    def stream(self, messages, model, max_tokens, temperature, stop=None, json_mode=False, api_key=None, stats=None):
+        if not self.gguf:
+            yield from super().stream(messages, model, max_tokens, temperature, stop, json_mode, api_key, stats)
+            return
+        self._load()
+        kwargs = {'response_format': {"type": "json_object"}} if json_mode else {}
+        for chunk in self._model.create_chat_completion(messages=messages, max_tokens=max_tokens, temperature=temperature,
+                                                        stop=stop, stream=True, **kwargs):
+            choice = chunk['choices'][0]
+            if choice.get('finish_reason'):
+                stats['finish_reason'] = choice['finish_reason']
+            if choice['delta'].get('content'):
+                yield choice['delta']['content']
+
+    def complete_batch(self, conversations, model, max_tokens, temperature, stop=None):
+        self._load()
+        if self.gguf:
+            return [self.complete(messages, model, max_tokens, temperature, stop) for messages in conversations]
+        import torch
+        tokenizer = self._tokenizer
+        texts = [tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+                 for messages in conversations]
+        inputs = tokenizer(texts, return_tensors="pt", padding=True)
+        sampling = {'do_sample': True, 'temperature': temperature} if temperature > 0 else {'do_sample': False}
+        with torch.no_grad():
+            output = self._model.generate(**inputs, max_new_tokens=max_tokens, pad_token_id=tokenizer.pad_token_id,
+                                          **sampling)
+        replies = []
+        for prompt_ids, generated in zip(inputs['attention_mask'], output[:, inputs['input_ids'].shape[1]:]):
+            # Padding (and the end-of-sequence token, which often doubles as padding) is not part of the reply
+            generated = generated[(generated != tokenizer.pad_token_id) & (generated != tokenizer.eos_token_id)]
+            text, stopped = _cut_at_stop(tokenizer.decode(generated, skip_special_tokens=True), stop)
+            finish_reason = "length" if len(generated) >= max_tokens and not stopped else "stop"
+            replies.append(Reply(text.strip(), finish_reason, int(prompt_ids.sum()), len(generated)))
+        return replies
+
+_backends = {}
+_lock = threading.Lock()
+
+def is_local(model):
+    return bool(model) and (model == LOCAL or model.startswith(LOCAL + ":"))
+
+def get(model):
+    """The backend serving `model` (one instance per model, so a local model is loaded once per process)."""
+    key = model if is_local(model) else "openai"
+    with _lock:
+        if key not in _backends:
+            if is_local(model):
+                _backends[key] = LocalBackend(model.split(":", 1)[1] if ":" in model else LOCAL_MODEL)
+            else:
+                _backends[key] = OpenAIBackend()
+        return _backends[key]
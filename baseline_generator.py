@@ -2,90 +2,266 @@ import pandas as pd
 import os
 import time
 from tqdm import tqdm
-from openai import OpenAI
 from dotenv import load_dotenv
-import zipfile
 import base64
+import hashlib
+from functools import lru_cache
 from jinja2 import Environment, FileSystemLoader
+import config
+import dataset
+import run_log
+import packing
+import scene_index
+import response_cache
+import client_pool
+import packager
+import resilience
+import scheduler
+import profiling
+import compliance
+import model_router
+import generation_limits
+import provenance
+import key_pool
+import backends
 
 load_dotenv()
-client = None
+# Process-wide defaults for callers that do not pass model/api_key explicitly (CLI scripts)
 MODEL = "gpt-4o-mini"
+API_KEY = None
 
-DATA_DIR = "data"
-OUTPUT_DIR = "output"
-TEMPLATE_DIR = "templates"
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+DATA_DIR = config.DATA_DIR
+OUTPUT_DIR = config.OUTPUT_DIR
+TEMPLATE_DIR = config.TEMPLATE_DIR
+CACHE_DIR = config.CACHE_DIR
+TASK_TEMPLATES = config.TASK_TEMPLATES
 
 def set_config(api_key=None, model=None):
-    global client, MODEL
+    """Sets the process-wide defaults. Shared servers (Streamlit) should pass model/api_key per call instead."""
+    global API_KEY, MODEL
     if api_key:
-        client = OpenAI(api_key=api_key)
+        API_KEY = api_key
     if model:
         MODEL = model
 
-# Initialize default client if key in env
-if os.getenv("OPENAI_API_KEY"):
-    client = OpenAI()
+def get_client(api_key=None):
+    """Returns the pooled client for a key (falling back to set_config's key, then OPENAI_API_KEY).
+
+    Generation calls without an explicit key go through key_pool instead, which spreads them over every configured key.
+    """
+    return client_pool.get_client(api_key or API_KEY)
+
+# Pause after each request of a sequential run
+REQUEST_PAUSE = 0.05
+# Edited templates compiled and GIFs base64-encoded, kept in memory
+TEMPLATE_CACHE_SIZE = 32
+ENCODED_CACHE_SIZE = 64
+
+# Measurements of a packed request that are split evenly over its rows; other stats (flags, model, key) are copied
+PACKED_SHARED_STATS = ('latency', 'ttft', 'prompt_tokens', 'completion_tokens')
+
+SYSTEM_PROMPT = "You are a master of humor and wit. Follow the detailed instructions provided in the prompt."
+TEMPERATURE = 0.8
 
 # Setup Jinja2 environment
 env = Environment(loader=FileSystemLoader(TEMPLATE_DIR))
 
+@lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def compile_template(template_content):
+    return Environment().from_string(template_content)
+
 def get_rendered_prompt(template_name, user_input, template_content=None):
     if template_content:
         # If template content is provided directly (from UI editor)
-        template = Environment().from_string(template_content)
+        template = compile_template(template_content)
     else:
         template = env.get_template(template_name)
     return template.render(user_input=user_input)
 
-def generate_humor(prompt, max_tokens=300, vision_url=None):
-    if client is None:
-        return "ERROR: OpenAI API Key not configured. Please set it in the sidebar."
+def gif_cache_path(url):
+    """Local path a GIF URL is cached under (whether or not it has been downloaded yet)."""
+    url_hash = hashlib.md5(url.encode()).hexdigest()
+    # Try to guess extension or default to .gif
+    ext = os.path.splitext(url)[1]
+    if not ext or len(ext) > 5:
+        ext = ".gif"
+    return os.path.join(CACHE_DIR, f"{url_hash}{ext}")
+
+@lru_cache(maxsize=ENCODED_CACHE_SIZE)
+def _encode_file(path, mtime_ns):
+    with open(path, "rb") as image_file:
+        return base64.b64encode(image_file.read()).decode('utf-8')
+
+def encode_image(path):
+    """Base64 of a local image, reused until the file changes."""
+    return _encode_file(path, os.stat(path).st_mtime_ns)
+
+def build_messages(prompt, vision_url=None):
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+    
+    if vision_url:
+        # Prefer a locally cached copy of a remote GIF
+        local_path = vision_url
+        if vision_url.startswith("http") and os.path.exists(gif_cache_path(vision_url)):
+            local_path = gif_cache_path(vision_url)
+        if os.path.exists(local_path):
+            # Handle local file
+            base64_image = encode_image(local_path)
+            
+            # Determine mime type (OpenAI supports image/jpeg, image/png, image/gif, image/webp)
+            ext = os.path.splitext(local_path)[1].lower()
+            mime_type = "image/gif" if ext == ".gif" else "image/jpeg" # Defaulting if unknown
+            
+            messages.append({
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": prompt},
+                    {"type": "image_url", "image_url": {"url": f"data:{mime_type};base64,{base64_image}"}}
+                ]
+            })
+        else:
+            # Handle URL
+            messages.append({
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": prompt},
+                    {"type": "image_url", "image_url": {"url": vision_url}}
+                ]
+            })
+    else:
+        messages.append({"role": "user", "content": prompt})
+    return messages
+
+def get_cache_key(prompt, max_tokens=300, vision_url=None, json_mode=False, model=None, stop=None, row_id=None):
+    media = None
+    if vision_url:
+        media = scene_index.media_key(vision_url) if vision_url.startswith("http") else vision_url
+    return response_cache.cache_key(model or MODEL, SYSTEM_PROMPT, prompt, media, max_tokens, json_mode, stop, row_id)
+
+def clean_output(text):
+    """Post-processing shared by every generation path."""
+    if text.startswith('"') and text.endswith('"'):
+        text = text[1:-1]
+    return text
+
+def generation_params(filename, model=None, scene_descriptions=False):
+    """Everything besides the input row and the template that a generated row depends on (see provenance.py)."""
+    return {'model': model or MODEL, 'system_prompt': SYSTEM_PROMPT, 'temperature': TEMPERATURE,
+            'stop': generation_limits.stop_sequences(filename),
+            'scene_descriptions': bool(scene_descriptions and "task-b" in filename),
+            'clean_output': provenance.source_hash(clean_output)}
+
+def generate_humor(prompt, max_tokens=300, vision_url=None, stats=None, json_mode=False, stream=False, use_cache=True,
+                   model=None, api_key=None, task=None, priority=scheduler.BULK, stop=None, row_id=None):
+    """Returns the model's reply. If a `stats` dict is passed it is filled with latency and token usage.
+
+    With `stream=True` a generator of text deltas is returned instead. Successful replies are stored in
+    the response cache, and identical requests are answered from it unless `use_cache` is False.
+    `model` and `api_key` default to the values from set_config; without any `api_key` requests are
+    spread over the keys in key_pool. Passing the `task` file enables the
+    deadline and hedging derived from that task's latency history (see resilience.py). `priority` is
+    the scheduler class of the request: interactive requests go before regeneration, then bulk runs.
+    `model="auto"` lets model_router pick the model; every request waits for its model's budget.
+    `stop` is a list of stop sequences (see generation_limits.py for the per-task ones).
+    `model="local"` (or "local:<model>") generates on this machine instead (see backends.py).
+    `row_id` puts the row in the cache key: batch runs pass it so identical requests for different
+    rows are sampled separately; Test Prompt and prefetch leave it out and share their entries.
+    """
+    model = model or MODEL
+    if model == model_router.AUTO:
+        model = model_router.route(task, vision_url is not None)
+    if stream:
+        return _stream_humor(prompt, max_tokens, vision_url, stats, json_mode, use_cache, model, api_key, task, priority, stop,
+                             row_id)
+    backend = backends.get(model)
+    error = _unsupported(backend, model, api_key, vision_url, json_mode)
+    if error:
+        return error
+    api_key = api_key or API_KEY
     try:
-        system_prompt = "You are a master of humor and wit. Follow the detailed instructions provided in the prompt."
-        messages = [{"role": "system", "content": system_prompt}]
-        
-        if vision_url:
-            if os.path.exists(vision_url):
-                # Handle local file
-                with open(vision_url, "rb") as image_file:
-                    base64_image = base64.b64encode(image_file.read()).decode('utf-8')
-                
-                # Determine mime type (OpenAI supports image/jpeg, image/png, image/gif, image/webp)
-                ext = os.path.splitext(vision_url)[1].lower()
-                mime_type = "image/gif" if ext == ".gif" else "image/jpeg" # Defaulting if unknown
-                
-                messages.append({
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": prompt},
-                        {"type": "image_url", "image_url": {"url": f"data:{mime_type};base64,{base64_image}"}}
-                    ]
-                })
+        with profiling.stage("cache"):
+            key = get_cache_key(prompt, max_tokens, vision_url, json_mode, model, stop, row_id)
+            cached = response_cache.get(key) if use_cache else None
+        if cached is not None:
+            if stats is not None:
+                stats['cached'] = True
+            return cached
+
+        with profiling.stage("media"):
+            messages = build_messages(prompt, vision_url)
+
+        def request(timeout):
+            return backend.complete(messages, model, max_tokens, TEMPERATURE, stop, json_mode, timeout, api_key, stats)
+
+        # Priority first: a bulk request must not hold one of the model's budget slots while it queues
+        with profiling.stage("network"), scheduler.slot(priority, task), backend.slot(model):
+            start = time.time()
+            if backend.resilient:
+                # Packed (JSON-mode) replies are far longer than the single-row history the deadlines come from
+                reply = resilience.call(request, None if json_mode else task, vision_url is not None, stats)
             else:
-                # Handle URL
-                messages.append({
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": prompt},
-                        {"type": "image_url", "image_url": {"url": vision_url}}
-                    ]
-                })
-        else:
-            messages.append({"role": "user", "content": prompt})
-
-        response = client.chat.completions.create(
-            model=MODEL,
-            messages=messages,
-            max_tokens=max_tokens,
-            temperature=0.8
-        )
-        return response.choices[0].message.content.strip()
+                reply = request(None)
+        if stats is not None:
+            stats['latency'] = time.time() - start
+            stats['model'] = model
+            reply.fill(stats)
+        text = reply.text.strip()
+        with profiling.stage("cache"):
+            response_cache.put(key, text, model=model)
+        return text
     except Exception as e:
         print(f"Error: {e}")
         return f"ERROR: {str(e)}"
 
+def _unsupported(backend, model, api_key, vision_url, json_mode):
+    """The ERROR reply for a request the model's backend can't serve, or None."""
+    if backend.needs_key and not (api_key or API_KEY) and not key_pool.configured():
+        return "ERROR: OpenAI API Key not configured. Please set it in the sidebar."
+    if vision_url and not backend.vision:
+        return f"ERROR: {model} does not accept images."
+    if json_mode and not backend.json_mode:
+        return f"ERROR: {model} does not support JSON mode."
+    return None
+
+def _stream_humor(prompt, max_tokens, vision_url, stats, json_mode, use_cache, model, api_key, task, priority, stop,
+                  row_id=None):
+    if stats is None:
+        stats = {}
+    backend = backends.get(model)
+    error = _unsupported(backend, model, api_key, vision_url, json_mode)
+    if error:
+        yield error
+        return
+    api_key = api_key or API_KEY
+    try:
+        key = get_cache_key(prompt, max_tokens, vision_url, json_mode, model, stop, row_id)
+        if use_cache:
+            cached = response_cache.get(key)
+            if cached is not None:
+                stats['cached'] = True
+                stats['ttft'] = stats['latency'] = 0.0
+                yield cached
+                return
+
+        messages = build_messages(prompt, vision_url)
+
+        with scheduler.slot(priority, task), backend.slot(model):
+            start = time.time()
+            parts = []
+            for delta in backend.stream(messages, model, max_tokens, TEMPERATURE, stop, json_mode, api_key, stats):
+                if 'ttft' not in stats:
+                    stats['ttft'] = time.time() - start
+                parts.append(delta)
+                yield delta
+            stats['latency'] = time.time() - start
+        stats['model'] = model
+        text = "".join(parts).strip()
+        if text:
+            response_cache.put(key, text, model=model)
+    except Exception as e:
+        print(f"Error: {e}")
+        yield f"ERROR: {str(e)}"
+
 def format_user_input(row, filename):
     if "task-a" in filename:
         word1, word2, headline = row.get('word1', '-'), row.get('word2', '-'), row.get('headline', '-')
@@ -102,38 +278,307 @@ def format_user_input(row, filename):
         user_input = str(row)
     return user_input
 
-def process_task(filename, template_name, limit=None):
-    print(f"Processing {filename}...")
-    df = pd.read_csv(os.path.join(DATA_DIR, filename), sep='\t')
-    if limit:
-        df = df.head(limit)
-        
-    results = []
-    for _, row in tqdm(df.iterrows(), total=len(df)):
-        id_val = row['id']
+def describe_media(url, model=None, api_key=None, priority=scheduler.BULK):
+    """Returns the stored scene description for a GIF, describing it with one vision call if needed. None on failure."""
+    description = scene_index.get_description(url)
+    if description is None:
+        if model == model_router.AUTO:
+            model = model_router.route(None, vision=True)
+        description = generate_humor(scene_index.DESCRIBE_PROMPT, max_tokens=200, vision_url=url, model=model, api_key=api_key,
+                                     priority=priority)
+        if description.startswith("ERROR"):
+            return None
+        scene_index.put_description(url, description, model or MODEL)
+    return description
+
+def generate_row(row, filename, template_name, description=None, use_cache=True, model=None, api_key=None,
+                 priority=scheduler.BULK):
+    """Generates, cleans and logs the output for a single input row.
+
+    For Task B, passing a scene `description` turns the row into a text-only request. With
+    `model="auto"` the row is routed by model_router and retried one model up the escalation
+    ladder whenever the output is an ERROR or breaks the task's rules. `max_tokens` and stop
+    sequences come from the task's generation profile (generation_limits.py).
+    """
+    with profiling.stage("format"):
         user_input = format_user_input(row, filename)
-        prompt = get_rendered_prompt(template_name, user_input)
-        
         vision_url = row.get('url') if "task-b" in filename else None
-        text = generate_humor(prompt, vision_url=vision_url)
-        
-        if text.startswith('"') and text.endswith('"'):
-            text = text[1:-1]
+        if description:
+            user_input = scene_index.with_description(user_input, description)
+            vision_url = None
+    with profiling.stage("render"):
+        prompt = get_rendered_prompt(template_name, user_input)
+    limits = generation_limits.profile(filename)
+    
+    routed = model == model_router.AUTO
+    if routed:
+        model = model_router.route(filename, vision_url is not None, len(user_input))
+    fallback = None
+    for step in range(max(1, len(model_router.ESCALATION))):
+        stats = {}
+        reply = generate_humor(prompt, vision_url=vision_url, stats=stats, use_cache=use_cache, model=model,
+                               api_key=api_key, task=filename, priority=priority, row_id=row['id'], **limits)
             
-        results.append({'id': id_val, 'text': text})
-        time.sleep(0.05)
-        
-    out_df = pd.DataFrame(results)
-    out_df.to_csv(os.path.join(OUTPUT_DIR, filename), sep='\t', index=False)
+        with profiling.stage("postprocess"):
+            text = clean_output(reply)
+            problems = compliance.violations(text, filename, row) if routed else []
+            stronger = model_router.escalate(model, vision_url is not None) if problems else None
+            if stats:
+                extra = {'escalation': step} if routed else {}
+                run_log.append(filename, {'id': row['id'], 'ts': time.time(), 'vision': vision_url is not None,
+                                          'described': bool(description), 'text': text, **extra, **stats})
+        if problems and problems[0] not in ('empty', 'error'):
+            # Rule-breaking text still beats a failed escalation
+            fallback = text
+        if stronger is None:
+            break
+        model = stronger
+    if problems and problems[0] in ('empty', 'error') and fallback is not None:
+        return fallback
+    return text
+
+def generate_packed(rows, filename, template_name, max_tokens=packing.ROW_TOKENS, model=None, api_key=None):
+    """Generates several text-only rows in one JSON-mode request. Returns {id: text} for the rows that came back valid."""
+    with profiling.stage("format"):
+        items = [(row['id'], format_user_input(row, filename)) for row in rows]
+    with profiling.stage("render"):
+        prompt = get_rendered_prompt(template_name, packing.build_packed_input(items))
+    if model == model_router.AUTO:
+        model = model_router.route(filename, False, max(len(user_input) for _, user_input in items))
+    stats = {}
+    reply = generate_humor(prompt, max_tokens=packing.packed_max_tokens(max_tokens, len(rows)), stats=stats, json_mode=True,
+                           model=model, api_key=api_key, task=filename)
+    
+    with profiling.stage("postprocess"):
+        texts = packing.parse_packed_response(reply, [id_val for id_val, _ in items])
+        for id_val, text in list(texts.items()):
+            text = clean_output(text)
+            texts[id_val] = text
+            if stats:
+                # Attribute an equal share of the request to each row so per-row history stays comparable
+                share = {k: v / len(rows) if k in PACKED_SHARED_STATS and v is not None else v for k, v in stats.items()}
+                run_log.append(filename, {'id': id_val, 'ts': time.time(), 'vision': False, 'text': text, 'packed': len(rows), **share})
+    return texts
+
+def generate_batch(rows, filename, template_name, model=None, use_cache=True):
+    """Generates several text-only rows in one call of a backend that batches prompts (see backends.py).
+
+    Returns the cleaned texts in row order. Rows already in the response cache are not sent again.
+    """
+    model = model or MODEL
+    backend = backends.get(model)
+    limits = generation_limits.profile(filename)
+    with profiling.stage("render"):
+        prompts = [get_rendered_prompt(template_name, format_user_input(row, filename)) for row in rows]
+    keys = [get_cache_key(prompt, limits['max_tokens'], None, False, model, limits['stop'], row['id'])
+            for prompt, row in zip(prompts, rows)]
+    texts = [response_cache.get(key) if use_cache else None for key in keys]
+    missing = [i for i, text in enumerate(texts) if text is None]
+    if missing:
+        with profiling.stage("network"), scheduler.slot(scheduler.BULK, filename), backend.slot(model):
+            start = time.time()
+            try:
+                replies = backend.complete_batch([build_messages(prompts[i]) for i in missing], model, limits['max_tokens'],
+                                                 TEMPERATURE, limits['stop'])
+            except Exception as e:
+                print(f"Error: {e}")
+                replies = [backends.Reply(f"ERROR: {str(e)}")] * len(missing)
+            latency = (time.time() - start) / len(missing)
+        with profiling.stage("postprocess"):
+            for i, reply in zip(missing, replies):
+                texts[i] = reply.text.strip()
+                if texts[i].startswith("ERROR"):
+                    continue
+                response_cache.put(keys[i], texts[i], model=model)
+                stats = {'latency': latency, 'model': model, 'batched': len(missing)}
+                reply.fill(stats)
+                run_log.append(filename, {'id': rows[i]['id'], 'ts': time.time(), 'vision': False, 'described': False,
+                                          'text': clean_output(texts[i]), **stats})
+    return [clean_output(text) for text in texts]
+
+def generate_rows(df, filename, template_name, pack_size=None, scene_descriptions=False, direct_vision_ids=None,
+                  model=None, api_key=None, on_progress=None, show_progress=True):
+    """Generates outputs for the rows of `df` and returns them as [{'id', 'text'}] in row order.
+
+    `pack_size` > 1 sends that many Task A rows per request. `scene_descriptions` runs Task B as
+    describe-once-per-GIF plus text-only captioning; ids in `direct_vision_ids` still send the GIF.
+    `on_progress`, if given, is called with the number of finished rows after each request.
+    Packing and batching are limited to what the model's backend declares (see backends.py), and
+    packs to packing.max_pack_size() rows.
+    """
+    model = model or MODEL
+    quiet = not show_progress
+    results = []
+    backend = backends.get(model)
+    if pack_size:
+        pack_size = min(pack_size, packing.max_pack_size())
+    if pack_size and backend.max_pack is not None:
+        pack_size = min(pack_size, backend.max_pack)
+    if pack_size and pack_size > 1 and "task-a" in filename:
+        rows = [row for _, row in df.iterrows()]
+        with tqdm(total=len(rows), disable=quiet) as pbar:
+            for start in range(0, len(rows), pack_size):
+                chunk = rows[start:start + pack_size]
+                texts = generate_packed(chunk, filename, template_name, model=model, api_key=api_key)
+                for row in chunk:
+                    # Fall back to a single-row request for anything missing or malformed, and when
+                    # routing, for rule-breaking rows so they can escalate
+                    if row['id'] in texts and (model != model_router.AUTO
+                                               or compliance.is_compliant(texts[row['id']], filename, row)):
+                        text = texts[row['id']]
+                    else:
+                        text = generate_row(row, filename, template_name, model=model, api_key=api_key)
+                    results.append({'id': row['id'], 'text': text})
+                pbar.update(len(chunk))
+                if on_progress:
+                    on_progress(len(results))
+                time.sleep(REQUEST_PAUSE)
+    elif backend.batch_size > 1 and "task-a" in filename:
+        rows = [row for _, row in df.iterrows()]
+        with tqdm(total=len(rows), disable=quiet) as pbar:
+            for start in range(0, len(rows), backend.batch_size):
+                chunk = rows[start:start + backend.batch_size]
+                texts = generate_batch(chunk, filename, template_name, model=model)
+                results.extend({'id': row['id'], 'text': text} for row, text in zip(chunk, texts))
+                pbar.update(len(chunk))
+                if on_progress:
+                    on_progress(len(results))
+    elif scene_descriptions and "task-b" in filename:
+        direct_vision_ids = set(direct_vision_ids or [])
+        for _, row in tqdm(df.iterrows(), total=len(df), disable=quiet):
+            # Rows whose description could not be produced fall back to direct vision
+            description = None if row['id'] in direct_vision_ids else describe_media(row['url'], model, api_key)
+            text = generate_row(row, filename, template_name, description=description, model=model, api_key=api_key)
+            results.append({'id': row['id'], 'text': text})
+            if on_progress:
+                on_progress(len(results))
+            time.sleep(REQUEST_PAUSE)
+    else:
+        for _, row in tqdm(df.iterrows(), total=len(df), disable=quiet):
+            text = generate_row(row, filename, template_name, model=model, api_key=api_key)
+            results.append({'id': row['id'], 'text': text})
+            if on_progress:
+                on_progress(len(results))
+            time.sleep(REQUEST_PAUSE)
+    return results
+
+def process_task(filename, template_name, limit=None, pack_size=None, scene_descriptions=False, direct_vision_ids=None,
+                 model=None, api_key=None, on_progress=None):
+    """Generates outputs for a task file in this process. See `generate_rows` for the options.
+
+    With profiling on (MWAHAHA_PROFILE or --profile) a stage report is written to runs/profiles/.
+    """
+    print(f"Processing {filename}...")
+    with profiling.run("process_task", os.path.splitext(filename)[0]):
+        with profiling.stage("load"):
+            df = dataset.load_input(filename)
+            if limit:
+                df = df.head(limit)
+            
+        results = generate_rows(df, filename, template_name, pack_size, scene_descriptions, direct_vision_ids, model, api_key,
+                                on_progress)
+            
+        with profiling.stage("write"):
+            out_df = pd.DataFrame(results)
+            os.makedirs(OUTPUT_DIR, exist_ok=True)
+            out_df.to_csv(os.path.join(OUTPUT_DIR, filename), sep='\t', index=False)
+            provenance.record(filename, df, dict(zip(out_df['id'], out_df['text'])), template_name,
+                              generation_params(filename, model, scene_descriptions), replace=True)
     return out_df
 
+def iter_results(chunks, filename, template_name, pack_size=None, scene_descriptions=False, direct_vision_ids=None,
+                 model=None, api_key=None):
+    """Generator stage of the streaming pipeline: (chunk, list of {'id', 'text'}) per input chunk.
+
+    Nothing is read ahead, so the reader only advances as fast as results are consumed.
+    """
+    for chunk in chunks:
+        yield chunk, generate_rows(chunk, filename, template_name, pack_size, scene_descriptions, direct_vision_ids,
+                                   model, api_key, show_progress=False)
+
+def stream_task(filename, template_name, limit=None, chunk_size=dataset.CHUNK_ROWS, pack_size=None, scene_descriptions=False,
+                direct_vision_ids=None, model=None, api_key=None):
+    """Bounded-memory variant of process_task for very large task files.
+
+    Input is read `chunk_size` rows at a time, and each chunk's results are appended and flushed to
+    <output>.partial before the next chunk is read, so at most one chunk is held in memory. The
+    finished file replaces the output atomically, and its provenance replaces the task's earlier
+    records, as with process_task. Returns the number of rows written.
+    """
+    print(f"Streaming {filename} in chunks of {chunk_size} rows...")
+    output_path = os.path.join(OUTPUT_DIR, filename)
+    partial_path = output_path + ".partial"
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    written = 0
+    records = {}
+    template_digest = provenance.template_hash(template_name)
+    params = generation_params(filename, model, scene_descriptions)
+    with profiling.run("stream_task", os.path.splitext(filename)[0]):
+        chunks = dataset.iter_input(filename, chunksize=chunk_size)
+        if limit:
+            chunks = (chunk.head(limit - start) for start, chunk in zip(range(0, limit, chunk_size), chunks))
+        with open(partial_path, "w", encoding="utf-8", newline="") as f, tqdm(total=limit, unit="row") as pbar:
+            pd.DataFrame(columns=['id', 'text']).to_csv(f, sep='\t', index=False)
+            for chunk, results in iter_results(chunks, filename, template_name, pack_size, scene_descriptions,
+                                               direct_vision_ids, model, api_key):
+                with profiling.stage("write"):
+                    pd.DataFrame(results, columns=['id', 'text']).to_csv(f, sep='\t', index=False, header=False)
+                    f.flush()
+                    provenance.update(records, chunk, {r['id']: r['text'] for r in results}, template_digest, params)
+                written += len(results)
+                pbar.update(len(results))
+    os.replace(partial_path, output_path)
+    provenance.save(filename, records)
+    print(f"[SUCCESS] {written} rows written to {output_path}")
+    return written
+
+def regenerate(filename, template_name, ids=None, model=None, api_key=None):
+    """Regenerates selected rows of an existing output, bypassing the response cache.
+
+    Without `ids`, every row that is missing from the output, empty, or an ERROR is regenerated.
+    The output is written back in input order.
+    """
+    input_df = dataset.load_input(filename)
+    output_path = os.path.join(OUTPUT_DIR, filename)
+    out_df = dataset.load_output(filename, ['id', 'text'])
+    if out_df is None:
+        out_df = pd.DataFrame(columns=['id', 'text'])
+    out_df = out_df.drop_duplicates(subset=['id'], keep='first')
+    texts = dict(zip(out_df['id'], out_df['text']))
+    
+    if ids is None:
+        valid = {id_val for id_val, text in texts.items() if isinstance(text, str) and text and not text.startswith('ERROR')}
+        to_process = input_df[~input_df['id'].isin(valid)]
+    else:
+        to_process = input_df[input_df['id'].isin(set(ids))]
+    if len(to_process) == 0:
+        print(f"No rows to regenerate for {filename}.")
+        return 0
+    
+    print(f"Regenerating {len(to_process)} rows for {filename}...")
+    regenerated = {}
+    for _, row in tqdm(to_process.iterrows(), total=len(to_process)):
+        text = generate_row(row, filename, template_name, use_cache=False, model=model, api_key=api_key,
+                            priority=scheduler.REGENERATE)
+        if text.startswith("ERROR") and isinstance(texts.get(row['id']), str) and not texts[row['id']].startswith("ERROR"):
+            # Keep the previous output rather than overwriting it with a failure
+            print(f"Failed to regenerate {row['id']}: {text}")
+            continue
+        texts[row['id']] = regenerated[row['id']] = text
+        time.sleep(REQUEST_PAUSE)
+    
+    final_df = input_df[['id']].copy()
+    final_df['text'] = final_df['id'].map(texts)
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    final_df.to_csv(output_path, sep='\t', index=False)
+    provenance.record(filename, to_process[to_process['id'].isin(regenerated)], regenerated, template_name,
+                      generation_params(filename, model))
+    return len(to_process)
+
 def create_zip():
     print("Creating ZIP...")
-    with zipfile.ZipFile("submission.zip", "w") as zf:
-        for f in os.listdir(OUTPUT_DIR):
-            if f.endswith(".tsv"):
-                zf.write(os.path.join(OUTPUT_DIR, f), f)
-    print("ZIP created: submission.zip")
+    # Partial runs (e.g. main() with limit=2) are packaged anyway; problems are reported
+    packager.package(strict=False)
 
 def main():
     process_task("task-a-en.tsv", "task_a_en.j2", limit=2)
@@ -0,0 +1,208 @@
+"""Micro-benchmarks of the local per-row hot paths, on synthetic data from 10^3 up to 10^6 rows.
+
+Each case times one function over every row of a synthetic dataset, the way the pipeline calls it.
+Results are appended to runs/benchmarks/micro.jsonl with the current commit, so a change can be
+followed over time, and can be compared with a saved baseline like benchmarks/ui_bench.py.
+
+    python -m benchmarks.micro_bench                               # every case at 10^3, 10^4, 10^5 rows
+    python -m benchmarks.micro_bench --cases clean_text --sizes 1000000
+    python -m benchmarks.micro_bench --save-baseline               # then later runs exit 1 on a regression
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+from benchmarks import report
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmarks", "micro_baseline.json")
+
+SIZES = [1000, 10000, 100000]
+REPEAT = 5
+# A case regresses if it is slower than baseline x (1 + tolerance) plus this much
+TOLERANCE = 0.25
+SLACK_MS = 1
+# encode_gif works on one distinct GIF per this many rows, each GIF_BYTES large
+ROWS_PER_GIF = 100
+GIF_BYTES = 256 * 1024
+
+# --- Cases: each setup(n) builds the data (untimed) and returns the function to time ---
+
+def _task_a(n):
+    from benchmarks import synthetic
+    return synthetic.task_a(n)
+
+def _task_b2(n):
+    from benchmarks import synthetic
+    return synthetic.task_b2(n, "synthetic.gif")
+
+def _b2_outputs(n):
+    from benchmarks import synthetic
+    return synthetic.messy_b2_outputs(_task_b2(n)['prompt'])
+
+def format_user_input_a(n):
+    import baseline_generator as gen
+    df = _task_a(n)
+    return lambda: [gen.format_user_input(row, "task-a-en.tsv") for _, row in df.iterrows()]
+
+def format_user_input_b2(n):
+    import baseline_generator as gen
+    df = _task_b2(n)
+    return lambda: [gen.format_user_input(row, "task-b2.tsv") for _, row in df.iterrows()]
+
+def _user_inputs(n):
+    import baseline_generator as gen
+    return [gen.format_user_input(row, "task-a-en.tsv") for row in _task_a(n).to_dict('records')]
+
+def render_prompt_file(n):
+    import baseline_generator as gen
+    user_inputs = _user_inputs(n)
+    template_name = gen.TASK_TEMPLATES["task-a-en.tsv"]
+    return lambda: [gen.get_rendered_prompt(template_name, user_input) for user_input in user_inputs]
+
+def render_prompt_content(n):
+    """The editor's path: the template is passed as text."""
+    import baseline_generator as gen
+    user_inputs = _user_inputs(n)
+    with open(os.path.join(gen.TEMPLATE_DIR, gen.TASK_TEMPLATES["task-a-en.tsv"]), "r", encoding="utf-8") as f:
+        content = f.read()
+    return lambda: [gen.get_rendered_prompt(None, user_input, template_content=content) for user_input in user_inputs]
+
+def _gifs(n):
+    import config
+    from benchmarks import synthetic
+    return synthetic.gif_files(os.path.join(config.CACHE_DIR, "bench"), max(1, n // ROWS_PER_GIF), GIF_BYTES)
+
+def encode_gif(n):
+    """Reading and base64-encoding each GIF from disk, as every vision request did before the in-memory cache."""
+    import baseline_generator as gen
+    paths = _gifs(n)
+    encode = gen._encode_file.__wrapped__
+    return lambda: [encode(path, 0) for path in paths]
+
+def encode_gif_cached(n):
+    import baseline_generator as gen
+    paths = _gifs(n)
+    for path in paths:
+        gen.encode_image(path)
+    return lambda: [gen.encode_image(path) for path in paths]
+
+def clean_text(n):
+    from maintenance_scripts.clean_task_b2 import clean_text
+    texts = _b2_outputs(n)
+    return lambda: [clean_text(text) for text in texts]
+
+def remove_quotes(n):
+    from maintenance_scripts.remove_quotes_b2 import remove_unnecessary_quotes
+    texts = _b2_outputs(n)
+    return lambda: [remove_unnecessary_quotes(text) for text in texts]
+
+def final_quote_cleanup(n):
+    from maintenance_scripts.final_cleanup_b2 import final_quote_cleanup
+    texts = _b2_outputs(n)
+    return lambda: [final_quote_cleanup(text) for text in texts]
+
+def normalize_text(n):
+    from compliance import normalize_text
+    texts = _b2_outputs(n)
+    return lambda: [normalize_text(text) for text in texts]
+
+def count_words(n):
+    from maintenance_scripts.analyze_all_tasks import count_words
+    texts = _b2_outputs(n)
+    return lambda: [count_words(text) for text in texts]
+
+def count_sentences(n):
+    from maintenance_scripts.analyze_all_tasks import count_sentences
+    texts = _b2_outputs(n)
+    return lambda: [count_sentences(text) for text in texts]
+
+def finalize_clean_file(n):
+    """The id merge of `clean`: drop ERROR rows and duplicates, align to the input order. Rewrites the output file."""
+    import config
+    from benchmarks import synthetic
+    from maintenance_scripts import finalize_outputs
+    input_df = synthetic.write_task("task-a-en.tsv", n, config.DATA_DIR, config.OUTPUT_DIR)
+    synthetic.raw_outputs(input_df['id']).to_csv(os.path.join(config.OUTPUT_DIR, "task-a-en.tsv"), sep='\t', index=False)
+    return lambda: finalize_outputs.clean_file("task-a-en.tsv")
+
+CASES = {
+    'format_user_input_a': format_user_input_a,
+    'format_user_input_b2': format_user_input_b2,
+    'render_prompt_file': render_prompt_file,
+    'render_prompt_content': render_prompt_content,
+    'encode_gif': encode_gif,
+    'encode_gif_cached': encode_gif_cached,
+    'clean_text': clean_text,
+    'remove_quotes': remove_quotes,
+    'final_quote_cleanup': final_quote_cleanup,
+    'normalize_text': normalize_text,
+    'count_words': count_words,
+    'count_sentences': count_sentences,
+    'finalize_clean_file': finalize_clean_file,
+}
+
+# --- Runner ---
+
+def measure(case, n, repeat=REPEAT):
+    """Median milliseconds of `repeat` runs; every run gets fresh data, since some cases rewrite their input."""
+    times = []
+    for _ in range(repeat):
+        function = CASES[case](n)
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    ms = 1000 * statistics.median(times)
+    return {'ms': round(ms, 3), 'us_per_row': round(1000 * ms / n, 3)}
+
+def commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# Table layout for report.print_results
+COLUMNS = [("case", 22, str, "<"), ("rows", 9, report.rows, ">")]
+METRICS = [("ms", "ms", 10, 2), ("us_per_row", "us/row", 8, 2)]
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of the local per-row hot paths.")
+    parser.add_argument("--cases", nargs="+", default=list(CASES), choices=list(CASES))
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="Rows of synthetic data (up to 10^6)")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="Runs per case and size (the median is reported)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON to compare with (if it exists)")
+    parser.add_argument("--save-baseline", action="store_true", help="Write the results to --baseline instead of comparing")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="Allowed slowdown over the baseline")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="mwahaha-micro-bench-")
+    sys.path.insert(0, ROOT)
+    import config
+    from benchmarks import synthetic
+    # The history goes to the configured runs directory, read before it is pointed at the scratch one
+    history_dir = os.path.join(config.RUNS_DIR, "benchmarks")
+    synthetic.isolated_environment(workdir, ROOT)
+
+    results = {}
+    try:
+        for case in args.cases:
+            for size in sorted(args.sizes):
+                print(f"{case} at {size:,} rows...")
+                results.setdefault(case, {})[str(size)] = measure(case, size, args.repeat)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    os.makedirs(history_dir, exist_ok=True)
+    with open(os.path.join(history_dir, "micro.jsonl"), "a", encoding="utf-8") as f:
+        f.write(json.dumps({'ts': time.time(), 'commit': commit(), 'results': results}) + "\n")
+    report.finish(results, args.baseline, args.save_baseline, args.tolerance, {'ms': SLACK_MS}, COLUMNS, METRICS,
+                  lambda keys: f"{keys[0]} at {report.rows(keys[1])} rows")
+
+if __name__ == "__main__":
+    main()
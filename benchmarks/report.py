@@ -0,0 +1,80 @@
+"""Baseline files, regression checks and result tables shared by the benchmarks.
+
+Results are nested dicts (e.g. task -> rows -> interaction) whose leaves map metric names to
+numbers; `depth` is the number of key levels above the leaves.
+"""
+import os
+import sys
+import json
+
+def leaves(results, depth):
+    """(keys, metrics) for every measurement in `results`."""
+    if depth == 0:
+        yield (), results
+        return
+    for key, value in results.items():
+        for keys, leaf in leaves(value, depth - 1):
+            yield (key,) + keys, leaf
+
+def lookup(baseline, keys):
+    for key in keys:
+        baseline = (baseline or {}).get(key)
+    return baseline
+
+def compare(results, baseline, depth, slack, tolerance):
+    """Returns the regressions: (keys, metric, baseline value, current value).
+
+    A metric in `slack` regresses if it exceeds baseline x (1 + tolerance) plus its slack (timer
+    noise on small numbers).
+    """
+    regressions = []
+    for keys, current in leaves(results, depth):
+        base = lookup(baseline, keys)
+        if base is None:
+            continue
+        for metric, extra in slack.items():
+            if metric in base and current[metric] > base[metric] * (1 + tolerance) + extra:
+                regressions.append((keys, metric, base[metric], current[metric]))
+    return regressions
+
+def rows(size):
+    return f"{int(size):,}"
+
+def print_results(results, baseline, columns, metrics):
+    """One line per measurement. `columns` are (header, width, format, align) per key level,
+    `metrics` are (name, header, width, decimals), the first of them 'ms'; the baseline's ms are shown last."""
+    print(" ".join(f"{header:{align}{width}}" for header, width, _, align in columns) + " "
+          + " ".join(f"{header:>{width}}" for _, header, width, _ in metrics) + f" {'baseline ms':>12}")
+    for keys, current in leaves(results, len(columns)):
+        base = lookup(baseline, keys)
+        base_ms = f"{base['ms']:.{metrics[0][3]}f}" if base else "-"
+        print(" ".join(f"{fmt(key):{align}{width}}" for key, (_, width, fmt, align) in zip(keys, columns)) + " "
+              + " ".join(f"{current[name]:>{width}.{decimals}f}" for name, _, width, decimals in metrics)
+              + f" {base_ms:>12}")
+
+def finish(results, baseline_path, save, tolerance, slack, columns, metrics, describe):
+    """Writes `results` as the baseline with `save`; otherwise prints them next to the baseline and exits 1 on a regression.
+
+    `describe(keys)` names a measurement in error messages.
+    """
+    if save:
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print_results(results, None, columns, metrics)
+        print(f"[SUCCESS] Baseline written to {baseline_path}")
+        return
+
+    baseline = None
+    if os.path.exists(baseline_path):
+        with open(baseline_path, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_results(results, baseline, columns, metrics)
+    if baseline is None:
+        print(f"[WARN] No baseline at {baseline_path}; run with --save-baseline to record one.")
+        return
+    regressions = compare(results, baseline, len(columns), slack, tolerance)
+    for keys, metric, base, current in regressions:
+        print(f"[ERROR] {describe(keys)}: {metric} {base} -> {current}")
+    if regressions:
+        sys.exit(1)
+    print(f"[SUCCESS] No regressions beyond {tolerance:.0%} of the baseline.")
@@ -0,0 +1,111 @@
+"""Synthetic data for the benchmarks, shaped like the real files (same columns, similar text lengths)."""
+import os
+import sys
+import random
+import shutil
+import importlib
+import pandas as pd
+
+WORDS = ("cat banana office printer meeting coffee robot pigeon umbrella tax dentist goat violin elevator "
+         "salad wizard laptop penguin parade volcano sock mayor pizza rocket karaoke").split()
+# A 1x1 GIF, so Task B rows have a real local image without any network access
+TINY_GIF = (b"GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\xff\xff\xff!\xf9\x04\x01\x00\x00\x00\x00,"
+            b"\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02D\x01\x00;")
+
+def sentence(rng, words=12):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+def task_a(n, seed=0):
+    """Task A input: half word pairs, half headlines, like task-a-en.tsv."""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n):
+        if i % 2:
+            rows.append({'id': f"en_{i}", 'word1': rng.choice(WORDS), 'word2': rng.choice(WORDS), 'headline': "-"})
+        else:
+            rows.append({'id': f"en_{i}", 'word1': "-", 'word2': "-", 'headline': sentence(rng, rng.randint(6, 14))})
+    return pd.DataFrame(rows, columns=['id', 'word1', 'word2', 'headline'])
+
+def task_b2(n, gif_path, seed=0):
+    """Task B2 input: every row points at `gif_path`; a quarter of the prompts have a blank to fill."""
+    rng = random.Random(seed)
+    prompts = [sentence(rng, rng.randint(5, 10)).rstrip(".") + (" ___" if i % 4 == 0 else "") for i in range(n)]
+    return pd.DataFrame({'id': [f"img_{i}" for i in range(n)], 'url': gif_path, 'prompt': prompts})
+
+def outputs(ids, seed=0):
+    """A saved output for every id: one to three sentences."""
+    rng = random.Random(seed)
+    return pd.DataFrame({'id': list(ids),
+                         'text': [" ".join(sentence(rng) for _ in range(rng.randint(1, 3))) for _ in ids]})
+
+def messy_b2_outputs(prompts, seed=0):
+    """Task B2 outputs with the artifacts the cleanup scripts remove: prefixes, blanks, quotes, notes in parentheses."""
+    rng = random.Random(seed)
+    texts = []
+    for i, prompt in enumerate(prompts):
+        text = f"{prompt.replace('___', '______')} {sentence(rng, rng.randint(3, 8))}"
+        if i % 3 == 0:
+            text = "Prompt: " + text
+        if i % 4 == 0:
+            text = f'"{text}"'
+        if i % 5 == 0:
+            text = text.replace(" ", ' ""' + rng.choice(WORDS) + '"" ', 1)
+        if i % 7 == 0:
+            text += f" (Word count: {rng.randint(8, 20)})"
+        if i % 11 == 0:
+            text = "**" + text + "**"
+        texts.append(text)
+    return texts
+
+def raw_outputs(ids, seed=0):
+    """An output file as generation leaves it: some ERROR rows, some ids repeated, some missing."""
+    df = outputs(ids, seed)
+    df.loc[df.index % 50 == 0, 'text'] = "ERROR: Request timed out."
+    repeats = df[df.index % 20 == 1].assign(text="A later duplicate.")
+    return pd.concat([df[df.index % 100 != 99], repeats], ignore_index=True)
+
+def gif_files(directory, count, size=256 * 1024, seed=0):
+    """Writes `count` distinct GIF-sized files (random bytes after a GIF header) and returns their paths."""
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"synthetic-{i}.gif")
+        with open(path, "wb") as f:
+            f.write(b"GIF89a" + rng.randbytes(size - 6))
+        paths.append(path)
+    return paths
+
+def isolated_environment(workdir, root):
+    """Points every directory the code reads or writes at `workdir` and keeps requests off the network.
+
+    Call before importing anything that reads config; config itself is reloaded if already imported.
+    """
+    for name, sub in [("DATA", "data"), ("OUTPUT", "output"), ("CACHE", "gif_cache"), ("RUNS", "runs"),
+                      ("RESPONSE_CACHE", "response_cache"), ("QUEUE", "queue"), ("TEMPLATE", "templates")]:
+        os.environ[f"MWAHAHA_{name}_DIR"] = os.path.join(workdir, sub)
+    # Save Template writes into the template directory, so work on a copy
+    shutil.copytree(os.path.join(root, "templates"), os.environ["MWAHAHA_TEMPLATE_DIR"], dirs_exist_ok=True)
+    os.environ["MWAHAHA_KEYS_FILE"] = os.path.join(workdir, "api_keys.txt")
+    os.environ["MWAHAHA_SERVICE_URL"] = "http://127.0.0.1:9"  # nothing listens there: always in-process
+    os.environ["MWAHAHA_PROFILE"] = ""
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    if "config" in sys.modules:
+        importlib.reload(sys.modules["config"])
+
+def write_task(filename, n, data_dir, output_dir, seed=0):
+    """Writes input and output TSVs of `n` rows for a task file name (task-a-*.tsv or task-b*.tsv)."""
+    os.makedirs(data_dir, exist_ok=True)
+    os.makedirs(output_dir, exist_ok=True)
+    if "task-b" in filename:
+        gif_path = os.path.join(data_dir, "synthetic.gif")
+        with open(gif_path, "wb") as f:
+            f.write(TINY_GIF)
+        input_df = task_b2(n, gif_path, seed)
+        if "b2" not in filename:
+            input_df = input_df[['id', 'url']]
+    else:
+        input_df = task_a(n, seed)
+    input_df.to_csv(os.path.join(data_dir, filename), sep='\t', index=False)
+    outputs(input_df['id'], seed).to_csv(os.path.join(output_dir, filename), sep='\t', index=False)
+    return input_df
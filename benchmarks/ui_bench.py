@@ -0,0 +1,157 @@
+"""Headless benchmark of the Streamlit app: per-rerun latency and peak memory of typical interactions.
+
+Runs streamlit_app.py under Streamlit's AppTest (no browser) against synthetic task files of growing
+size, with generation mocked out, so only the app's own work is measured: reading and merging the
+TSVs, building the table, rendering the row details, the template editor and the actions.
+
+    python -m benchmarks.ui_bench                                  # 300, 3,000 and 30,000 rows
+    python -m benchmarks.ui_bench --save-baseline                  # record this machine's numbers
+    python -m benchmarks.ui_bench --baseline benchmarks/ui_baseline.json   # exit 1 on a regression
+
+Baselines are machine specific: record one before a change and compare against it after.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import tracemalloc
+from benchmarks import report
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP = os.path.join(ROOT, "streamlit_app.py")
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmarks", "ui_baseline.json")
+
+SIZES = [300, 3000, 30000]
+TASKS = ["task-a-en.tsv", "task-b2.tsv"]
+# Sidebar labels of the task selectbox in streamlit_app.main
+TASK_LABELS = {"task-a-en.tsv": "Task A (EN)", "task-a-es.tsv": "Task A (ES)", "task-a-zh.tsv": "Task A (ZH)",
+               "task-b1.tsv": "Task B1 (GIF)", "task-b2.tsv": "Task B2 (GIF+Prompt)"}
+INTERACTIONS = ["open_task", "select_row", "next_row", "edit_template", "test_prompt", "run_all"]
+REPEAT = 3
+# A rerun regresses if it is slower than baseline x (1 + tolerance) plus this much (timer noise on small numbers)
+TOLERANCE = 0.25
+SLACK_MS = 25
+SLACK_MB = 2
+TIMEOUT = 600
+
+def fake_generate_humor(prompt, max_tokens=300, vision_url=None, stats=None, json_mode=False, stream=False, **kwargs):
+    """Stands in for baseline_generator.generate_humor: an instant, compliant-looking reply."""
+    text = "Benchmarks are like jokes: nobody laughs at the slow ones."
+    if stats is not None:
+        stats.update({'latency': 0.0, 'ttft': 0.0, 'finish_reason': 'stop'})
+    return iter([text]) if stream else text
+
+def button(at, label):
+    return next(b for b in at.button if b.label == label)
+
+def interact(at, name, filename):
+    """Sets up one interaction on an AppTest whose previous interactions already ran; at.run() performs it."""
+    if name == "open_task":
+        at.sidebar.selectbox[1].select(TASK_LABELS[filename])
+    elif name == "select_row":
+        at.session_state[f"table-{filename}"] = {"selection": {"rows": [0], "columns": []}}
+    elif name == "next_row":
+        at.session_state[f"table-{filename}"] = {"selection": {"rows": [1], "columns": []}}
+    elif name == "edit_template":
+        at.text_area[0].input(at.text_area[0].value + "\n{# edited #}")
+    elif name == "test_prompt":
+        button(at, "🚀 Test Prompt").click()
+    elif name == "run_all":
+        button(at, "🔥 Run All & Save Output").click()
+
+def session(filename, interactions, trace=False):
+    """Runs a fresh session up to the last of `interactions` (each builds on the ones before it).
+
+    Returns {interaction: (seconds, peak MB or None)} for the requested ones.
+    """
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(APP, default_timeout=TIMEOUT)
+    at.run()
+    results = {}
+    last = max(INTERACTIONS.index(name) for name in interactions)
+    for name in INTERACTIONS[:last + 1]:
+        interact(at, name, filename)
+        if trace:
+            tracemalloc.start()
+        start = time.perf_counter()
+        at.run()
+        elapsed = time.perf_counter() - start
+        peak = None
+        if trace:
+            peak = tracemalloc.get_traced_memory()[1] / 2**20
+            tracemalloc.stop()
+        if at.exception:
+            raise RuntimeError(f"{filename} {name}: {at.exception[0].value}")
+        if name in interactions:
+            results[name] = (elapsed, peak)
+    return results
+
+def measure(filename, size, interactions, repeat=REPEAT):
+    """Median latency over `repeat` sessions and peak traced memory from one more.
+
+    Every session starts from the same synthetic outputs (Run All rewrites them). A first, uncounted
+    session warms imports and caches.
+    """
+    import config
+    import dataset
+    from benchmarks import synthetic
+    input_df = synthetic.write_task(filename, size, config.DATA_DIR, config.OUTPUT_DIR)
+    runs = []
+    for i in range(repeat + 2):
+        shutil.rmtree(config.OUTPUT_DIR, ignore_errors=True)
+        shutil.rmtree(config.RUNS_DIR, ignore_errors=True)
+        os.makedirs(config.OUTPUT_DIR)
+        synthetic.outputs(input_df['id']).to_csv(os.path.join(config.OUTPUT_DIR, filename), sep='\t', index=False)
+        # Build the columnar copies now, as the last Run All would have, so the sessions don't time it
+        dataset.load_input(filename)
+        dataset.load_output(filename)
+        runs.append(session(filename, interactions, trace=i == repeat + 1))
+    timed, traced = runs[1:repeat + 1], runs[-1]
+    return {name: {'ms': round(1000 * statistics.median(run[name][0] for run in timed), 1),
+                   'peak_mb': round(traced[name][1], 1)} for name in interactions}
+
+# Table layout for report.print_results
+COLUMNS = [("task", 16, str, "<"), ("rows", 7, report.rows, ">"), ("interaction", 14, str, "<")]
+METRICS = [("ms", "ms", 9, 1), ("peak_mb", "peak MB", 8, 1)]
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless per-rerun benchmark of streamlit_app.py.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="Rows per synthetic task file")
+    parser.add_argument("--tasks", nargs="+", default=TASKS, choices=list(TASK_LABELS))
+    parser.add_argument("--interactions", nargs="+", default=INTERACTIONS, choices=INTERACTIONS)
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="Timed sessions per size (the median is reported)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON to compare with (if it exists)")
+    parser.add_argument("--save-baseline", action="store_true", help="Write the results to --baseline instead of comparing")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="Allowed slowdown/growth over the baseline")
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="mwahaha-ui-bench-")
+    sys.path.insert(0, ROOT)
+    from benchmarks import synthetic
+    synthetic.isolated_environment(workdir, ROOT)
+    import baseline_generator
+    baseline_generator.generate_humor = fake_generate_humor
+    baseline_generator.REQUEST_PAUSE = 0  # the pacing is for the real API; Run All should time the app only
+
+    results = {}
+    try:
+        for task in args.tasks:
+            for size in sorted(args.sizes):
+                print(f"Benchmarking {task} at {size:,} rows...")
+                results.setdefault(task, {})[str(size)] = measure(task, size, args.interactions, args.repeat)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    report.finish(results, args.baseline, args.save_baseline, args.tolerance, {'ms': SLACK_MS, 'peak_mb': SLACK_MB},
+                  COLUMNS, METRICS, lambda keys: f"{keys[0]} at {report.rows(keys[1])} rows, {keys[2]}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import os
+import tempfile
+import config
+import dataset
+import provenance
+import baseline_generator as gen
+from maintenance_scripts import clean_task_b2, remove_quotes_b2, final_cleanup_b2, reconstruct_b2
+
+def postprocess_b2(text, row):
+    """The `clean` steps for Task B2, applied to one row."""
+    text = clean_task_b2.clean_text(text)
+    text = remove_quotes_b2.remove_unnecessary_quotes(text)
+    text = final_cleanup_b2.final_quote_cleanup(text)
+    if reconstruct_b2.needs_reconstruction(text):
+        text = reconstruct_b2.reconstruct_sentence({'text': text, 'prompt': row['prompt']})
+    return text
+
+def postprocess(text, filename, row):
+    return postprocess_b2(text, row) if "b2" in filename else text
+
+def postprocess_version(filename):
+    """Version of the cleanup rules a task's outputs go through; None if the generator output is used as is."""
+    if "b2" not in filename:
+        return None
+    return provenance.source_hash(postprocess_b2, clean_task_b2.clean_text, remove_quotes_b2.remove_unnecessary_quotes,
+                                  final_cleanup_b2.final_quote_cleanup, reconstruct_b2.needs_reconstruction,
+                                  reconstruct_b2.reconstruct_sentence)
+
+def _valid(text):
+    return isinstance(text, str) and bool(text.strip()) and not text.startswith("ERROR")
+
+def plan(filename, template_name=None, model=None, scene_descriptions=False):
+    """Compares every input row with its recorded provenance.
+
+    Rows are 'stale' (no record, or the input row, template, model or generation parameters
+    changed), 'cleanup' (only the cleanup rules changed, or the output row was lost; rebuilt from
+    the recorded raw output) or 'fresh'. Output ids that are no longer in the input are 'removed'.
+    """
+    template_name = template_name or config.TASK_TEMPLATES[filename]
+    input_df = dataset.load_input(filename)
+    out_df = dataset.load_output(filename, ['id', 'text'])
+    if out_df is not None:
+        out_df = out_df.drop_duplicates(subset=['id'], keep='first')
+    outputs = {} if out_df is None else dict(zip(out_df['id'], out_df['text']))
+    records = provenance.load(filename)
+    template_digest = provenance.template_hash(template_name)
+    params = gen.generation_params(filename, model, scene_descriptions)
+    version = postprocess_version(filename)
+
+    result = {'task': filename, 'template_name': template_name, 'input': input_df, 'outputs': outputs,
+              'records': records, 'version': version, 'fingerprints': {},
+              'stale': [], 'cleanup': [], 'fresh': []}
+    for _, row in input_df.iterrows():
+        id_val = row['id']
+        fingerprint = result['fingerprints'][id_val] = provenance.fingerprint(row, template_digest, params)
+        record = records.get(id_val)
+        if record is None or record['generation'] != fingerprint:
+            result['stale'].append(id_val)
+        elif record['postprocess'] != version or not _valid(outputs.get(id_val)):
+            result['cleanup'].append(id_val)
+        else:
+            result['fresh'].append(id_val)
+    result['removed'] = sorted(set(outputs) - set(input_df['id']))
+    return result
+
+def adopt(filename, build_plan):
+    """Records existing valid outputs that have no provenance yet as up to date, instead of regenerating them."""
+    records = build_plan['records']
+    adopted = [id_val for id_val in build_plan['stale']
+               if id_val not in records and _valid(build_plan['outputs'].get(id_val))]
+    for id_val in adopted:
+        records[id_val] = {'generation': build_plan['fingerprints'][id_val], 'postprocess': build_plan['version'],
+                           'raw': build_plan['outputs'][id_val]}
+        build_plan['stale'].remove(id_val)
+        build_plan['fresh'].append(id_val)
+    if adopted:
+        provenance.save(filename, records)
+    return len(adopted)
+
+def build(filename, template_name=None, model=None, scene_descriptions=False, pack_size=None, api_key=None,
+          dry_run=False, adopt_existing=False):
+    """Brings one task's output up to date, like `make`: only stale rows are regenerated, rows whose
+    cleanup rules changed are re-cleaned from their recorded raw output, and the rest is left alone.
+    Returns the plan with the counts of what was done.
+    """
+    build_plan = plan(filename, template_name, model, scene_descriptions)
+    if adopt_existing:
+        print(f"{filename}: adopted {adopt(filename, build_plan)} existing rows")
+    stale, cleanup, removed = build_plan['stale'], build_plan['cleanup'], build_plan['removed']
+    print(f"{filename}: {len(stale)} stale, {len(cleanup)} cleanup only, {len(build_plan['fresh'])} up to date"
+          + (f", {len(removed)} no longer in the input" if removed else ""))
+    if dry_run or not (stale or cleanup or removed):
+        return build_plan
+
+    input_df = build_plan['input']
+    rows = {row['id']: row for _, row in input_df.iterrows()}
+    outputs, records, version = build_plan['outputs'], build_plan['records'], build_plan['version']
+    regenerated = 0
+    if stale:
+        results = gen.generate_rows(input_df[input_df['id'].isin(set(stale))], filename, build_plan['template_name'],
+                                    pack_size, scene_descriptions, model=model, api_key=api_key)
+        for result in results:
+            id_val, raw = result['id'], result['text']
+            if _valid(raw):
+                records[id_val] = {'generation': build_plan['fingerprints'][id_val], 'postprocess': version, 'raw': raw}
+                outputs[id_val] = postprocess(raw, filename, rows[id_val])
+                regenerated += 1
+            elif not _valid(outputs.get(id_val)):
+                # Keep a previous output rather than overwriting it with a failure; either way the row stays stale
+                outputs[id_val] = raw
+    for id_val in cleanup:
+        records[id_val]['postprocess'] = version
+        outputs[id_val] = postprocess(records[id_val]['raw'], filename, rows[id_val])
+
+    final_df = input_df[['id']].copy()
+    final_df['text'] = final_df['id'].map(outputs)
+    output_path = os.path.join(config.OUTPUT_DIR, filename)
+    os.makedirs(config.OUTPUT_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=config.OUTPUT_DIR, prefix=filename + ".", suffix=".tmp")
+    os.close(fd)
+    try:
+        final_df.to_csv(tmp_path, sep='\t', index=False)
+        # mkstemp files are private to the owner; the output is read like any other
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    provenance.save(filename, {id_val: record for id_val, record in records.items() if id_val in rows})
+    print(f"[SUCCESS] {filename}: {regenerated} regenerated, {len(cleanup)} re-cleaned")
+    if regenerated < len(stale):
+        print(f"[WARN] {filename}: {len(stale) - regenerated} rows failed and stay stale")
+    return build_plan
+
+def build_all(tasks=config.TASK_FILES, **options):
+    return [build(task, **options) for task in tasks]
@@ -0,0 +1,58 @@
+import os
+import hashlib
+import threading
+
+# HTTP settings for pooled clients; each can be overridden through the environment
+TIMEOUT = float(os.getenv("MWAHAHA_HTTP_TIMEOUT", "60"))
+MAX_CONNECTIONS = int(os.getenv("MWAHAHA_MAX_CONNECTIONS", "20"))
+MAX_KEEPALIVE = int(os.getenv("MWAHAHA_MAX_KEEPALIVE", "10"))
+KEEPALIVE_EXPIRY = float(os.getenv("MWAHAHA_KEEPALIVE_EXPIRY", "60"))
+
+_clients = {}
+_lock = threading.Lock()
+
+def get_client(api_key=None, base_url=None, timeout=None, max_connections=None, max_keepalive=None, keepalive_expiry=None):
+    """Returns the shared client for a set of credentials and HTTP settings, creating it on first use.
+
+    Each client owns one pooled HTTP client (the SDK's DefaultHttpxClient), so connections and TLS sessions are reused across
+    calls, Streamlit reruns and browser sessions. Clients are thread-safe and never mutated after
+    creation. Returns None if no API key is given or set in OPENAI_API_KEY.
+    """
+    api_key = api_key or os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        return None
+    settings = (
+        base_url,
+        timeout or TIMEOUT,
+        max_connections or MAX_CONNECTIONS,
+        max_keepalive or MAX_KEEPALIVE,
+        keepalive_expiry or KEEPALIVE_EXPIRY
+    )
+    # Key by a digest so the registry never holds the raw key as a dict key
+    key = (hashlib.sha256(api_key.encode()).hexdigest(),) + settings
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            from openai import OpenAI, DefaultHttpxClient
+            # The SDK's own HTTP library (httpx or httpx2, depending on its version) provides the Limits class
+            from openai._constants import DEFAULT_CONNECTION_LIMITS
+            base_url, timeout, max_connections, max_keepalive, keepalive_expiry = settings
+            http_client = DefaultHttpxClient(
+                timeout=timeout,
+                limits=type(DEFAULT_CONNECTION_LIMITS)(
+                    max_connections=max_connections,
+                    max_keepalive_connections=max_keepalive,
+                    keepalive_expiry=keepalive_expiry
+                )
+            )
+            # No SDK retries: a 429 or 401 must reach key_pool at once so it can move the request to another key;
+            # key_pool.call retries with backoff when no other key can take it
+            client = OpenAI(api_key=api_key, base_url=base_url, timeout=timeout, max_retries=0, http_client=http_client)
+            _clients[key] = client
+    return client
+
+def close_all():
+    with _lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
@@ -0,0 +1,61 @@
+import re
+import pandas as pd
+
+# Task rules as stated in the templates
+SENTENCE_RANGE = (1, 3)
+MAX_CAPTION_WORDS = 20
+
+def count_sentences(text):
+    """Count sentences in text"""
+    if pd.isna(text):
+        return 0
+    # Split by sentence terminators
+    sentences = re.split(r'[.!?]+', str(text))
+    # Filter out empty strings
+    sentences = [s for s in sentences if s.strip()]
+    return len(sentences)
+
+def count_words(text):
+    """Count words in text"""
+    if pd.isna(text):
+        return 0
+    return len(str(text).split())
+
+def normalize_text(text):
+    """Normalize text for comparison"""
+    if pd.isna(text):
+        return ""
+    text = str(text).lower()
+    # Remove blank patterns
+    text = text.replace('______', '').replace('_____', '')
+    # Remove extra spaces
+    text = re.sub(r'\s+', ' ', text)
+    return text.strip()
+
+def violations(text, filename, row=None):
+    """Returns the names of the rules an output breaks for its task (empty list if compliant).
+
+    Pass the input `row` to also check the Task A word pair and the Task B2 prompt prefix.
+    """
+    if pd.isna(text) or not str(text).strip():
+        return ['empty']
+    text = str(text)
+    if text.startswith("ERROR"):
+        return ['error']
+    problems = []
+    if "task-a" in filename:
+        if not SENTENCE_RANGE[0] <= count_sentences(text) <= SENTENCE_RANGE[1]:
+            problems.append('sentences')
+        if row is not None and row.get('word1', '-') != '-' and row.get('word2', '-') != '-':
+            lowered = text.lower()
+            if str(row['word1']).lower() not in lowered or str(row['word2']).lower() not in lowered:
+                problems.append('word_pair')
+    elif "task-b" in filename:
+        if count_words(text) > MAX_CAPTION_WORDS:
+            problems.append('words')
+        if "b2" in filename and row is not None and normalize_text(row.get('prompt')) not in normalize_text(text):
+            problems.append('prompt')
+    return problems
+
+def is_compliant(text, filename, row=None):
+    return not violations(text, filename, row)
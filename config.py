@@ -0,0 +1,30 @@
+import os
+
+# Every path is resolved against the repository root (not the working directory) and can be
+# overridden through the environment, e.g. MWAHAHA_OUTPUT_DIR=/tmp/out.
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+def _dir(env_name, default):
+    return os.path.abspath(os.getenv(env_name, os.path.join(ROOT, default)))
+
+DATA_DIR = _dir("MWAHAHA_DATA_DIR", "data")
+OUTPUT_DIR = _dir("MWAHAHA_OUTPUT_DIR", "output")
+TEMPLATE_DIR = _dir("MWAHAHA_TEMPLATE_DIR", "templates")
+CACHE_DIR = _dir("MWAHAHA_CACHE_DIR", "gif_cache")
+RUNS_DIR = _dir("MWAHAHA_RUNS_DIR", "runs")
+RESPONSE_CACHE_DIR = _dir("MWAHAHA_RESPONSE_CACHE_DIR", "response_cache")
+# Point this (and OUTPUT_DIR) at a shared mount to run queue workers on several hosts
+QUEUE_DIR = _dir("MWAHAHA_QUEUE_DIR", "queue")
+# Optional JSON file overriding the model routing rules, escalation ladder and per-model budgets
+ROUTING_FILE = _dir("MWAHAHA_ROUTING_FILE", "routing.json")
+# Optional local secrets file with one API key per line (git-ignored), pooled by key_pool.py
+KEYS_FILE = _dir("MWAHAHA_KEYS_FILE", "api_keys.txt")
+
+TASK_TEMPLATES = {
+    "task-a-en.tsv": "task_a_en.j2",
+    "task-a-es.tsv": "task_a_es.j2",
+    "task-a-zh.tsv": "task_a_zh.j2",
+    "task-b1.tsv": "task_b1.j2",
+    "task-b2.tsv": "task_b2.j2"
+}
+TASK_FILES = list(TASK_TEMPLATES)
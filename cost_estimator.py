@@ -0,0 +1,265 @@
+import math
+import argparse
+import baseline_generator as gen
+import run_log
+import dataset
+import packing
+import scene_index
+import model_router
+import backends
+import generation_limits
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# USD per 1M tokens: (input, output). Image tokens are billed as input.
+PRICING = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-3.5-turbo": (0.50, 1.50)
+}
+
+# (base tokens, tokens per 512px tile) for image inputs at detail="auto"/"high"
+IMAGE_TOKENS = {
+    "gpt-4o-mini": (2833, 5667),
+    "gpt-4o": (85, 170)
+}
+
+# Seconds per request when there is no run history to go by
+DEFAULT_LATENCY = {"text": 1.5, "vision": 4.0}
+# Seconds per completion token, for the extra output of a packed request with no packed history
+DEFAULT_SECONDS_PER_TOKEN = 0.01
+# Typical Giphy rendition size, used for GIFs that are not in the local cache
+DEFAULT_GIF_SIZE = (480, 270)
+# Stand-in for descriptions that have not been generated yet (about 80 words)
+PLACEHOLDER_DESCRIPTION = " ".join(["word"] * 80)
+# Completion tokens of one scene description call
+DESCRIPTION_TOKENS = 150
+# Chat format overhead per message, plus the tokens priming the reply
+TOKENS_PER_MESSAGE = 3
+REPLY_PRIMING_TOKENS = 3
+# Matches the time.sleep() between rows in process_task
+ROW_DELAY = 0.05
+
+def count_tokens(text, model):
+    """Counts text tokens offline. Falls back to a character heuristic if tiktoken is not installed."""
+    if tiktoken is not None:
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoding = tiktoken.get_encoding("o200k_base")
+        return len(encoding.encode(text))
+    # ~4 characters per token for Latin scripts, ~1 token per CJK character
+    cjk = sum(1 for ch in text if '\u3000' <= ch <= '\u9fff' or '\uf900' <= ch <= '\ufaff')
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+def prompt_tokens(prompt, model):
+    return (count_tokens(gen.SYSTEM_PROMPT, model) + count_tokens(prompt, model)
+            + 2 * TOKENS_PER_MESSAGE + REPLY_PRIMING_TOKENS)
+
+def gif_dimensions(path):
+    """Reads (width, height) from a GIF header, or returns None if the file is not a GIF."""
+    try:
+        with open(path, "rb") as f:
+            header = f.read(10)
+    except OSError:
+        return None
+    if len(header) < 10 or header[:3] != b"GIF":
+        return None
+    return int.from_bytes(header[6:8], "little"), int.from_bytes(header[8:10], "little")
+
+def image_tokens(width, height, model):
+    base, per_tile = IMAGE_TOKENS.get(model, IMAGE_TOKENS["gpt-4o"])
+    # The API first fits the image inside 2048x2048, then scales the shortest side down to 768
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    tiles = math.ceil(width / 512) * math.ceil(height / 512)
+    return base + per_tile * tiles
+
+def gif_image_tokens(url, model):
+    """Image tokens for a GIF URL, and whether its size was measured from the local cache (1) or assumed (0)."""
+    size = None
+    if isinstance(url, str) and url.startswith("http"):
+        size = gif_dimensions(gen.gif_cache_path(url))
+    width, height = size or DEFAULT_GIF_SIZE
+    return image_tokens(width, height, model), int(size is not None)
+
+def observed_stats(filename, model, packed=False):
+    """Mean per-row latency per modality and mean completion tokens from previous runs of this task.
+
+    With `packed`, 'packed_request' is the mean latency of a whole packed request, if there are packed runs.
+    """
+    records = [r for r in run_log.load(filename) if r.get('latency') is not None]
+    same_model = [r for r in records if r.get('model') == model]
+    records = same_model or records
+    same_mode = [r for r in records if bool(r.get('packed')) == packed]
+    records = same_mode or records
+    stats = {}
+    for modality, vision in (("text", False), ("vision", True)):
+        latencies = [r['latency'] for r in records if bool(r.get('vision')) == vision]
+        if latencies:
+            stats[modality] = sum(latencies) / len(latencies)
+    # Packed rows are logged with an equal share of their request's latency
+    packed_latencies = [r['latency'] * r['packed'] for r in records if r.get('packed')]
+    if packed and packed_latencies:
+        stats['packed_request'] = sum(packed_latencies) / len(packed_latencies)
+    completions = [r['completion_tokens'] for r in records if r.get('completion_tokens') is not None]
+    if completions:
+        stats['completion_tokens'] = sum(completions) / len(completions)
+    return stats
+
+def estimate_task(filename, template_name=None, template_content=None, model=None, max_tokens=None,
+                  limit=None, rpm=None, tpm=None, pack_size=None, scene_descriptions=False):
+    """Renders every prompt for a task and projects token usage, cost and duration for a full run."""
+    model = model or gen.MODEL
+    max_tokens = max_tokens or generation_limits.max_tokens_for(filename)
+    if model == model_router.AUTO:
+        # Priced at the first-choice model for the task's modality; escalations are not projected
+        model = model_router.route(filename, "task-b" in filename and not scene_descriptions)
+    template_name = template_name or gen.TASK_TEMPLATES[filename]
+    df = dataset.load_input(filename)
+    if limit:
+        df = df.head(limit)
+
+    input_tokens = 0
+    img_tokens = 0
+    vision_rows = 0
+    measured_images = 0
+    rows = len(df)
+    described = set()
+    if pack_size:
+        # As generate_rows does
+        pack_size = min(pack_size, packing.max_pack_size())
+    packed = bool(pack_size and pack_size > 1 and "task-a" in filename)
+    if packed:
+        requests = math.ceil(rows / pack_size)
+        for start in range(0, rows, pack_size):
+            chunk = df.iloc[start:start + pack_size]
+            items = [(row['id'], gen.format_user_input(row, filename)) for _, row in chunk.iterrows()]
+            prompt = gen.get_rendered_prompt(template_name, packing.build_packed_input(items), template_content=template_content)
+            input_tokens += prompt_tokens(prompt, model)
+    else:
+        requests = rows
+        for _, row in df.iterrows():
+            user_input = gen.format_user_input(row, filename)
+            if "task-b" in filename:
+                url = row.get('url')
+                send_image = not scene_descriptions
+                if scene_descriptions:
+                    description = scene_index.get_description(url)
+                    if description is None and scene_index.media_key(url) not in described:
+                        # One vision call per GIF that has no stored description yet
+                        described.add(scene_index.media_key(url))
+                        input_tokens += prompt_tokens(scene_index.DESCRIBE_PROMPT, model)
+                        send_image = True
+                    user_input = scene_index.with_description(user_input, description or PLACEHOLDER_DESCRIPTION)
+                else:
+                    vision_rows += 1
+                if send_image:
+                    tokens, measured = gif_image_tokens(url, model)
+                    img_tokens += tokens
+                    measured_images += measured
+            prompt = gen.get_rendered_prompt(template_name, user_input, template_content=template_content)
+            input_tokens += prompt_tokens(prompt, model)
+
+    observed = observed_stats(filename, model, packed=packed)
+    expected_completion = min(observed.get('completion_tokens', max_tokens), max_tokens)
+    output_tokens = expected_completion * rows + DESCRIPTION_TOKENS * len(described)
+    max_output_tokens = max_tokens * rows + DESCRIPTION_TOKENS * len(described)
+
+    # Local models cost nothing per token
+    in_price, out_price = (0, 0) if backends.is_local(model) else PRICING.get(model, PRICING["gpt-4o"])
+    input_cost = (input_tokens + img_tokens) * in_price / 1_000_000
+    cost = input_cost + output_tokens * out_price / 1_000_000
+    max_cost = input_cost + max_output_tokens * out_price / 1_000_000
+
+    modality = "vision" if vision_rows else "text"
+    if packed:
+        # A packed request writes the output of all its rows; without packed history, take the
+        # single-row default plus the time to write the other rows' output
+        request_tokens = packing.packed_max_tokens(expected_completion, rows / requests if requests else 0)
+        default = DEFAULT_LATENCY["text"] + max(0, request_tokens - expected_completion) * DEFAULT_SECONDS_PER_TOKEN
+        latency = observed.get('packed_request', default)
+        latency_source = "observed" if 'packed_request' in observed else "default"
+        seconds = requests * latency
+    else:
+        latency = observed.get(modality, DEFAULT_LATENCY[modality])
+        latency_source = "observed" if modality in observed else "default"
+        seconds = rows * latency
+    requests += len(described)
+    seconds += len(described) * observed.get("vision", DEFAULT_LATENCY["vision"]) + requests * ROW_DELAY
+    # Rate limits put a floor under the duration regardless of latency
+    if rpm:
+        seconds = max(seconds, requests / rpm * 60)
+    if tpm:
+        seconds = max(seconds, (input_tokens + img_tokens + output_tokens) / tpm * 60)
+
+    return {
+        'task': filename,
+        'model': model,
+        'rows': rows,
+        'requests': requests,
+        'vision_rows': vision_rows,
+        'describe_calls': len(described),
+        'input_tokens': input_tokens,
+        'image_tokens': img_tokens,
+        'measured_images': measured_images,
+        'output_tokens': int(output_tokens),
+        'max_output_tokens': max_output_tokens,
+        'cost': cost,
+        'max_cost': max_cost,
+        'latency': latency,
+        'latency_source': latency_source,
+        'seconds': seconds
+    }
+
+def estimate_run(tasks=None, model=None, max_tokens=None, limit=None, rpm=None, tpm=None, pack_size=None,
+                 scene_descriptions=False):
+    tasks = tasks or list(gen.TASK_TEMPLATES)
+    return [estimate_task(t, model=model, max_tokens=max_tokens, limit=limit, rpm=rpm, tpm=tpm, pack_size=pack_size,
+                          scene_descriptions=scene_descriptions)
+            for t in tasks]
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m{seconds:02d}s" if hours else f"{minutes}m{seconds:02d}s"
+
+def print_report(estimates):
+    print(f"{'Task':<16}{'Rows':>6}{'Input':>10}{'Image':>12}{'Output':>10}{'Cost $':>10}{'Max $':>10}{'Duration':>12}")
+    for e in estimates:
+        print(f"{e['task']:<16}{e['rows']:>6}{e['input_tokens']:>10}{e['image_tokens']:>12}{e['output_tokens']:>10}"
+              f"{e['cost']:>10.4f}{e['max_cost']:>10.4f}{format_duration(e['seconds']):>12}")
+        images = e['vision_rows'] + e['describe_calls']
+        if images and e['measured_images'] < images:
+            print(f"  {images - e['measured_images']} GIFs not cached; assumed {DEFAULT_GIF_SIZE[0]}x{DEFAULT_GIF_SIZE[1]}")
+        if e['describe_calls']:
+            print(f"  Includes {e['describe_calls']} scene description calls")
+        if e['latency_source'] == "default":
+            print(f"  No run history; assumed {e['latency']:.1f}s per request")
+    print(f"{'TOTAL':<16}{sum(e['rows'] for e in estimates):>6}{sum(e['input_tokens'] for e in estimates):>10}"
+          f"{sum(e['image_tokens'] for e in estimates):>12}{sum(e['output_tokens'] for e in estimates):>10}"
+          f"{sum(e['cost'] for e in estimates):>10.4f}{sum(e['max_cost'] for e in estimates):>10.4f}"
+          f"{format_duration(sum(e['seconds'] for e in estimates)):>12}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Estimate tokens, cost and duration of a generation run.")
+    parser.add_argument("--tasks", nargs="+", choices=list(gen.TASK_TEMPLATES), help="Task files (default: all)")
+    parser.add_argument("--model", default=gen.MODEL)
+    parser.add_argument("--max-tokens", type=int, help="Completion limit per row (default: the task's generation profile)")
+    parser.add_argument("--limit", type=int, help="Only estimate the first N rows per task")
+    parser.add_argument("--rpm", type=int, help="Requests-per-minute limit of the API key")
+    parser.add_argument("--tpm", type=int, help="Tokens-per-minute limit of the API key")
+    parser.add_argument("--pack-size", type=int, help="Task A rows per packed request")
+    parser.add_argument("--scene-descriptions", action="store_true", help="Task B via stored scene descriptions")
+    args = parser.parse_args()
+    args.pack_size = packing.clamp_pack_size(args.pack_size)
+    print_report(estimate_run(args.tasks, args.model, args.max_tokens, args.limit, args.rpm, args.tpm, args.pack_size,
+                              args.scene_descriptions))
+
+if __name__ == "__main__":
+    main()
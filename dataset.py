@@ -0,0 +1,142 @@
+import os
+import json
+import hashlib
+import tempfile
+import numpy as np
+import pandas as pd
+import config
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:
+    pa = None
+
+# TSV stays the interchange format; these Feather files are a read cache next to it
+DATASET_CACHE_DIR = os.path.join(config.CACHE_DIR, "datasets")
+# Rows per chunk in streaming mode
+CHUNK_ROWS = 10000
+_SOURCE_KEY = b"mwahaha_source"
+
+def _source_stamp(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+def sidecar_path(path):
+    path = os.path.abspath(path)
+    digest = hashlib.md5(path.encode()).hexdigest()[:12]
+    return os.path.join(DATASET_CACHE_DIR, f"{os.path.splitext(os.path.basename(path))[0]}-{digest}.feather")
+
+def _sidecar_is_fresh(path, sidecar):
+    if not os.path.exists(sidecar):
+        return False
+    try:
+        with pa.memory_map(sidecar, "r") as source:
+            metadata = pa.ipc.open_file(source).schema.metadata or {}
+    except (OSError, pa.ArrowInvalid):
+        return False
+    stamp = metadata.get(_SOURCE_KEY)
+    return stamp is not None and json.loads(stamp) == _source_stamp(path)
+
+def build_sidecar(path):
+    """Converts a TSV into an uncompressed Feather file (memory-mappable) tagged with the TSV's size and mtime."""
+    sidecar = sidecar_path(path)
+    stamp = _source_stamp(path)
+    table = pa.Table.from_pandas(pd.read_csv(path, sep='\t'), preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[_SOURCE_KEY] = json.dumps(stamp).encode()
+    table = table.replace_schema_metadata(metadata)
+    os.makedirs(DATASET_CACHE_DIR, exist_ok=True)
+    # A unique temp file, so concurrent builds from any thread or process never write the same one
+    fd, tmp_path = tempfile.mkstemp(dir=DATASET_CACHE_DIR, prefix=os.path.basename(sidecar) + ".", suffix=".tmp")
+    os.close(fd)
+    try:
+        feather.write_feather(table, tmp_path, compression="uncompressed")
+        os.replace(tmp_path, sidecar)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return sidecar
+
+def read_table(path, columns=None):
+    """Returns the TSV as a memory-mapped Arrow table, (re)building the sidecar if the TSV changed.
+
+    Only the requested columns are mapped. Requires pyarrow.
+    """
+    sidecar = sidecar_path(path)
+    if not _sidecar_is_fresh(path, sidecar):
+        build_sidecar(path)
+    return feather.read_table(sidecar, columns=columns, memory_map=True)
+
+def read_tsv(path, columns=None):
+    """Drop-in for pd.read_csv(path, sep='\\t', usecols=columns) backed by the Feather sidecar when pyarrow is installed."""
+    if pa is None:
+        return pd.read_csv(path, sep='\t', usecols=columns)
+    return read_table(path, columns).to_pandas()
+
+def load_input(filename, columns=None):
+    return read_tsv(os.path.join(config.DATA_DIR, filename), columns)
+
+def load_output(filename, columns=None):
+    """Returns the saved output for a task, or None if there is none yet."""
+    path = os.path.join(config.OUTPUT_DIR, filename)
+    if not os.path.exists(path):
+        return None
+    return read_tsv(path, columns)
+
+def load_merged(filename, input_columns=None, how='left'):
+    """Input rows joined with their saved output `text` (empty string if there is no output file)."""
+    input_df = load_input(filename, input_columns)
+    out_df = load_output(filename, ['id', 'text'])
+    if out_df is None:
+        merged = input_df.copy()
+        merged['text'] = ""
+        return merged
+    return input_df.merge(out_df, on='id', how=how)
+
+def iter_tsv(path, columns=None, chunksize=CHUNK_ROWS):
+    """Yields the TSV as DataFrames of at most `chunksize` rows, read straight from the file so memory stays bounded."""
+    with pd.read_csv(path, sep='\t', usecols=columns, chunksize=chunksize) as reader:
+        yield from reader
+
+def iter_input(filename, columns=None, chunksize=CHUNK_ROWS):
+    return iter_tsv(os.path.join(config.DATA_DIR, filename), columns, chunksize)
+
+def iter_output(filename, columns=None, chunksize=CHUNK_ROWS):
+    """Chunked counterpart of load_output: None if there is no output yet."""
+    path = os.path.join(config.OUTPUT_DIR, filename)
+    if not os.path.exists(path):
+        return None
+    return iter_tsv(path, columns, chunksize)
+
+def id_hashes(filename, chunksize=CHUNK_ROWS):
+    """Sorted 64-bit hashes of a task's input ids: 8 bytes per row for membership tests on huge files."""
+    parts = [pd.util.hash_pandas_object(chunk['id'].astype(str), index=False).to_numpy()
+             for chunk in iter_input(filename, ['id'], chunksize)]
+    return np.sort(np.concatenate(parts)) if parts else np.array([], dtype=np.uint64)
+
+def count_known(hashes, ids):
+    """Number of `ids` whose hash is in the sorted `hashes` array."""
+    values = pd.util.hash_pandas_object(pd.Series(ids).astype(str), index=False).to_numpy()
+    positions = np.searchsorted(hashes, values).clip(max=max(len(hashes) - 1, 0))
+    return int((hashes[positions] == values).sum()) if len(hashes) else 0
+
+def iter_aligned(filename, input_columns, chunksize=CHUNK_ROWS):
+    """Yields each output row as a dict of its input `input_columns` plus 'text', reading both files in chunks.
+
+    Works for outputs in input order (as process_task and finalize_outputs write them), with rows
+    missing; raises ValueError as soon as an output row is out of order.
+    """
+    outputs = iter_output(filename, ['id', 'text'], chunksize)
+    if outputs is None:
+        return
+    inputs = (row for chunk in iter_input(filename, input_columns, chunksize) for row in chunk.to_dict('records'))
+    for chunk in outputs:
+        for out in chunk.to_dict('records'):
+            for row in inputs:
+                if row['id'] == out['id']:
+                    break
+            else:
+                raise ValueError(f"{filename}: output id {out['id']} is not in input order")
+            row['text'] = out['text']
+            yield row
@@ -0,0 +1,90 @@
+import math
+import time
+import run_log
+from resilience import percentile
+
+# Used until a task has enough history, and as the ceiling afterwards
+DEFAULT_MAX_TOKENS = 300
+MIN_MAX_TOKENS = 48
+MIN_SAMPLES = 30
+# max_tokens = MARGIN x the p99 completion length, rounded up to a multiple of ROUND_TO so the
+# response cache keys stay stable while the history grows
+PERCENTILE = 0.99
+MARGIN = 1.5
+ROUND_TO = 16
+# Back off to DEFAULT_MAX_TOKENS if more than this share of recent replies were cut off
+MAX_TRUNCATION_RATE = 0.02
+RECENT = 200
+PROFILE_TTL = 300
+
+# Captions are one paragraph; what follows a blank line is commentary the cleanup scripts strip.
+# Task A has none: a joke's setup and punchline are often separate paragraphs, and a stop there
+# would cut the punchline with nothing in the reply to show it.
+STOP_SEQUENCES = {
+    "task-b": ["\n\n", "\n(", "Word count"],
+}
+
+_profiles = {}
+
+def stop_sequences(filename):
+    for prefix, stops in STOP_SEQUENCES.items():
+        if prefix in filename:
+            return stops
+    return None
+
+def completion_lengths(records):
+    """Completion tokens of single-row, uncached replies (packed requests only log an average share)."""
+    return [r['completion_tokens'] for r in records
+            if r.get('completion_tokens') and not r.get('packed') and not r.get('cached')]
+
+def truncation_rate(records):
+    """Share of the replies that stopped at max_tokens, among those that logged a finish reason. None if none did."""
+    finished = [r['finish_reason'] for r in records if r.get('finish_reason')][-RECENT:]
+    if not finished:
+        return None
+    return sum(1 for reason in finished if reason == 'length') / len(finished)
+
+def max_tokens_for(filename, records=None):
+    """The completion limit for single-row requests of a task, derived from its run history."""
+    records = run_log.load(filename) if records is None else records
+    lengths = completion_lengths(records)
+    rate = truncation_rate(records)
+    if len(lengths) < MIN_SAMPLES or (rate is not None and rate > MAX_TRUNCATION_RATE):
+        return DEFAULT_MAX_TOKENS
+    limit = math.ceil(MARGIN * percentile(lengths, PERCENTILE) / ROUND_TO) * ROUND_TO
+    return max(MIN_MAX_TOKENS, min(DEFAULT_MAX_TOKENS, limit))
+
+def profile(filename):
+    """Returns {'max_tokens', 'stop'} for single-row requests of a task, re-read from runs/ every few minutes."""
+    now = time.time()
+    cached = _profiles.get(filename)
+    if cached and now - cached[0] < PROFILE_TTL:
+        return cached[1]
+    settings = {'max_tokens': max_tokens_for(filename), 'stop': stop_sequences(filename)}
+    _profiles[filename] = (now, settings)
+    return settings
+
+def report(filename):
+    records = run_log.load(filename)
+    lengths = completion_lengths(records)
+    return {
+        'task': filename,
+        'samples': len(lengths),
+        'p50': percentile(lengths, 0.5) if lengths else None,
+        'p99': percentile(lengths, PERCENTILE) if lengths else None,
+        'max_tokens': max_tokens_for(filename, records),
+        'stop': stop_sequences(filename),
+        'truncation_rate': truncation_rate(records),
+    }
+
+def print_report(reports):
+    print(f"{'task':<16} {'samples':>8} {'p50':>6} {'p99':>6} {'max_tokens':>11} {'truncated':>10}  stop")
+    for r in reports:
+        p50 = r['p50'] if r['p50'] is not None else "-"
+        p99 = r['p99'] if r['p99'] is not None else "-"
+        rate = f"{r['truncation_rate']:.1%}" if r['truncation_rate'] is not None else "-"
+        stops = ", ".join(repr(s) for s in r['stop'] or [])
+        print(f"{r['task']:<16} {r['samples']:>8} {p50:>6} {p99:>6} {r['max_tokens']:>11} {rate:>10}  {stops}")
+        if r['truncation_rate'] is not None and r['truncation_rate'] > MAX_TRUNCATION_RATE:
+            print(f"[WARN] {r['task']}: {r['truncation_rate']:.1%} of recent replies hit max_tokens; "
+                  f"using {DEFAULT_MAX_TOKENS} until that drops")
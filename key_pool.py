@@ -0,0 +1,212 @@
+import os
+import time
+import hashlib
+import threading
+from collections import Counter
+from dotenv import load_dotenv
+import config
+import client_pool
+import run_log
+
+# Requests per minute sent on one key by this process, unless the keys file gives its own
+DEFAULT_RPM = int(os.getenv("MWAHAHA_KEY_RPM", "500"))
+# A rate-limited key rests at least this long (or as long as the server asks), doubling while it keeps failing
+RATE_LIMIT_COOLDOWN = 20
+MAX_COOLDOWN = 300
+# A rejected key (401/403) is set aside for the rest of the run
+AUTH_COOLDOWN = 3600
+# Retries of a 429, 5xx or connection error that no other key can take, doubling from RETRY_DELAY seconds
+# (the pooled clients make no retries of their own)
+MAX_RETRIES = 4
+RETRY_DELAY = 1
+
+def key_label(api_key):
+    """Identifies a key in logs and reports without revealing it."""
+    return "key-" + hashlib.sha256(api_key.encode()).hexdigest()[:8]
+
+class Key:
+    def __init__(self, api_key, rpm=None):
+        self.api_key = api_key
+        self.label = key_label(api_key)
+        self.rpm = rpm or DEFAULT_RPM
+        self.interval = 60.0 / self.rpm
+        self.next_start = 0.0
+        self.cooldown_until = 0.0
+        self.cooldown = RATE_LIMIT_COOLDOWN
+        self.usage = Counter()
+
+    def available_at(self):
+        return max(self.next_start, self.cooldown_until)
+
+class KeyPool:
+    """Spreads requests over several API keys.
+
+    Each request takes the key that may send soonest, given its per-minute rate and any cooldown.
+    Keys that are rate limited (429) cool down; keys that are rejected (401/403) are set aside.
+    """
+    def __init__(self, keys):
+        self.keys = keys
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Reserves a key and waits until it may send. Raises if every key is set aside for longer than MAX_COOLDOWN."""
+        with self._lock:
+            now = time.monotonic()
+            key = min(self.keys, key=lambda k: (k.available_at(), k.usage['requests']))
+            start = max(now, key.available_at())
+            if start - now > MAX_COOLDOWN:
+                raise RuntimeError("every API key is rate limited or rejected")
+            key.next_start = start + key.interval
+            key.usage['requests'] += 1
+        time.sleep(start - now)
+        return key
+
+    def report(self, key, error=None, usage=None):
+        status = getattr(error, 'status_code', None)
+        with self._lock:
+            now = time.monotonic()
+            if error is None:
+                key.cooldown = RATE_LIMIT_COOLDOWN
+                if usage is not None:
+                    key.usage['prompt_tokens'] += usage.prompt_tokens
+                    key.usage['completion_tokens'] += usage.completion_tokens
+            elif status == 429:
+                key.usage['rate_limited'] += 1
+                wait = max(key.cooldown, retry_after(error))
+                key.cooldown_until = now + wait
+                key.cooldown = min(key.cooldown * 2, MAX_COOLDOWN)
+                print(f"[WARN] {key.label} rate limited; resting it {wait:.0f}s.")
+            elif status in (401, 403):
+                key.usage['rejected'] += 1
+                key.cooldown_until = now + AUTH_COOLDOWN
+                print(f"[WARN] {key.label} was rejected ({status}); not using it for this run.")
+            else:
+                key.usage['errors'] += 1
+
+def retry_after(error):
+    """Seconds the server asked to wait in a 429's Retry-After header, or 0."""
+    response = getattr(error, 'response', None)
+    try:
+        return float(response.headers.get("retry-after", 0))
+    except (AttributeError, TypeError, ValueError):
+        return 0.0
+
+def is_key_error(error):
+    return getattr(error, 'status_code', None) in (401, 403, 429)
+
+def is_transient(error):
+    """Whether the same request may succeed on a later try: rate limits, server errors, dropped connections."""
+    from openai import APIConnectionError
+    status = getattr(error, 'status_code', None)
+    return status == 429 or (status is not None and status >= 500) or isinstance(error, APIConnectionError)
+
+def backoff(retry, error):
+    """Seconds to wait before retry number `retry` (from 0), or longer if a 429 asked for it."""
+    return max(RETRY_DELAY * 2 ** retry, retry_after(error))
+
+def load_keys(path=None):
+    """Keys from the keys file (one per line, optionally followed by its requests per minute; # starts a comment),
+    then OPENAI_API_KEYS (comma-separated) and OPENAI_API_KEY from the environment or .env. Duplicates are dropped.
+    """
+    load_dotenv()
+    path = path or config.KEYS_FILE
+    entries = []
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                fields = line.split("#", 1)[0].split()
+                if fields:
+                    entries.append((fields[0], int(fields[1]) if len(fields) > 1 else None))
+    entries += [(k.strip(), None) for k in os.getenv("OPENAI_API_KEYS", "").split(",") if k.strip()]
+    if os.getenv("OPENAI_API_KEY"):
+        entries.append((os.getenv("OPENAI_API_KEY"), None))
+    keys = {}
+    for api_key, rpm in entries:
+        keys.setdefault(api_key, Key(api_key, rpm))
+    return list(keys.values())
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """The process-wide pool, loaded on first use. None if no key is configured."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            keys = load_keys()
+            _pool = KeyPool(keys) if keys else False
+    return _pool or None
+
+def call(send, api_key=None, stats=None):
+    """Runs `send(client)` and returns its result.
+
+    An explicit `api_key` is used as is. Otherwise the request goes through the key pool, and a
+    request refused with 429/401/403 is retried on another key (each key at most once). When no
+    other key can take it, a 429, 5xx or connection error is retried with backoff, up to
+    MAX_RETRIES times. The key's label is stored in `stats['key']`, so run logs record usage per key.
+    """
+    pool = None if api_key else get_pool()
+    if pool is None:
+        client = client_pool.get_client(api_key)
+        if client is None:
+            raise RuntimeError("OpenAI API Key not configured")
+        for retry in range(MAX_RETRIES + 1):
+            try:
+                return send(client)
+            except Exception as e:
+                if not is_transient(e) or retry == MAX_RETRIES:
+                    raise
+                time.sleep(backoff(retry, e))
+    tried = 0
+    retry = 0
+    while True:
+        key = pool.acquire()
+        try:
+            result = send(client_pool.get_client(key.api_key))
+        except Exception as e:
+            pool.report(key, e)
+            tried += 1
+            if is_key_error(e) and tried < len(pool.keys):
+                continue
+            if not is_transient(e) or retry == MAX_RETRIES:
+                raise
+            # A rate-limited key's cooldown already delays the next acquire
+            if getattr(e, 'status_code', None) != 429:
+                time.sleep(backoff(retry, e))
+            retry += 1
+            continue
+        pool.report(key, usage=getattr(result, 'usage', None))
+        if stats is not None:
+            stats['key'] = key.label
+        return result
+
+def configured():
+    return get_pool() is not None
+
+def usage_report(tasks=config.TASK_FILES):
+    """Per-key rows, tokens and task split from the run logs, plus each configured key's rate."""
+    pool = get_pool()
+    report = {key.label: {'rpm': key.rpm, 'rows': 0, 'prompt_tokens': 0, 'completion_tokens': 0, 'tasks': Counter()}
+              for key in (pool.keys if pool else [])}
+    for task in tasks:
+        for record in run_log.load(task):
+            if 'key' not in record:
+                continue
+            entry = report.setdefault(record['key'], {'rpm': None, 'rows': 0, 'prompt_tokens': 0, 'completion_tokens': 0,
+                                                      'tasks': Counter()})
+            entry['rows'] += 1
+            entry['prompt_tokens'] += record.get('prompt_tokens') or 0
+            entry['completion_tokens'] += record.get('completion_tokens') or 0
+            entry['tasks'][task] += 1
+    return report
+
+def print_usage(report):
+    if not report:
+        print("No API keys configured and no per-key usage logged.")
+        return
+    print(f"{'key':<14} {'rpm':>6} {'rows':>8} {'prompt':>12} {'completion':>12}  tasks")
+    for label, entry in sorted(report.items()):
+        rpm = entry['rpm'] if entry['rpm'] is not None else "-"
+        tasks = ", ".join(f"{task} {n}" for task, n in entry['tasks'].most_common())
+        print(f"{label:<14} {rpm:>6} {entry['rows']:>8} {int(entry['prompt_tokens']):>12,} "
+              f"{int(entry['completion_tokens']):>12,}  {tasks}")
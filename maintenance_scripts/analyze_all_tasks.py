@@ -1,9 +1,7 @@
-import pandas as pd
-import re
-
-print("="*80)
-print("COMPREHENSIVE OUTPUT ANALYSIS FOR ALL TASKS")
-print("="*80)
+import heapq
+from collections import Counter
+import dataset
+from compliance import count_sentences, count_words
 
 # Task definitions based on templates
 task_configs = {
@@ -33,126 +31,158 @@ task_configs = {
     }
 }
 
-def count_sentences(text):
-    """Count sentences in text"""
-    if pd.isna(text):
-        return 0
-    # Split by sentence terminators
-    sentences = re.split(r'[.!?]+', str(text))
-    # Filter out empty strings
-    sentences = [s for s in sentences if s.strip()]
-    return len(sentences)
+def _median(hist):
+    """Median of a {value: count} histogram, averaging the two middle values like pandas."""
+    total = sum(hist.values())
+    if total == 0:
+        return float('nan')
+    middle = [(total - 1) // 2, total // 2]
+    values, seen = [], 0
+    for value in sorted(hist):
+        seen += hist[value]
+        while middle and middle[0] < seen:
+            values.append(value)
+            middle.pop(0)
+    return sum(values) / 2
+
+def reduce_outputs(chunks, input_hashes, config):
+    """Folds output chunks into the statistics printed by analyze_task. Memory does not grow with the row count."""
+    stats = {'rows': 0, 'matched': 0, 'errors': 0, 'empty': 0, 'sentences': Counter(), 'words': Counter(), 'longest': []}
+    for chunk in chunks:
+        texts = chunk['text']
+        stats['rows'] += len(chunk)
+        stats['matched'] += dataset.count_known(input_hashes, chunk['id'])
+        stats['errors'] += int(texts.astype(str).str.contains('ERROR|error|null|NaN', case=False, na=False).sum())
+        stats['empty'] += int(texts.isna().sum())
+        word_counts = texts.apply(count_words)
+        stats['words'].update(word_counts.tolist())
+        if config['type'] == 'text-based':
+            stats['sentences'].update(texts.apply(count_sentences).tolist())
+        else:
+            over = chunk[word_counts > 20]
+            stats['longest'] = heapq.nlargest(5, stats['longest'] + list(zip(word_counts[word_counts > 20], over['id'], over['text'])),
+                                              key=lambda item: item[0])
+            stats['violations'] = stats.get('violations', 0) + len(over)
+    return stats
 
-def count_words(text):
-    """Count words in text"""
-    if pd.isna(text):
-        return 0
-    return len(str(text).split())
+def analyze_task(input_file, output_file, config, stream=False, chunksize=dataset.CHUNK_ROWS):
+    """Analyze a specific task
 
-def analyze_task(input_file, output_file, config):
-    """Analyze a specific task"""
+    With `stream`, input and output are read in chunks and reduced as they go, so memory stays
+    bounded on very large files.
+    """
     print(f"\n{'='*80}")
     print(f"TASK: {config['name']}")
     print(f"{'='*80}")
     
     # Read data
-    input_df = pd.read_csv(f'data/{input_file}', sep='\t')
-    output_df = pd.read_csv(f'output/{output_file}', sep='\t')
-    
-    # Merge
-    merged = input_df.merge(output_df, on='id', how='inner')
+    input_hashes = dataset.id_hashes(input_file, chunksize)
+    if stream:
+        chunks = dataset.iter_output(output_file, ['id', 'text'], chunksize)
+    else:
+        output_df = dataset.load_output(output_file, ['id', 'text'])
+        chunks = None if output_df is None else [output_df]
+    if chunks is None:
+        print(f"[ERROR] {output_file} has no output")
+        return None
+    stats = reduce_outputs(chunks, input_hashes, config)
+    total = stats['rows']
     
     print(f"\nBasic Statistics:")
-    print(f"  Input rows: {len(input_df)}")
-    print(f"  Output rows: {len(output_df)}")
-    print(f"  Matched rows: {len(merged)}")
-    
-    # Check for missing or error outputs
-    errors = output_df['text'].astype(str).str.contains('ERROR|error|null|NaN', case=False, na=False).sum()
-    empty = output_df['text'].isna().sum()
+    print(f"  Input rows: {len(input_hashes)}")
+    print(f"  Output rows: {total}")
+    print(f"  Matched rows: {stats['matched']}")
     
     print(f"\nData Quality:")
-    print(f"  Empty outputs: {empty}")
-    print(f"  Error outputs: {errors}")
+    print(f"  Empty outputs: {stats['empty']}")
+    print(f"  Error outputs: {stats['errors']}")
+    
+    words = stats['words']
+    word_total = sum(count * value for value, count in words.items())
+    
+    def print_word_stats():
+        print(f"\n  Word Count Statistics:")
+        print(f"    Average: {word_total / total:.1f} words")
+        print(f"    Median: {_median(words):.0f} words")
+        print(f"    Min: {min(words)} words")
+        print(f"    Max: {max(words)} words")
     
     # Task-specific analysis
     if config['type'] == 'text-based':
         # Analyze Task A (sentence count)
-        sentence_counts = output_df['text'].apply(count_sentences)
-        word_counts = output_df['text'].apply(count_words)
+        sentences = stats['sentences']
         
         print(f"\nTask A Requirements Analysis:")
         print(f"  Requirement: {config['requirements']}")
         print(f"\n  Sentence Count Distribution:")
-        print(f"    1 sentence: {(sentence_counts == 1).sum()} entries")
-        print(f"    2 sentences: {(sentence_counts == 2).sum()} entries")
-        print(f"    3 sentences: {(sentence_counts == 3).sum()} entries")
-        print(f"    4+ sentences: {(sentence_counts > 3).sum()} entries")
-        print(f"\n  Word Count Statistics:")
-        print(f"    Average: {word_counts.mean():.1f} words")
-        print(f"    Median: {word_counts.median():.0f} words")
-        print(f"    Min: {word_counts.min()} words")
-        print(f"    Max: {word_counts.max()} words")
+        print(f"    1 sentence: {sentences[1]} entries")
+        print(f"    2 sentences: {sentences[2]} entries")
+        print(f"    3 sentences: {sentences[3]} entries")
+        print(f"    4+ sentences: {sum(c for n, c in sentences.items() if n > 3)} entries")
+        print_word_stats()
         
         # Check for 1-3 sentence compliance
-        compliant = ((sentence_counts >= 1) & (sentence_counts <= 3)).sum()
-        print(f"\n  COMPLIANCE: {compliant}/{len(output_df)} ({compliant/len(output_df)*100:.1f}%) meet 1-3 sentence requirement")
+        compliant = sentences[1] + sentences[2] + sentences[3]
+        print(f"\n  COMPLIANCE: {compliant}/{total} ({compliant/total*100:.1f}%) meet 1-3 sentence requirement")
         
     elif config['type'] == 'multimodal':
         # Analyze Task B1 (word count ≤20)
-        word_counts = output_df['text'].apply(count_words)
+        def words_between(low, high):
+            return sum(c for n, c in words.items() if low <= n <= high)
         
         print(f"\nTask B1 Requirements Analysis:")
         print(f"  Requirement: {config['requirements']}")
         print(f"\n  Word Count Distribution:")
-        print(f"    <=10 words: {(word_counts <= 10).sum()} entries")
-        print(f"    11-15 words: {((word_counts > 10) & (word_counts <= 15)).sum()} entries")
-        print(f"    16-20 words: {((word_counts > 15) & (word_counts <= 20)).sum()} entries")
-        print(f"    21-25 words: {((word_counts >20) & (word_counts <= 25)).sum()} entries")
-        print(f"    >25 words: {(word_counts > 25).sum()} entries")
-        print(f"\n  Word Count Statistics:")
-        print(f"    Average: {word_counts.mean():.1f} words")
-        print(f"    Median: {word_counts.median():.0f} words")
-        print(f"    Min: {word_counts.min()} words")
-        print(f"    Max: {word_counts.max()} words")
+        print(f"    <=10 words: {words_between(0, 10)} entries")
+        print(f"    11-15 words: {words_between(11, 15)} entries")
+        print(f"    16-20 words: {words_between(16, 20)} entries")
+        print(f"    21-25 words: {words_between(21, 25)} entries")
+        print(f"    >25 words: {words_between(26, float('inf'))} entries")
+        print_word_stats()
         
         # Check for <=20 word compliance
-        compliant = (word_counts <= 20).sum()
-        violations = word_counts[word_counts > 20]
-        print(f"\n  COMPLIANCE: {compliant}/{len(output_df)} ({compliant/len(output_df)*100:.1f}%) meet <=20 word requirement")
+        compliant = words_between(0, 20)
+        print(f"\n  COMPLIANCE: {compliant}/{total} ({compliant/total*100:.1f}%) meet <=20 word requirement")
         
-        if len(violations) > 0:
-            print(f"\n  VIOLATIONS ({len(violations)} entries exceeding 20 words):")
-            violations_df = output_df[word_counts > 20].copy()
-            violations_df['word_count'] = word_counts[word_counts > 20]
-            violations_df = violations_df.sort_values('word_count', ascending=False).head(5)
-            for idx, row in violations_df.iterrows():
-                print(f"    {row['id']}: {int(row['word_count'])} words")
-                print(f"      Text: {row['text'][:80]}...")
+        if stats.get('violations'):
+            print(f"\n  VIOLATIONS ({stats['violations']} entries exceeding 20 words):")
+            for word_count, id_val, text in stats['longest']:
+                print(f"    {id_val}: {int(word_count)} words")
+                print(f"      Text: {text[:80]}...")
     
     print(f"\n  [OK] Analysis complete for {config['name']}")
     
     return {
         'name': config['name'],
-        'total': len(output_df),
-        'errors': errors,
-        'empty': empty
+        'total': total,
+        'errors': stats['errors'],
+        'empty': stats['empty']
     }
 
-# Analyze all tasks
-results = []
-for filename, config in task_configs.items():
-    result = analyze_task(filename, filename, config)
-    results.append(result)
+def main(stream=False, chunksize=dataset.CHUNK_ROWS):
+    print("="*80)
+    print("COMPREHENSIVE OUTPUT ANALYSIS FOR ALL TASKS")
+    print("="*80)
 
-# Final summary
-print(f"\n{'='*80}")
-print("FINAL SUMMARY")
-print(f"{'='*80}")
-for result in results:
-    status = "OK" if result['errors'] == 0 and result['empty'] == 0 else "NEEDS REVIEW"
-    print(f"  {result['name']:<30} {result['total']} rows [{status}]")
+    # Analyze all tasks
+    results = []
+    for filename, config in task_configs.items():
+        result = analyze_task(filename, filename, config, stream, chunksize)
+        if result is not None:
+            results.append(result)
+
+    # Final summary
+    print(f"\n{'='*80}")
+    print("FINAL SUMMARY")
+    print(f"{'='*80}")
+    for result in results:
+        status = "OK" if result['errors'] == 0 and result['empty'] == 0 else "NEEDS REVIEW"
+        print(f"  {result['name']:<30} {result['total']} rows [{status}]")
+
+    print(f"\n{'='*80}")
+    print("[SUCCESS] Comprehensive analysis complete!")
+    print(f"{'='*80}\n")
 
-print(f"\n{'='*80}")
-print("[SUCCESS] Comprehensive analysis complete!")
-print(f"{'='*80}\n")
+if __name__ == "__main__":
+    import sys
+    main(stream="--stream" in sys.argv)
@@ -1,8 +1,10 @@
 import pandas as pd
+import dataset
 import re
 import os
+from config import OUTPUT_DIR
 
-OUTPUT_FILE = "output/task-b2.tsv"
+OUTPUT_FILE = os.path.join(OUTPUT_DIR, "task-b2.tsv")
 
 def clean_text(text):
     """Clean a single text entry comprehensively."""
@@ -48,7 +50,7 @@ def clean_text(text):
 
 def main():
     print("Reading task-b2.tsv...")
-    df = pd.read_csv(OUTPUT_FILE, sep='\t')
+    df = dataset.read_tsv(OUTPUT_FILE)
     
     print(f"Original row count: {len(df)}")
     
@@ -66,7 +68,7 @@ def main():
     
     # Re-read to verify TSV integrity
     print("Re-reading file to verify TSV integrity...")
-    verify_df = pd.read_csv(OUTPUT_FILE, sep='\t')
+    verify_df = dataset.read_tsv(OUTPUT_FILE)
     print(f"Verification row count: {len(verify_df)}")
     
     if len(verify_df) == len(df):
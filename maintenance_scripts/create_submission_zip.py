@@ -1,27 +1,11 @@
-import zipfile
-import os
+import packager
 
-output_dir = "output"
-zip_filename = "submission.zip"
+def main(zip_filename=packager.ZIP_PATH, force=False):
+    """Validates all outputs and (re)builds the submission ZIP if any output changed."""
+    ok = packager.package(zip_filename, force=force)
+    if ok:
+        print(f"Location: {zip_filename}")
+    return ok
 
-files_to_zip = [
-    "task-a-en.tsv",
-    "task-a-es.tsv",
-    "task-a-zh.tsv",
-    "task-b1.tsv",
-    "task-b2.tsv"
-]
-
-print(f"Creating {zip_filename}...")
-
-with zipfile.ZipFile(zip_filename, 'w', zipfile.ZIP_DEFLATED) as zipf:
-    for filename in files_to_zip:
-        file_path = os.path.join(output_dir, filename)
-        if os.path.exists(file_path):
-            print(f"  Adding {filename}...")
-            zipf.write(file_path, arcname=filename)
-        else:
-            print(f"  [ERROR] File not found: {filename}")
-
-print(f"\n[SUCCESS] {zip_filename} created successfully!")
-print(f"Location: {os.path.abspath(zip_filename)}")
+if __name__ == "__main__":
+    main()
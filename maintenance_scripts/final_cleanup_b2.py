@@ -1,10 +1,10 @@
+import os
 import pandas as pd
+import dataset
 import re
+from config import OUTPUT_DIR
 
-# Read the file
-df = pd.read_csv('output/task-b2.tsv', sep='\t')
-
-print(f"Processing {len(df)} rows...")
+OUTPUT_FILE = os.path.join(OUTPUT_DIR, "task-b2.tsv")
 
 def final_quote_cleanup(text):
     if pd.isna(text):
@@ -29,20 +29,29 @@ def final_quote_cleanup(text):
     
     return text.strip()
 
-# Apply cleanup
-df['text'] = df['text'].apply(final_quote_cleanup)
+def main():
+    # Read the file
+    df = dataset.read_tsv(OUTPUT_FILE)
+
+    print(f"Processing {len(df)} rows...")
+
+    # Apply cleanup
+    df['text'] = df['text'].apply(final_quote_cleanup)
+
+    # Save
+    df.to_csv(OUTPUT_FILE, sep='\t', index=False)
 
-# Save
-df.to_csv('output/task-b2.tsv', sep='\t', index=False)
+    print("Cleanup complete!")
 
-print("Cleanup complete!")
+    # Verify
+    verify_df = dataset.read_tsv(OUTPUT_FILE)
+    print(f"Final row count: {len(verify_df)}")
 
-# Verify
-verify_df = pd.read_csv('output/task-b2.tsv', sep='\t')
-print(f"Final row count: {len(verify_df)}")
+    # Check for remaining patterns
+    has_double_quote_ellipsis = verify_df['text'].astype(str).str.contains(r'""\.\.\.').sum()
+    print(f"Entries with '\"\"...': {has_double_quote_ellipsis}")
 
-# Check for remaining patterns
-has_double_quote_ellipsis = verify_df['text'].astype(str).str.contains(r'""\.\.\.').sum()
-print(f"Entries with '\"\"...': {has_double_quote_ellipsis}")
+    print("\n[SUCCESS] Final cleanup done!")
 
-print("\n[SUCCESS] Final cleanup done!")
+if __name__ == "__main__":
+    main()
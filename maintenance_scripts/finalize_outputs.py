@@ -1,8 +1,6 @@
-import pandas as pd
+import dataset
 import os
-
-DATA_DIR = "data"
-OUTPUT_DIR = "output"
+from config import DATA_DIR, OUTPUT_DIR, TASK_FILES
 
 def clean_file(filename):
     print(f"Cleaning {filename}...")
@@ -16,10 +14,10 @@ def clean_file(filename):
         print(f"  Output {filename} not found. Skipping.")
         return
         
-    input_df = pd.read_csv(input_path, sep='\t')
+    input_df = dataset.read_tsv(input_path, ['id'])
     # Use keep='first' or 'last'. Let's trust the first valid non-error one.
     try:
-        output_df = pd.read_csv(output_path, sep='\t')
+        output_df = dataset.read_tsv(output_path)
     except Exception as e:
         print(f"  Error reading {output_path}: {e}")
         return
@@ -41,13 +39,9 @@ def clean_file(filename):
     final_df.to_csv(output_path, sep='\t', index=False)
     print(f"  Done. Rows: {len(final_df)}")
 
-if __name__ == "__main__":
-    tasks = [
-        "task-a-en.tsv",
-        "task-a-es.tsv",
-        "task-a-zh.tsv",
-        "task-b1.tsv",
-        "task-b2.tsv"
-    ]
+def main(tasks=TASK_FILES):
     for task in tasks:
         clean_file(task)
+
+if __name__ == "__main__":
+    main()
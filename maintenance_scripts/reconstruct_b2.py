@@ -1,14 +1,11 @@
+import os
 import pandas as pd
+import dataset
 import re
+from config import DATA_DIR, OUTPUT_DIR
 
-# Read input data (original prompts)
-input_df = pd.read_csv('data/task-b2.tsv', sep='\t')
-
-# Read cleaned output
-output_df = pd.read_csv('output/task-b2.tsv', sep='\t')
-
-# Merge to have both prompts and outputs
-merged = input_df.merge(output_df, on='id', how='inner', suffixes=('_input', '_output'))
+INPUT_FILE = os.path.join(DATA_DIR, "task-b2.tsv")
+OUTPUT_FILE = os.path.join(OUTPUT_DIR, "task-b2.tsv")
 
 # Function to check if text needs reconstruction
 def needs_reconstruction(text):
@@ -39,27 +36,40 @@ def reconstruct_sentence(row):
     
     return output_text
 
-# Find and reconstruct incomplete entries
-count = 0
-for idx, row in merged.iterrows():
-    if needs_reconstruction(row['text']):
-        reconstructed = reconstruct_sentence(row)
-        output_df.loc[output_df['id'] == row['id'], 'text'] = reconstructed
-        count += 1
-        print(f"Reconstructed {row['id']}:")
-        print(f"  Before: {row['text'][:80]}...")
-        print(f"  After:  {reconstructed[:80]}...")
-        print()
+def main():
+    # Read input data (original prompts)
+    input_df = dataset.read_tsv(INPUT_FILE)
+
+    # Read cleaned output
+    output_df = dataset.read_tsv(OUTPUT_FILE)
+
+    # Merge to have both prompts and outputs
+    merged = input_df.merge(output_df, on='id', how='inner', suffixes=('_input', '_output'))
+
+    # Find and reconstruct incomplete entries
+    count = 0
+    for idx, row in merged.iterrows():
+        if needs_reconstruction(row['text']):
+            reconstructed = reconstruct_sentence(row)
+            output_df.loc[output_df['id'] == row['id'], 'text'] = reconstructed
+            count += 1
+            print(f"Reconstructed {row['id']}:")
+            print(f"  Before: {row['text'][:80]}...")
+            print(f"  After:  {reconstructed[:80]}...")
+            print()
+
+    print(f"\n=== Summary ===")
+    print(f"Total reconstructed: {count}")
 
-print(f"\n=== Summary ===")
-print(f"Total reconstructed: {count}")
+    # Save updated file
+    output_df.to_csv(OUTPUT_FILE, sep='\t', index=False)
+    print("Updated file saved!")
 
-# Save updated file
-output_df.to_csv('output/task-b2.tsv', sep='\t', index=False)
-print("Updated file saved!")
+    # Verify  
+    print("\nRe-reading to verify...")
+    verify_df = dataset.read_tsv(OUTPUT_FILE)
+    print(f"Row count: {len(verify_df)}")
+    print("[SUCCESS] Reconstruction complete!")
 
-# Verify  
-print("\nRe-reading to verify...")
-verify_df = pd.read_csv('output/task-b2.tsv', sep='\t')
-print(f"Row count: {len(verify_df)}")
-print("[SUCCESS] Reconstruction complete!")
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,10 @@
+import os
 import pandas as pd
+import dataset
 import re
+from config import OUTPUT_DIR
 
-# Read the file
-df = pd.read_csv('output/task-b2.tsv', sep='\t')
-
-print(f"Processing {len(df)} rows...")
+OUTPUT_FILE = os.path.join(OUTPUT_DIR, "task-b2.tsv")
 
 def remove_unnecessary_quotes(text):
     if pd.isna(text):
@@ -27,28 +27,37 @@ def remove_unnecessary_quotes(text):
     
     return text.strip()
 
-# Apply cleanup
-print("Removing unnecessary quotes...")
-df['text'] = df['text'].apply(remove_unnecessary_quotes)
+def main():
+    # Read the file
+    df = dataset.read_tsv(OUTPUT_FILE)
+
+    print(f"Processing {len(df)} rows...")
+
+    # Apply cleanup
+    print("Removing unnecessary quotes...")
+    df['text'] = df['text'].apply(remove_unnecessary_quotes)
+
+    # Save
+    df.to_csv(OUTPUT_FILE, sep='\t', index=False)
 
-# Save
-df.to_csv('output/task-b2.tsv', sep='\t', index=False)
+    print("Cleanup complete!")
 
-print("Cleanup complete!")
+    # Verify
+    verify_df = dataset.read_tsv(OUTPUT_FILE)
+    print(f"Final row count: {len(verify_df)}")
 
-# Verify
-verify_df = pd.read_csv('output/task-b2.tsv', sep='\t')
-print(f"Final row count: {len(verify_df)}")
+    # Check for remaining double quotes
+    has_double_quotes = verify_df['text'].astype(str).str.contains('""').sum()
+    print(f"Entries with '\"\"': {has_double_quotes}")
 
-# Check for remaining double quotes
-has_double_quotes = verify_df['text'].astype(str).str.contains('""').sum()
-print(f"Entries with '\"\"': {has_double_quotes}")
+    # Show a few sample cleaned entries
+    print("\n=== Sample cleaned entries ===")
+    for idx in [2, 5, 10, 13]:
+        if idx < len(verify_df):
+            print(f"\n{verify_df.iloc[idx]['id']}:")
+            print(f"  {verify_df.iloc[idx]['text'][:100]}...")
 
-# Show a few sample cleaned entries
-print("\n=== Sample cleaned entries ===")
-for idx in [2, 5, 10, 13]:
-    if idx < len(verify_df):
-        print(f"\n{verify_df.iloc[idx]['id']}:")
-        print(f"  {verify_df.iloc[idx]['text'][:100]}...")
+    print("\n[SUCCESS] Quote cleanup done!")
 
-print("\n[SUCCESS] Quote cleanup done!")
+if __name__ == "__main__":
+    main()
@@ -1,79 +1,96 @@
-import pandas as pd
-import re
+import dataset
+from compliance import normalize_text
 
-# Read input data (original prompts)
-input_df = pd.read_csv('data/task-b2.tsv', sep='\t')
+# Examples kept per category; the counts cover every row
+MAX_EXAMPLES = 10
 
-# Read output data
-output_df = pd.read_csv('output/task-b2.tsv', sep='\t')
+def classify(rows):
+    """Counts full matches, partial matches and mismatches over an iterable of merged rows."""
+    counts = {'total': 0, 'full': 0, 'partial': 0, 'mismatch': 0}
+    partial_matches = []
+    mismatches = []
+    for row in rows:
+        counts['total'] += 1
+        prompt = normalize_text(row['prompt'])
+        output = normalize_text(row['text'])
+        
+        # Check if output starts with prompt
+        if output.startswith(prompt):
+            counts['full'] += 1
+            continue
+        item = {
+            'id': row['id'],
+            'prompt': row['prompt'][:60],
+            'output': str(row['text'])[:80]
+        }
+        # Check if prompt is contained in output
+        if prompt in output:
+            counts['partial'] += 1
+            if len(partial_matches) < MAX_EXAMPLES:
+                partial_matches.append(item)
+        else:
+            counts['mismatch'] += 1
+            if len(mismatches) < MAX_EXAMPLES:
+                mismatches.append(item)
+    return counts, partial_matches, mismatches
 
-# Merge
-merged = input_df.merge(output_df, on='id', how='inner', suffixes=('_input', '_output'))
+def main(stream=False, chunksize=dataset.CHUNK_ROWS):
+    counts = None
+    if stream:
+        # The generator opens nothing until iterated; it only tells whether the output exists
+        if dataset.iter_output("task-b2.tsv", ['id'], chunksize) is None:
+            print("[ERROR] task-b2.tsv has no output")
+            return
+        try:
+            counts, partial_matches, mismatches = classify(dataset.iter_aligned("task-b2.tsv", ['id', 'prompt'], chunksize))
+        except ValueError as e:
+            print(f"[WARNING] {e}; falling back to an in-memory join.\n")
+    if counts is None:
+        # Read input data (original prompts)
+        input_df = dataset.load_input("task-b2.tsv", ['id', 'prompt'])
 
-print(f"Analyzing {len(merged)} rows...\n")
+        # Read output data
+        output_df = dataset.load_output("task-b2.tsv", ['id', 'text'])
+        if output_df is None:
+            print("[ERROR] task-b2.tsv has no output")
+            return
 
-def normalize_text(text):
-    """Normalize text for comparison"""
-    if pd.isna(text):
-        return ""
-    text = str(text).lower()
-    # Remove blank patterns
-    text = text.replace('______', '').replace('_____', '')
-    # Remove extra spaces
-    text = re.sub(r'\s+', ' ', text)
-    return text.strip()
+        # Merge
+        merged = input_df.merge(output_df, on='id', how='inner', suffixes=('_input', '_output'))
+        counts, partial_matches, mismatches = classify(merged.to_dict('records'))
 
-mismatches = []
-partial_matches = []
-full_matches = 0
+    print(f"Analyzing {counts['total']} rows...\n")
 
-for idx, row in merged.iterrows():
-    prompt = normalize_text(row['prompt'])
-    output = normalize_text(row['text'])
-    
-    # Check if output starts with prompt
-    if output.startswith(prompt):
-        full_matches += 1
-    # Check if prompt is contained in output
-    elif prompt in output:
-        partial_matches.append({
-            'id': row['id'],
-            'prompt': row['prompt'][:60],
-            'output': row['text'][:80]
-        })
-    else:
-        mismatches.append({
-            'id': row['id'],
-            'prompt': row['prompt'][:60],
-            'output': row['text'][:80]
-        })
+    print("=== ANALYSIS RESULTS ===\n")
+    print(f"[OK] Full matches (output starts with prompt): {counts['full']}")
+    print(f"[~] Partial matches (prompt contained in output): {counts['partial']}")
+    print(f"[X] Mismatches (prompt NOT in output): {counts['mismatch']}")
 
-print("=== ANALYSIS RESULTS ===\n")
-print(f"[OK] Full matches (output starts with prompt): {full_matches}")
-print(f"[~] Partial matches (prompt contained in output): {len(partial_matches)}")
-print(f"[X] Mismatches (prompt NOT in output): {len(mismatches)}")
+    if partial_matches:
+        print(f"\n=== Partial Matches ({counts['partial']}) ===")
+        for item in partial_matches[:5]:  # Show first 5
+            print(f"\nID: {item['id']}")
+            print(f"  Prompt: {item['prompt']}...")
+            print(f"  Output: {item['output']}...")
 
-if partial_matches:
-    print(f"\n=== Partial Matches ({len(partial_matches)}) ===")
-    for item in partial_matches[:5]:  # Show first 5
-        print(f"\nID: {item['id']}")
-        print(f"  Prompt: {item['prompt']}...")
-        print(f"  Output: {item['output']}...")
+    if mismatches:
+        print(f"\n=== MISMATCHES ({counts['mismatch']}) ===")
+        for item in mismatches[:10]:  # Show first 10
+            print(f"\nID: {item['id']}")
+            print(f"  Prompt: {item['prompt']}...")
+            print(f"  Output: {item['output']}...")
 
-if mismatches:
-    print(f"\n=== MISMATCHES ({len(mismatches)}) ===")
-    for item in mismatches[:10]:  # Show first 10
-        print(f"\nID: {item['id']}")
-        print(f"  Prompt: {item['prompt']}...")
-        print(f"  Output: {item['output']}...")
+    print(f"\n=== SUMMARY ===")
+    total = counts['total']
+    consistent = counts['full'] + counts['partial']
+    print(f"Consistent entries: {consistent}/{total} ({consistent/total*100:.1f}%)")
+    print(f"Problematic entries: {counts['mismatch']}/{total} ({counts['mismatch']/total*100:.1f}%)")
 
-print(f"\n=== SUMMARY ===")
-total = len(merged)
-consistent = full_matches + len(partial_matches)
-print(f"Consistent entries: {consistent}/{total} ({consistent/total*100:.1f}%)")
-print(f"Problematic entries: {len(mismatches)}/{total} ({len(mismatches)/total*100:.1f}%)")
+    if counts['mismatch'] == 0:
+        print("\n[SUCCESS] All outputs are consistent with their prompts!")
+    else:
+        print(f"\n[WARNING] Found {counts['mismatch']} entries that may need review.")
 
-if len(mismatches) == 0:
-    print("\n[SUCCESS] All outputs are consistent with their prompts!")
-else:
-    print(f"\n[WARNING] Found {len(mismatches)} entries that may need review.")
+if __name__ == "__main__":
+    import sys
+    main(stream="--stream" in sys.argv)
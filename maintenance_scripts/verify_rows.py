@@ -1,14 +1,20 @@
-import pandas as pd
+import dataset
 import os
+from config import OUTPUT_DIR, TASK_FILES
 
-tasks = ["task-a-en.tsv", "task-a-es.tsv", "task-a-zh.tsv", "task-b1.tsv", "task-b2.tsv"]
-output_dir = "output"
+def main(tasks=TASK_FILES, stream=False, chunksize=dataset.CHUNK_ROWS):
+    print("Results of Final Row Count Verification:")
+    for task in tasks:
+        path = os.path.join(OUTPUT_DIR, task)
+        if os.path.exists(path):
+            if stream:
+                rows = sum(len(chunk) for chunk in dataset.iter_tsv(path, ['id'], chunksize))
+            else:
+                rows = len(dataset.read_tsv(path, ['id']))
+            print(f"{task}: {rows} rows")
+        else:
+            print(f"{task}: NOT FOUND")
 
-print("Results of Final Row Count Verification:")
-for task in tasks:
-    path = os.path.join(output_dir, task)
-    if os.path.exists(path):
-        df = pd.read_csv(path, sep='\t')
-        print(f"{task}: {len(df)} rows")
-    else:
-        print(f"{task}: NOT FOUND")
+if __name__ == "__main__":
+    import sys
+    main(stream="--stream" in sys.argv)
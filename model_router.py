@@ -0,0 +1,103 @@
+import os
+import json
+import time
+import fnmatch
+import threading
+from contextlib import contextmanager
+import config
+
+# Pass this as the model to let the router pick one per row
+AUTO = "auto"
+
+# First matching rule wins. A rule may match on the task file (glob), the modality ("text" or
+# "vision") and the length of the row's formatted input in characters (min_chars/max_chars).
+RULES = [
+    {"modality": "text", "min_chars": 600, "model": "gpt-4o"},
+    {"model": "gpt-4o-mini"},
+]
+# Cheapest first; a row that comes back non-compliant or as an ERROR moves one step up
+ESCALATION = ["gpt-4o-mini", "gpt-4o"]
+VISION_MODELS = {"gpt-4o-mini", "gpt-4o"}
+# Per-model budgets in this process: requests in flight and requests per minute
+LIMITS = {
+    "gpt-4o-mini": {"concurrency": 16, "rpm": 500},
+    "gpt-4o": {"concurrency": 4, "rpm": 60},
+}
+
+def load_settings(path=None):
+    """Replaces the defaults above with the keys present in the routing file (routing.json), if it exists."""
+    global RULES, ESCALATION, LIMITS
+    path = path or config.ROUTING_FILE
+    if not os.path.exists(path):
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        settings = json.load(f)
+    RULES = settings.get('rules', RULES)
+    ESCALATION = settings.get('escalation', ESCALATION)
+    LIMITS = settings.get('limits', LIMITS)
+    with _lock:
+        _budgets.clear()
+
+def _matches(rule, task, vision, chars):
+    if 'task' in rule and not fnmatch.fnmatch(task or "", rule['task']):
+        return False
+    if 'modality' in rule and rule['modality'] != ("vision" if vision else "text"):
+        return False
+    if 'min_chars' in rule or 'max_chars' in rule:
+        # Length rules only apply when the caller knows the input length
+        if chars is None:
+            return False
+        if not rule.get('min_chars', 0) <= chars <= rule.get('max_chars', chars):
+            return False
+    return True
+
+def route(task=None, vision=False, chars=None):
+    """Returns the model for one request. Vision requests only go to models that accept images."""
+    for rule in RULES:
+        if _matches(rule, task, vision, chars) and (not vision or rule['model'] in VISION_MODELS):
+            return rule['model']
+    return ESCALATION[0]
+
+def escalate(model, vision=False):
+    """The next stronger model on the escalation ladder, or None if `model` is already the strongest."""
+    ladder = [m for m in ESCALATION if not vision or m in VISION_MODELS]
+    if model not in ladder:
+        return None
+    index = ladder.index(model)
+    return ladder[index + 1] if index + 1 < len(ladder) else None
+
+class Budget:
+    """Caps one model's requests in flight and spaces its requests evenly to stay under its per-minute rate."""
+    def __init__(self, concurrency=None, rpm=None):
+        self.semaphore = threading.BoundedSemaphore(concurrency) if concurrency else None
+        self.interval = 60.0 / rpm if rpm else 0.0
+        self.next_start = 0.0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def acquire(self):
+        if self.semaphore:
+            self.semaphore.acquire()
+        try:
+            if self.interval:
+                with self._lock:
+                    now = time.monotonic()
+                    start = max(now, self.next_start)
+                    self.next_start = start + self.interval
+                time.sleep(start - now)
+            yield
+        finally:
+            if self.semaphore:
+                self.semaphore.release()
+
+_budgets = {}
+_lock = threading.Lock()
+
+def budget(model):
+    """Context manager around one request to `model`. Models without configured limits are not throttled."""
+    with _lock:
+        if model not in _budgets:
+            _budgets[model] = Budget(**LIMITS.get(model, {}))
+        return _budgets[model].acquire()
+
+load_settings()
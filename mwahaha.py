@@ -0,0 +1,303 @@
+"""Command line entry point for generation, cleanup, analysis and packaging.
+
+    python mwahaha.py generate --tasks task-a-en.tsv --limit 5
+    python mwahaha.py generate --tasks task-b1.tsv --model auto
+    python mwahaha.py build --dry-run
+    python mwahaha.py serve
+    python mwahaha.py regenerate --tasks task-b2.tsv --ids img_2_0876 img_2_0874
+    python mwahaha.py clean
+    python mwahaha.py analyze
+    python mwahaha.py verify --mismatches
+    python mwahaha.py package
+    python mwahaha.py queue init --tasks task-b1.tsv --shard-size 50
+    python mwahaha.py queue work --tasks task-b1.tsv --workers 4
+    python mwahaha.py queue merge --tasks task-b1.tsv
+    python mwahaha.py dedup --tasks task-b2.tsv --regenerate
+    python mwahaha.py limits
+    python mwahaha.py eval --task task-a-en.tsv --variants task_a_en.j2 experiments/task_a_en_short.j2
+
+Subcommands import pandas, the generator and the API client only when they need them, so
+analysis and verification start quickly and run without network access or an API key.
+"""
+import os
+import argparse
+import config
+from config import TASK_FILES
+
+CLEAN_STEPS = ["clean", "quotes", "final", "reconstruct", "finalize"]
+
+def cmd_generate(args):
+    import service
+    # Directory overrides only apply to this process, so those runs never go to the service
+    local = args.local or args.data_dir or args.output_dir
+    for task in args.tasks:
+        if args.stream:
+            import baseline_generator as gen
+            gen.stream_task(task, gen.TASK_TEMPLATES[task], limit=args.limit, chunk_size=args.chunk_size,
+                            pack_size=args.pack_size, scene_descriptions=args.scene_descriptions, model=args.model)
+        else:
+            service.run_task(task, config.TASK_TEMPLATES[task], limit=args.limit, pack_size=args.pack_size,
+                             scene_descriptions=args.scene_descriptions, model=args.model, local=local)
+    if args.zip:
+        import packager
+        packager.package(strict=False)
+
+def cmd_regenerate(args):
+    import baseline_generator as gen
+    for task in args.tasks:
+        gen.regenerate(task, gen.TASK_TEMPLATES[task], ids=args.ids, model=args.model)
+
+def cmd_clean(args):
+    from maintenance_scripts import clean_task_b2, remove_quotes_b2, final_cleanup_b2, reconstruct_b2, finalize_outputs
+    steps = {
+        "clean": clean_task_b2.main,
+        "quotes": remove_quotes_b2.main,
+        "final": final_cleanup_b2.main,
+        "reconstruct": reconstruct_b2.main,
+        "finalize": finalize_outputs.main
+    }
+    for step in args.steps:
+        steps[step]()
+
+def cmd_analyze(args):
+    from maintenance_scripts import analyze_all_tasks
+    analyze_all_tasks.main(stream=args.stream, chunksize=args.chunk_size)
+
+def cmd_verify(args):
+    from maintenance_scripts import verify_rows, verify_b2_prompts
+    verify_rows.main(stream=args.stream, chunksize=args.chunk_size)
+    verify_b2_prompts.main(stream=args.stream, chunksize=args.chunk_size)
+    if args.mismatches:
+        from maintenance_scripts import show_mismatches
+        show_mismatches.main()
+
+def cmd_package(args):
+    import packager
+    zip_path = os.path.abspath(args.output) if args.output else packager.ZIP_PATH
+    if not packager.package(zip_path, strict=not args.allow_invalid, force=args.force):
+        raise SystemExit(1)
+
+def cmd_estimate(args):
+    import cost_estimator
+    cost_estimator.print_report(cost_estimator.estimate_run(args.tasks, args.model, args.max_tokens, args.limit,
+                                                            args.rpm, args.tpm, args.pack_size, args.scene_descriptions))
+
+def cmd_queue(args):
+    import work_queue
+    for task in args.tasks:
+        if args.action == "init":
+            if work_queue.create(task, config.TASK_TEMPLATES[task], args.shard_size, args.limit, args.pack_size,
+                                 args.scene_descriptions, args.model, args.reset) is None:
+                raise SystemExit(1)
+        elif args.action == "work":
+            wait = not args.no_wait
+            if args.workers > 1:
+                work_queue.run_workers(task, args.workers, args.lease, wait)
+            else:
+                work_queue.work(task, lease_seconds=args.lease, wait=wait)
+        elif args.action == "status":
+            work_queue.print_status(task)
+        elif args.action == "merge":
+            if not work_queue.merge(task, args.allow_partial):
+                raise SystemExit(1)
+
+def cmd_dedup(args):
+    import near_duplicates
+    for task in args.tasks:
+        clusters = near_duplicates.find_clusters(task, args.threshold, history=not args.no_history)
+        near_duplicates.print_clusters(task, clusters)
+        ids = near_duplicates.regeneration_ids(clusters, task)
+        print(f"\n{len(ids)} rows repeat a joke used elsewhere in {task}.")
+        if args.regenerate and ids:
+            import baseline_generator as gen
+            gen.regenerate(task, gen.TASK_TEMPLATES[task], ids=ids)
+
+def cmd_eval(args):
+    if len(set(args.variants)) < 2:
+        raise SystemExit("eval needs at least two different template variants")
+    import template_eval
+    report = template_eval.evaluate(args.task, args.variants, batch_size=args.batch_size, max_rows=args.max_rows,
+                                    seed=args.seed, scene_descriptions=args.scene_descriptions, model=args.model)
+    template_eval.print_report(report)
+
+def add_stream_options(p):
+    p.add_argument("--stream", action="store_true", help="Read the TSVs in chunks to keep memory bounded on huge files")
+    p.add_argument("--chunk-size", type=int, default=10000, help="Rows per chunk with --stream")
+
+def add_model_option(p):
+    p.add_argument("--model", help="Model name, 'auto' to route each row and escalate failed rows (see model_router.py), "
+                        "or 'local' / 'local:<gguf path or model id>' to generate on this machine (see backends.py)")
+
+def cmd_build(args):
+    import build
+    build.build_all(args.tasks, model=args.model, scene_descriptions=args.scene_descriptions, pack_size=args.pack_size,
+                    dry_run=args.dry_run, adopt_existing=args.adopt)
+    if args.zip:
+        import packager
+        packager.package(strict=False)
+
+def cmd_serve(args):
+    import service
+    service.serve()
+
+def cmd_jobs(args):
+    import service
+    if not service.available():
+        print(f"[ERROR] No generation service at {service.SERVICE_URL}")
+        raise SystemExit(1)
+    for job in service.jobs():
+        progress = f"{job['done']}/{job['total']}" if job['total'] else ""
+        target = job['params'].get('filename', "")
+        print(f"  {job['id']}  {job['kind']:<10} {target:<16} {job['state']:<8} {progress}"
+              + (f"  {job['error']}" if job['error'] else ""))
+
+def cmd_keys(args):
+    import key_pool
+    key_pool.print_usage(key_pool.usage_report(args.tasks))
+
+def cmd_limits(args):
+    import generation_limits
+    generation_limits.print_report([generation_limits.report(task) for task in args.tasks])
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="mwahaha", description="MWAHAHA generation and maintenance tools.")
+    parser.add_argument("--data-dir", help="Input TSV directory (default: data/)")
+    parser.add_argument("--output-dir", help="Output TSV directory (default: output/)")
+    parser.add_argument("--queue-dir", help="Shared work queue directory (default: queue/)")
+    parser.add_argument("--hedge", action="store_true",
+                        help="Duplicate requests that run past the task's p95 latency (at most 5%% of requests)")
+    parser.add_argument("--profile", nargs="?", const="stages", choices=["stages", "cprofile"],
+                        help="Write per-stage timings and peak memory (plus a cProfile dump) to runs/profiles/")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("generate", help="Generate outputs for whole tasks")
+    p.add_argument("--tasks", nargs="+", choices=TASK_FILES, default=TASK_FILES)
+    p.add_argument("--limit", type=int, help="Only process the first N rows per task")
+    p.add_argument("--pack-size", type=int, help="Task A rows per packed request")
+    p.add_argument("--scene-descriptions", action="store_true", help="Caption Task B from stored scene descriptions")
+    p.add_argument("--zip", action="store_true", help="Create submission.zip afterwards")
+    p.add_argument("--local", action="store_true", help="Generate in this process even if the generation service is running")
+    add_model_option(p)
+    add_stream_options(p)
+    p.set_defaults(func=cmd_generate)
+
+    p = sub.add_parser("build", help="Regenerate only rows whose input, template or settings changed (like make)")
+    p.add_argument("--tasks", nargs="+", choices=TASK_FILES, default=TASK_FILES)
+    p.add_argument("--pack-size", type=int, help="Task A rows per packed request")
+    p.add_argument("--scene-descriptions", action="store_true", help="Caption Task B from stored scene descriptions")
+    p.add_argument("--dry-run", action="store_true", help="Only report what is stale")
+    p.add_argument("--adopt", action="store_true",
+                   help="Treat existing outputs without provenance as up to date instead of regenerating them")
+    p.add_argument("--zip", action="store_true", help="Rebuild submission.zip afterwards (only if an output changed)")
+    add_model_option(p)
+    p.set_defaults(func=cmd_build)
+
+    p = sub.add_parser("regenerate", help="Regenerate missing/ERROR rows, or specific ids")
+    p.add_argument("--tasks", nargs="+", choices=TASK_FILES, default=TASK_FILES)
+    p.add_argument("--ids", nargs="+", help="Regenerate exactly these ids")
+    add_model_option(p)
+    p.set_defaults(func=cmd_regenerate)
+
+    p = sub.add_parser("clean", help="Run output cleanup steps")
+    p.add_argument("--steps", nargs="+", choices=CLEAN_STEPS, default=CLEAN_STEPS)
+    p.set_defaults(func=cmd_clean)
+
+    p = sub.add_parser("analyze", help="Report compliance statistics for all outputs")
+    add_stream_options(p)
+    p.set_defaults(func=cmd_analyze)
+
+    p = sub.add_parser("verify", help="Check row counts and Task B2 prompt consistency")
+    p.add_argument("--mismatches", action="store_true", help="List every Task B2 mismatch")
+    add_stream_options(p)
+    p.set_defaults(func=cmd_verify)
+
+    p = sub.add_parser("package", help="Validate the outputs and zip them for submission")
+    p.add_argument("--output", help="ZIP path (default: submission.zip)")
+    p.add_argument("--force", action="store_true", help="Rebuild even if no output changed")
+    p.add_argument("--allow-invalid", action="store_true", help="Write the ZIP even if validation fails")
+    p.set_defaults(func=cmd_package)
+
+    p = sub.add_parser("estimate", help="Estimate tokens, cost and duration of a run")
+    p.add_argument("--tasks", nargs="+", choices=TASK_FILES, default=TASK_FILES)
+    p.add_argument("--model", default="gpt-4o-mini")
+    p.add_argument("--max-tokens", type=int, help="Completion limit per row (default: the task's generation profile)")
+    p.add_argument("--limit", type=int)
+    p.add_argument("--rpm", type=int)
+    p.add_argument("--tpm", type=int)
+    p.add_argument("--pack-size", type=int)
+    p.add_argument("--scene-descriptions", action="store_true")
+    p.set_defaults(func=cmd_estimate)
+
+    p = sub.add_parser("queue", help="Sharded generation by several worker processes or hosts")
+    actions = p.add_subparsers(dest="action", required=True)
+    q = actions.add_parser("init", help="Split tasks into shards (resumes an existing queue)")
+    q.add_argument("--shard-size", type=int, default=100)
+    q.add_argument("--limit", type=int, help="Only queue the first N rows per task")
+    q.add_argument("--pack-size", type=int, help="Task A rows per packed request")
+    q.add_argument("--scene-descriptions", action="store_true", help="Caption Task B from stored scene descriptions")
+    q.add_argument("--model", help="Model for every worker (default: the generator's; 'auto' routes per row)")
+    q.add_argument("--reset", action="store_true", help="Discard an existing queue and its results")
+    q = actions.add_parser("work", help="Claim and generate shards until the queue is empty")
+    q.add_argument("--workers", type=int, default=1, help="Worker processes to start on this host")
+    q.add_argument("--lease", type=int, default=300, help="Seconds before a silent worker's shard is reclaimed")
+    q.add_argument("--no-wait", action="store_true", help="Exit instead of waiting on shards leased by other workers")
+    actions.add_parser("status", help="Show shard progress")
+    q = actions.add_parser("merge", help="Write the finished shards to the output TSV in input order")
+    q.add_argument("--allow-partial", action="store_true", help="Merge even if some shards are not done")
+    for q in actions.choices.values():
+        q.add_argument("--tasks", nargs="+", choices=TASK_FILES, default=TASK_FILES)
+    p.set_defaults(func=cmd_queue)
+
+    p = sub.add_parser("dedup", help="Find repeated jokes across outputs and run history (MinHash/LSH)")
+    p.add_argument("--tasks", nargs="+", choices=TASK_FILES, default=TASK_FILES)
+    p.add_argument("--threshold", type=float, default=0.5, help="Jaccard similarity of word 3-grams counted as a repeat")
+    p.add_argument("--no-history", action="store_true", help="Only compare current outputs, not past generations in runs/")
+    p.add_argument("--regenerate", action="store_true", help="Regenerate all but the first row of each cluster")
+    p.set_defaults(func=cmd_dedup)
+
+    p = sub.add_parser("serve", help="Run the local generation service that Streamlit and generate submit work to")
+    p.set_defaults(func=cmd_serve)
+
+    p = sub.add_parser("jobs", help="List the generation service's jobs")
+    p.set_defaults(func=cmd_jobs)
+
+    p = sub.add_parser("keys", help="Show the pooled API keys and the rows and tokens logged per key")
+    p.add_argument("--tasks", nargs="+", choices=TASK_FILES, default=TASK_FILES)
+    p.set_defaults(func=cmd_keys)
+
+    p = sub.add_parser("limits", help="Show per-task max_tokens, stop sequences and truncation rates from run history")
+    p.add_argument("--tasks", nargs="+", choices=TASK_FILES, default=TASK_FILES)
+    p.set_defaults(func=cmd_limits)
+
+    p = sub.add_parser("eval", help="Compare template variants on a stratified sample, stopping early")
+    p.add_argument("--task", required=True, choices=TASK_FILES)
+    p.add_argument("--variants", nargs="+", required=True, help="Template files or names in templates/")
+    p.add_argument("--batch-size", type=int, default=8, help="Rows per variant between comparisons")
+    p.add_argument("--max-rows", type=int, default=96, help="Stop after this many rows per variant")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--scene-descriptions", action="store_true", help="Describe each GIF once and share it across variants")
+    p.add_argument("--model")
+    p.set_defaults(func=cmd_eval)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    # Overrides must be in place before the subcommand imports anything that reads config
+    if args.data_dir:
+        config.DATA_DIR = os.path.abspath(args.data_dir)
+    if args.output_dir:
+        config.OUTPUT_DIR = os.path.abspath(args.output_dir)
+    if args.queue_dir:
+        config.QUEUE_DIR = os.path.abspath(args.queue_dir)
+    if args.hedge:
+        # Through the environment so queue worker processes pick it up too
+        os.environ["MWAHAHA_HEDGE"] = "1"
+    if args.profile:
+        os.environ["MWAHAHA_PROFILE"] = args.profile
+    if getattr(args, 'pack_size', None):
+        import packing
+        args.pack_size = packing.clamp_pack_size(args.pack_size)
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import re
+import zlib
+import numpy as np
+import dataset
+import run_log
+from compliance import normalize_text
+
+# 128 MinHash permutations in 32 bands of 4 rows: pairs above ~0.42 Jaccard become candidates
+NUM_PERM = 128
+BANDS = 32
+SHINGLE_WORDS = 3
+SHINGLE_CHARS = 3
+# Candidates are confirmed with the exact Jaccard similarity of their shingle sets
+THRESHOLD = 0.5
+# Buckets larger than this are checked against their first member only, keeping the work linear
+MAX_PAIRWISE_BUCKET = 50
+
+# Universal hashing modulo a prime just above 2**32, so a*x + b never overflows uint64
+_PRIME = np.uint64(4294967311)
+_rng = np.random.RandomState(1)
+_A = _rng.randint(1, 2**32 - 1, size=NUM_PERM, dtype=np.uint64)
+_B = _rng.randint(0, 2**32 - 1, size=NUM_PERM, dtype=np.uint64)
+
+_CJK = re.compile(r'[\u3040-\u30ff\u3400-\u9fff\uf900-\ufaff]')
+_BLANK = re.compile(r'_{3,}')
+
+def _tokens(text):
+    return re.findall(r'\w+', str(text).lower())
+
+def completion(text, prompt):
+    """The part of a Task B2 output the model wrote: the prompt's words before and after the blank are stripped."""
+    tokens = _tokens(text)
+    parts = _BLANK.split(str(prompt), maxsplit=1)
+    head, tail = _tokens(parts[0]), _tokens(parts[1] if len(parts) > 1 else "")
+    if tokens[:len(head)] == head:
+        tokens = tokens[len(head):]
+    if tail and tokens[-len(tail):] == tail:
+        tokens = tokens[:-len(tail)]
+    return " ".join(tokens)
+
+def shingles(text):
+    """Word 3-grams, or character 3-grams for Chinese/Japanese text. Texts shorter than a shingle are one shingle."""
+    if _CJK.search(text):
+        chars = re.sub(r'\W', '', text)
+        grams = {chars[i:i + SHINGLE_CHARS] for i in range(len(chars) - SHINGLE_CHARS + 1)}
+        return grams or {chars}
+    words = _tokens(text)
+    grams = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+    return grams or {" ".join(words)}
+
+def signature(shingle_set):
+    values = np.array([zlib.crc32(s.encode()) for s in shingle_set], dtype=np.uint64)
+    return ((np.outer(_A, values) + _B[:, None]) % _PRIME).min(axis=1)
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b)
+
+def _documents(filename, history=True):
+    """Output rows plus, optionally, every text in the task's run history, skipping errors and blanks."""
+    docs = []
+    prompts = {}
+    if "b2" in filename:
+        input_df = dataset.load_input(filename, ['id', 'prompt'])
+        prompts = dict(zip(input_df['id'], input_df['prompt']))
+    out_df = dataset.load_output(filename, ['id', 'text'])
+    sources = [] if out_df is None else [('output', out_df['id'].tolist(), out_df['text'].tolist())]
+    if history:
+        records = [r for r in run_log.load(filename) if 'text' in r]
+        sources.append(('history', [r['id'] for r in records], [r['text'] for r in records]))
+    seen = set()
+    for source, ids, texts in sources:
+        for id_val, text in zip(ids, texts):
+            if not isinstance(text, str) or not text.strip() or text.startswith("ERROR"):
+                continue
+            # History repeats outputs that are already indexed
+            if (id_val, normalize_text(text)) in seen:
+                continue
+            seen.add((id_val, normalize_text(text)))
+            body = completion(text, prompts[id_val]) if id_val in prompts else text
+            if body.strip():
+                docs.append({'id': id_val, 'text': text, 'source': source, 'shingles': shingles(body)})
+    return docs
+
+def find_clusters(filename, threshold=THRESHOLD, history=True):
+    """Groups a task's outputs (and past generations) that repeat the same joke.
+
+    Each text gets a MinHash signature; LSH banding puts similar signatures in shared buckets and
+    only bucket-mates are compared, so the work grows roughly linearly with the number of texts.
+    Returns clusters (lists of docs) that span at least two ids and contain a current output row.
+    """
+    docs = _documents(filename, history)
+    parent = list(range(len(docs)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def link(i, j):
+        if docs[i]['id'] != docs[j]['id'] and jaccard(docs[i]['shingles'], docs[j]['shingles']) >= threshold:
+            parent[find(i)] = find(j)
+
+    rows = NUM_PERM // BANDS
+    buckets = {}
+    for index, doc in enumerate(docs):
+        sig = signature(doc['shingles'])
+        for band in range(BANDS):
+            buckets.setdefault((band, sig[band * rows:(band + 1) * rows].tobytes()), []).append(index)
+
+    for members in buckets.values():
+        if len(members) < 2:
+            continue
+        if len(members) <= MAX_PAIRWISE_BUCKET:
+            for a in range(len(members)):
+                for b in range(a + 1, len(members)):
+                    if find(members[a]) != find(members[b]):
+                        link(members[a], members[b])
+        else:
+            for member in members[1:]:
+                link(members[0], member)
+
+    groups = {}
+    for index in range(len(docs)):
+        groups.setdefault(find(index), []).append(docs[index])
+    clusters = [group for group in groups.values()
+                if len({doc['id'] for doc in group}) > 1 and any(doc['source'] == 'output' for doc in group)]
+    return sorted(clusters, key=len, reverse=True)
+
+def regeneration_ids(clusters, filename):
+    """Output ids to regenerate: every current output in a cluster except the first one in input order."""
+    order = {id_val: i for i, id_val in enumerate(dataset.load_input(filename, ['id'])['id'])}
+    ids = []
+    for cluster in clusters:
+        outputs = sorted({doc['id'] for doc in cluster if doc['source'] == 'output'}, key=lambda i: order.get(i, len(order)))
+        ids.extend(outputs[1:])
+    return ids
+
+def print_clusters(filename, clusters, limit=10):
+    print(f"\n=== {filename}: {len(clusters)} clusters of repeated jokes ===")
+    for cluster in clusters[:limit]:
+        ids = sorted({doc['id'] for doc in cluster})
+        print(f"\n  {len(ids)} ids: {', '.join(ids[:8])}{' ...' if len(ids) > 8 else ''}")
+        for doc in cluster[:3]:
+            print(f"    [{doc['source']}] {doc['id']}: {doc['text'][:90]}")
+    if len(clusters) > limit:
+        print(f"\n  (+{len(clusters) - limit} more clusters)")
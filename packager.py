@@ -0,0 +1,137 @@
+import os
+import csv
+import json
+import hashlib
+import zipfile
+import config
+
+ZIP_PATH = os.path.join(config.ROOT, "submission.zip")
+# Examples listed per problem type in the validation report
+MAX_EXAMPLES = 5
+
+def _hashed_lines(f, hasher):
+    """Yields decoded lines of a binary file while feeding its raw bytes to `hasher`."""
+    for raw in f:
+        hasher.update(raw)
+        yield raw.decode("utf-8")
+
+def _read_ids(path):
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        reader = csv.DictReader(f, delimiter="\t")
+        return [row["id"] for row in reader]
+
+def validate_task(filename):
+    """Checks one output against its input in a single streaming pass over the output file.
+
+    Reports missing, extra and duplicate ids, ERROR rows, empty or NaN text and text containing
+    tabs or newlines, together with the SHA-256 of the output bytes.
+    """
+    report = {'task': filename, 'rows': 0, 'sha256': None, 'bytes': 0,
+              'missing': [], 'extra': [], 'duplicates': [], 'errors': [], 'empty': [], 'tabs': []}
+    input_path = os.path.join(config.DATA_DIR, filename)
+    output_path = os.path.join(config.OUTPUT_DIR, filename)
+    if not os.path.exists(output_path):
+        report['missing_file'] = True
+        report['ok'] = False
+        return report
+
+    expected = set(_read_ids(input_path)) if os.path.exists(input_path) else None
+    seen = set()
+    hasher = hashlib.sha256()
+    with open(output_path, "rb") as f:
+        reader = csv.reader(_hashed_lines(f, hasher), delimiter="\t")
+        header = next(reader, None)
+        if header is None or header[:2] != ['id', 'text']:
+            report['bad_header'] = header
+        for fields in reader:
+            if not fields:
+                continue
+            report['rows'] += 1
+            id_val = fields[0]
+            text = "\t".join(fields[1:])
+            if id_val in seen:
+                report['duplicates'].append(id_val)
+            seen.add(id_val)
+            if expected is not None and id_val not in expected:
+                report['extra'].append(id_val)
+            if not text.strip() or text.strip().lower() == "nan":
+                report['empty'].append(id_val)
+            elif text.startswith("ERROR"):
+                report['errors'].append(id_val)
+            if len(fields) != 2 or "\t" in text or "\n" in text or "\r" in text:
+                report['tabs'].append(id_val)
+    if expected is not None:
+        report['missing'] = sorted(expected - seen)
+    report['sha256'] = hasher.hexdigest()
+    report['bytes'] = os.path.getsize(output_path)
+    report['ok'] = not (report.get('bad_header') or report['missing'] or report['extra'] or report['duplicates']
+                        or report['errors'] or report['empty'] or report['tabs'])
+    return report
+
+def print_report(report):
+    status = "OK" if report['ok'] else "INVALID"
+    print(f"  {report['task']:<16} {report['rows']:>5} rows [{status}]")
+    if report.get('missing_file'):
+        print("    output file not found")
+        return
+    if report.get('bad_header'):
+        print(f"    unexpected header: {report['bad_header']}")
+    for problem in ['missing', 'extra', 'duplicates', 'errors', 'empty', 'tabs']:
+        ids = report[problem]
+        if ids:
+            more = f" (+{len(ids) - MAX_EXAMPLES} more)" if len(ids) > MAX_EXAMPLES else ""
+            print(f"    {problem}: {len(ids)} e.g. {', '.join(map(str, ids[:MAX_EXAMPLES]))}{more}")
+
+def manifest_path(zip_path):
+    return os.path.splitext(zip_path)[0] + ".manifest.json"
+
+def _load_manifest(zip_path):
+    try:
+        with open(manifest_path(zip_path), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+def _file_sha256(path):
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+def package(zip_path=ZIP_PATH, tasks=config.TASK_FILES, strict=True, force=False):
+    """Validates every output and writes the submission ZIP plus a manifest of content hashes.
+
+    The archive is rebuilt only when an output's hash differs from the manifest (or `force` is set),
+    and is written to a temporary file first so a crash never leaves a half-written ZIP behind.
+    With `strict`, nothing is written if any output fails validation. Returns True if the ZIP is current.
+    """
+    print("Validating outputs...")
+    reports = [validate_task(task) for task in tasks]
+    for report in reports:
+        print_report(report)
+    if strict and not all(r['ok'] for r in reports):
+        print("[ERROR] Validation failed; submission ZIP not written.")
+        return False
+
+    files = {r['task']: {'sha256': r['sha256'], 'rows': r['rows'], 'bytes': r['bytes']}
+             for r in reports if r['sha256'] is not None}
+    manifest = _load_manifest(zip_path)
+    if (not force and manifest and manifest.get('files') == files and os.path.exists(zip_path)
+            and manifest.get('zip_sha256') == _file_sha256(zip_path)):
+        print(f"[OK] {zip_path} is up to date.")
+        return True
+
+    tmp_path = f"{zip_path}.{os.getpid()}.tmp"
+    with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED) as zf:
+        for task in files:
+            zf.write(os.path.join(config.OUTPUT_DIR, task), arcname=task)
+    os.replace(tmp_path, zip_path)
+
+    manifest = {'files': files, 'zip_sha256': _file_sha256(zip_path)}
+    tmp_path = f"{manifest_path(zip_path)}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, manifest_path(zip_path))
+    print(f"[SUCCESS] {zip_path} written ({len(files)} files).")
+    return True
@@ -0,0 +1,57 @@
+import json
+import re
+
+# Caps the completion budget of a packed request regardless of how many rows it carries
+MAX_PACKED_TOKENS = 4096
+# Completion budget per row of a packed request
+ROW_TOKENS = 300
+
+PACK_INSTRUCTIONS = """You will receive several inputs at once, as a JSON object mapping an id to each input.
+Apply the instructions above to every input independently, writing exactly one response per id.
+Reply with only a JSON object that maps every id to its response text, with no other keys or commentary.
+
+Inputs:
+"""
+
+def build_packed_input(items):
+    """Builds the user_input for a packed request from (id, user_input) pairs."""
+    payload = {str(id_val): user_input for id_val, user_input in items}
+    return PACK_INSTRUCTIONS + json.dumps(payload, ensure_ascii=False, indent=1)
+
+def packed_max_tokens(max_tokens, n_rows):
+    return min(max_tokens * n_rows, MAX_PACKED_TOKENS)
+
+def max_pack_size(max_tokens=ROW_TOKENS):
+    """Most rows per packed request before MAX_PACKED_TOKENS cuts into each row's budget."""
+    return max(1, MAX_PACKED_TOKENS // max_tokens)
+
+def clamp_pack_size(pack_size):
+    """`pack_size` limited to max_pack_size(), with a warning when it had to be lowered."""
+    if pack_size and pack_size > max_pack_size():
+        print(f"[WARN] Pack size {pack_size} lowered to {max_pack_size()}: {MAX_PACKED_TOKENS} completion tokens "
+              f"per request leave {ROW_TOKENS} per row for at most {max_pack_size()} rows.")
+        return max_pack_size()
+    return pack_size
+
+def parse_packed_response(text, ids):
+    """Splits a packed JSON reply into {id: text}.
+
+    Only ids that were requested and came back as non-empty strings are returned; callers
+    regenerate the rest one row at a time.
+    """
+    if not text or text.startswith("ERROR"):
+        return {}
+    # Tolerate a ```json fence around the object
+    text = re.sub(r'^```(?:json)?\s*|\s*```$', '', text.strip())
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    results = {}
+    for id_val in ids:
+        value = data.get(str(id_val))
+        if isinstance(value, str) and value.strip():
+            results[id_val] = value.strip()
+    return results
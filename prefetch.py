@@ -0,0 +1,142 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import requests
+import baseline_generator as gen
+import generation_limits
+import scene_index
+import scheduler
+import service
+
+# Rows warmed around the selected one
+AHEAD = 3
+BEHIND = 1
+# Rows warmed when a task is opened, about what the table shows before scrolling
+FIRST_PAGE = 10
+WORKERS = 2
+# Rendered prompts kept per session
+MAX_PROMPTS = 256
+# Speculative generations allowed per session; cache hits don't count
+SPECULATIVE_BUDGET = int(os.getenv("MWAHAHA_SPECULATIVE_BUDGET", "20"))
+
+def download_gif(url):
+    """Downloads a GIF into the cache and returns the local path (the URL on a non-200 reply). Raises on network errors.
+
+    Makes no Streamlit calls, so it is safe on worker threads.
+    """
+    if not url or not isinstance(url, str) or not url.startswith("http"):
+        return url
+
+    local_path = gen.gif_cache_path(url)
+
+    if os.path.exists(local_path):
+        return local_path
+
+    response = requests.get(url, stream=True, timeout=10)
+    if response.status_code != 200:
+        return url
+    # Write under a unique name first so concurrent downloads of one GIF never leave a partial file
+    tmp_path = f"{local_path}.{os.getpid()}.{time.time_ns()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        for chunk in response.iter_content(chunk_size=8192):
+            f.write(chunk)
+    os.replace(tmp_path, local_path)
+    return local_path
+
+def neighbors(index, total):
+    """Rows to warm after `index` is selected: the next AHEAD rows first, then the previous BEHIND."""
+    order = [index + k for k in range(1, AHEAD + 1)] + [index - k for k in range(1, BEHIND + 1)]
+    return [i for i in order if 0 <= i < total]
+
+class Prefetcher:
+    """Warms the caches of rows the user is likely to select next, on background threads.
+
+    For each row the GIF is downloaded and encoded and the prompt is rendered with the template
+    being edited. With speculative generation on, the row is also generated into the response
+    cache, so Test Prompt answers from it; at most `budget` requests per session are spent on that.
+    Work queued for an earlier selection is dropped once the selection moves.
+    """
+    def __init__(self, budget=SPECULATIVE_BUDGET):
+        self.budget = budget
+        self.spent = 0
+        self.warmed = 0
+        self._generation = 0
+        self._prompts = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="prefetch")
+
+    def prepare(self, row, filename, template_content, scene_descriptions=False, template_name=None):
+        """Returns (prompt, vision_url) for a row as Test Prompt sends it.
+
+        With scene descriptions on, a GIF with a stored description becomes a text-only prompt;
+        one without is sent as an image, so call gen.describe_media first to match a real run.
+        An empty `template_content` falls back to the saved template `template_name`.
+        """
+        user_input = gen.format_user_input(row, filename)
+        vision_url = row.get('url') if "task-b" in filename else None
+        description = scene_index.get_description(vision_url) if vision_url and scene_descriptions else None
+        if description:
+            user_input = scene_index.with_description(user_input, description)
+            vision_url = None
+        key = (filename, row['id'], template_name, hashlib.md5(template_content.encode()).hexdigest(), user_input)
+        with self._lock:
+            if key in self._prompts:
+                self._prompts.move_to_end(key)
+                return self._prompts[key], vision_url
+        prompt = gen.get_rendered_prompt(template_name, user_input, template_content=template_content)
+        with self._lock:
+            self._prompts[key] = prompt
+            while len(self._prompts) > MAX_PROMPTS:
+                self._prompts.popitem(last=False)
+        return prompt, vision_url
+
+    def schedule(self, df, indices, filename, template_content, scene_descriptions=False, gen_settings=None,
+                 template_name=None):
+        """Queues the rows at `indices` of `df`, replacing whatever was queued before.
+
+        `gen_settings` ({'model', 'api_key'}) turns on speculative generation with those settings.
+        """
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+        for i in indices:
+            self._executor.submit(self._warm, generation, df.iloc[i], filename, template_content, scene_descriptions,
+                                  gen_settings, template_name)
+
+    def _current(self, generation):
+        return generation == self._generation
+
+    def _warm(self, generation, row, filename, template_content, scene_descriptions, gen_settings, template_name):
+        if not self._current(generation):
+            return
+        try:
+            vision_url = row.get('url') if "task-b" in filename else None
+            if vision_url:
+                path = download_gif(vision_url)
+                # The service encodes in its own process
+                if path != vision_url and not service.available():
+                    gen.encode_image(path)
+            prompt, vision_url = self.prepare(row, filename, template_content, scene_descriptions, template_name)
+            if gen_settings and self._current(generation) and not (scene_descriptions and vision_url):
+                self._speculate(prompt, vision_url, filename, gen_settings)
+            with self._lock:
+                self.warmed += 1
+        except Exception as e:
+            # Best effort: the row is fetched normally when it is selected
+            print(f"[WARN] Prefetch of {row['id']} failed: {e}")
+
+    def _speculate(self, prompt, vision_url, filename, gen_settings):
+        with self._lock:
+            if self.spent >= self.budget:
+                return
+            self.spent += 1
+        stats = {}
+        # Bulk priority, so speculation never delays a request the user is waiting for
+        service.generate_humor(prompt, vision_url=vision_url, stats=stats, priority=scheduler.BULK, task=filename,
+                               **generation_limits.profile(filename), **gen_settings)
+        if stats.get('cached'):
+            with self._lock:
+                self.spent -= 1
@@ -0,0 +1,166 @@
+import os
+import time
+import cProfile
+import threading
+import contextvars
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+import config
+
+# "" (off), "stages" (stage timers and peak memory) or "cprofile" (stages plus a cProfile capture)
+MODE = os.getenv("MWAHAHA_PROFILE", "")
+if MODE == "1":
+    MODE = "stages"
+
+_lock = threading.Lock()
+_local = threading.local()
+# The run being profiled in this context; each run keeps its own timings, so concurrent runs
+# (two Streamlit sessions, service jobs) never mix
+_current = contextvars.ContextVar("profiling_run", default=None)
+# Runs in progress, and whether tracemalloc was started by them (and so is stopped after the last one)
+_active_runs = 0
+_owns_tracing = False
+
+class _Run:
+    def __init__(self, mode):
+        self.mode = mode
+        self.totals = defaultdict(float)
+        self.counts = defaultdict(int)
+        self.lock = threading.Lock()
+
+def enabled():
+    """Whether profiling is on for this process (MWAHAHA_PROFILE or --profile)."""
+    return MODE in ("stages", "cprofile")
+
+def bind(function):
+    """Wraps `function` to run in a copy of the current context, so a worker thread records into the caller's run."""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(function, *args, **kwargs)
+
+def profile_dir():
+    return os.path.join(config.RUNS_DIR, "profiles")
+
+def _stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+@contextmanager
+def stage(name):
+    """Times a pipeline stage. Nested stages are recorded under their parents, per thread. No-op outside a profiled run."""
+    current = _current.get()
+    if current is None:
+        yield
+        return
+    stack = _stack()
+    stack.append(name)
+    path = ";".join(stack)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stack.pop()
+        with current.lock:
+            current.totals[path] += elapsed
+            current.counts[path] += 1
+
+@contextmanager
+def run(name, label=None, enabled=None):
+    """Profiles one run (a task, a Streamlit action) and writes its report when it ends.
+
+    `enabled` turns profiling on or off for this run only; None follows MWAHAHA_PROFILE. Yields a
+    dict that is filled with 'report' and the written file paths afterwards. A run started inside
+    another run is timed as a stage of the outer one.
+    """
+    global _active_runs, _owns_tracing
+    result = {}
+    if enabled is None:
+        enabled = MODE in ("stages", "cprofile")
+    if not enabled:
+        yield result
+        return
+    if _current.get() is not None:
+        with stage(name):
+            yield result
+        return
+
+    current = _Run(MODE if MODE in ("stages", "cprofile") else "stages")
+    with _lock:
+        # tracemalloc is process wide: the first of overlapping runs starts it and the last one stops it,
+        # so the peak of an overlapping run covers the others too
+        if _active_runs == 0:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                _owns_tracing = True
+            tracemalloc.reset_peak()
+        _active_runs += 1
+    profiler = cProfile.Profile() if current.mode == "cprofile" else None
+    token = _current.set(current)
+    if profiler:
+        profiler.enable()
+    try:
+        with stage(name):
+            yield result
+    finally:
+        if profiler:
+            profiler.disable()
+        _current.reset(token)
+        with _lock:
+            _, peak = tracemalloc.get_traced_memory()
+            _active_runs -= 1
+            if _active_runs == 0 and _owns_tracing:
+                tracemalloc.stop()
+                _owns_tracing = False
+        result.update(_write(name, label, current, peak, profiler))
+        print(result['report'])
+
+def _self_times(totals):
+    """Time spent in each stage outside its child stages."""
+    self_times = dict(totals)
+    for path, total in totals.items():
+        parent = path.rpartition(";")[0]
+        if parent in self_times:
+            self_times[parent] -= total
+    return self_times
+
+def format_report(name, label, totals, counts, peak):
+    self_times = _self_times(totals)
+    wall = totals.get(name, 0.0)
+    title = f"{name} {label}" if label else name
+    lines = [f"Profile: {title}  wall {wall:.2f}s  peak traced memory {peak / 2**20:.1f} MB",
+             f"  {'stage':<34} {'calls':>7} {'total':>9} {'mean':>9} {'self':>9} {'%wall':>6}"]
+
+    def walk(path, depth):
+        label_ = "  " * depth + path.rpartition(";")[2]
+        share = totals[path] / wall * 100 if wall else 0.0
+        lines.append(f"  {label_:<34} {counts[path]:>7} {totals[path]:>8.3f}s {totals[path] / counts[path]:>8.4f}s "
+                     f"{self_times[path]:>8.3f}s {share:>5.1f}%")
+        children = [p for p in totals if p.rpartition(";")[0] == path]
+        for child in sorted(children, key=totals.get, reverse=True):
+            walk(child, depth + 1)
+
+    # Stages run on worker threads (see bind) show up as separate roots
+    for root in sorted((p for p in totals if ";" not in p), key=totals.get, reverse=True):
+        walk(root, 0)
+    return "\n".join(lines)
+
+def _write(name, label, current, peak, profiler):
+    with current.lock:
+        totals, counts = dict(current.totals), dict(current.counts)
+    report = format_report(name, label, totals, counts, peak)
+    os.makedirs(profile_dir(), exist_ok=True)
+    base = os.path.join(profile_dir(), "-".join(filter(None, [name, label, time.strftime('%Y%m%d-%H%M%S')])))
+    with open(base + ".txt", "w", encoding="utf-8") as f:
+        f.write(report + "\n")
+    # Collapsed stacks (one "a;b;c microseconds" line per stage) for flamegraph.pl, speedscope or inferno
+    with open(base + ".folded", "w", encoding="utf-8") as f:
+        for path, seconds in sorted(_self_times(totals).items()):
+            if seconds > 0:
+                f.write(f"{path} {int(seconds * 1e6)}\n")
+    result = {'report': report, 'report_path': base + ".txt", 'folded_path': base + ".folded"}
+    if profiler:
+        profiler.dump_stats(base + ".prof")
+        result['prof_path'] = base + ".prof"
+    return result
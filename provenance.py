@@ -0,0 +1,71 @@
+import os
+import json
+import inspect
+import hashlib
+import tempfile
+import config
+
+def provenance_path(filename):
+    """Sidecar of a task's output (e.g. output/provenance/task-b1.json); the output TSV itself stays id/text only."""
+    return os.path.join(config.OUTPUT_DIR, "provenance", os.path.splitext(os.path.basename(filename))[0] + ".json")
+
+def digest(value):
+    payload = json.dumps(value, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+def source_hash(*functions):
+    """Version of a set of rules, taken from their source code, so editing a rule changes it automatically."""
+    return digest([inspect.getsource(function) for function in functions])
+
+def row_hash(row):
+    return digest({column: str(value) for column, value in dict(row).items()})
+
+def template_hash(template_name):
+    with open(os.path.join(config.TEMPLATE_DIR, template_name), "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+def fingerprint(row, template_digest, params):
+    """Identifies everything a generated row depends on: its input fields, the template and the generation parameters."""
+    return digest([row_hash(row), template_digest, params])
+
+def load(filename):
+    """Returns {id: {'generation', 'postprocess', 'raw'}} for a task; empty if nothing was recorded."""
+    try:
+        with open(provenance_path(filename), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def save(filename, records):
+    path = provenance_path(filename)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # A unique temp file, so concurrent saves from any thread or process never write the same one
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(records, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+def update(records, rows, texts, template_digest, params, postprocess=None):
+    """Adds the provenance of freshly generated rows to `records`, in memory. See `record`."""
+    for _, row in rows.iterrows():
+        text = texts.get(row['id'])
+        if isinstance(text, str) and text.strip() and not text.startswith("ERROR"):
+            records[row['id']] = {'generation': fingerprint(row, template_digest, params), 'postprocess': postprocess,
+                                  'raw': text}
+        else:
+            records.pop(row['id'], None)
+    return records
+
+def record(filename, rows, texts, template_name, params, postprocess=None, replace=False):
+    """Stores the provenance of freshly generated rows. `texts` maps id to the generator's output.
+
+    ERROR and empty outputs are not recorded, so a build treats them as stale. With `replace`
+    the task's earlier records are dropped (the whole output was rewritten).
+    """
+    records = {} if replace else load(filename)
+    update(records, rows, texts, template_hash(template_name), params, postprocess)
+    save(filename, records)
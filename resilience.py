@@ -0,0 +1,172 @@
+import os
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED, TimeoutError as FutureTimeout
+import client_pool
+import run_log
+
+# Hedging is opt-in because every hedge is a second paid request
+HEDGING = os.getenv("MWAHAHA_HEDGE") == "1"
+# At most this share of requests may be duplicated
+HEDGE_RATE = 0.05
+# Deadline = DEADLINE_FACTOR x the task's observed p95, clamped; the pool timeout until there is history
+DEADLINE_FACTOR = 4
+MIN_DEADLINE = 10.0
+MAX_DEADLINE = client_pool.TIMEOUT
+MIN_SAMPLES = 20
+PROFILE_TTL = 300
+# Circuit breaker: opens when half of the last 20 calls (at least 10) failed upstream
+BREAKER_WINDOW = 20
+BREAKER_MIN_CALLS = 10
+BREAKER_THRESHOLD = 0.5
+BREAKER_COOLDOWN = 30
+BREAKER_MAX_COOLDOWN = 300
+# How often one request is retried after a pause before its row becomes an ERROR
+BREAKER_RETRIES = 3
+
+_profiles = {}
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hedge")
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def latency_profile(task, vision=False):
+    """Returns (p95, deadline) in seconds for single-row requests of a task; p95 is None without enough history."""
+    if task is None:
+        return None, MAX_DEADLINE
+    now = time.time()
+    cached = _profiles.get((task, vision))
+    if cached and now - cached[0] < PROFILE_TTL:
+        return cached[1]
+    latencies = [r['latency'] for r in run_log.load(task)
+                 if r.get('latency') and not r.get('packed') and not r.get('hedged') and bool(r.get('vision')) == vision]
+    if len(latencies) < MIN_SAMPLES:
+        profile = (None, MAX_DEADLINE)
+    else:
+        p95 = percentile(latencies, 0.95)
+        profile = (p95, max(MIN_DEADLINE, min(MAX_DEADLINE, DEADLINE_FACTOR * p95)))
+    _profiles[(task, vision)] = (now, profile)
+    return profile
+
+def is_upstream_error(error):
+    """Connection failures, timeouts, rate limits and 5xx responses; not errors caused by the request itself."""
+    import openai
+    if isinstance(error, openai.APIConnectionError):
+        return True
+    status = getattr(error, 'status_code', None)
+    return status is not None and (status == 429 or status >= 500)
+
+class HedgeBudget:
+    def __init__(self, rate=HEDGE_RATE):
+        self.rate = rate
+        self.calls = 0
+        self.hedges = 0
+        self._lock = threading.Lock()
+
+    def count_call(self):
+        with self._lock:
+            self.calls += 1
+
+    def take(self):
+        """Returns True (and counts the hedge) if another hedge keeps the hedge rate within its cap."""
+        with self._lock:
+            if self.hedges + 1 > self.rate * self.calls + 1:
+                return False
+            self.hedges += 1
+            return True
+
+class CircuitBreaker:
+    """Pauses callers while the upstream error rate is too high.
+
+    After the cooldown the next call is a trial: success closes the breaker, failure reopens it
+    with twice the cooldown.
+    """
+    def __init__(self, window=BREAKER_WINDOW, min_calls=BREAKER_MIN_CALLS, threshold=BREAKER_THRESHOLD,
+                 cooldown=BREAKER_COOLDOWN, max_cooldown=BREAKER_MAX_COOLDOWN):
+        self.outcomes = deque(maxlen=window)
+        self.min_calls = min_calls
+        self.threshold = threshold
+        self.base_cooldown = cooldown
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def is_open(self):
+        return self.opened_at is not None
+
+    def record(self, ok):
+        with self._lock:
+            if self.opened_at is not None:
+                if ok:
+                    print("[INFO] Upstream recovered; resuming.")
+                    self.opened_at = None
+                    self.cooldown = self.base_cooldown
+                    self.outcomes.clear()
+                else:
+                    self.opened_at = time.time()
+                    self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+                    print(f"[WARN] Upstream still failing; pausing {self.cooldown:.0f}s.")
+                return
+            self.outcomes.append(ok)
+            failures = self.outcomes.count(False)
+            if len(self.outcomes) >= self.min_calls and failures / len(self.outcomes) >= self.threshold:
+                self.opened_at = time.time()
+                print(f"[WARN] {failures}/{len(self.outcomes)} recent requests failed upstream; pausing {self.cooldown:.0f}s.")
+
+    def wait(self):
+        with self._lock:
+            remaining = self.opened_at + self.cooldown - time.time() if self.opened_at is not None else 0
+        if remaining > 0:
+            time.sleep(remaining)
+
+budget = HedgeBudget()
+breaker = CircuitBreaker()
+
+def _hedged(request, deadline, hedge_after, stats):
+    first = _executor.submit(request, deadline)
+    try:
+        return first.result(timeout=hedge_after)
+    except FutureTimeout:
+        pass
+    if not budget.take():
+        # The request's own timeout bounds this wait
+        return first.result()
+    if stats is not None:
+        stats['hedged'] = True
+    second = _executor.submit(request, max(MIN_DEADLINE, deadline - hedge_after))
+    done, pending = wait([first, second], return_when=FIRST_COMPLETED)
+    for future in done:
+        if future.exception() is None:
+            return future.result()
+    # Whichever finished first failed; the other one decides
+    for future in pending:
+        return future.result()
+    return first.result()
+
+def call(request, task=None, vision=False, stats=None):
+    """Runs `request(timeout)` under the task's deadline, with an optional hedge and the circuit breaker.
+
+    If a failure trips the breaker, the call waits out the pause and is retried instead of
+    returning an error for the row. Other errors are raised unchanged.
+    """
+    hedge_after, deadline = latency_profile(task, vision)
+    for attempt in range(BREAKER_RETRIES + 1):
+        breaker.wait()
+        budget.count_call()
+        try:
+            if HEDGING and hedge_after:
+                result = _hedged(request, deadline, hedge_after, stats)
+            else:
+                result = request(deadline)
+        except Exception as e:
+            if not is_upstream_error(e):
+                raise
+            breaker.record(False)
+            if attempt == BREAKER_RETRIES or not breaker.is_open():
+                raise
+            continue
+        breaker.record(True)
+        return result
@@ -0,0 +1,53 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+import config
+
+RESPONSE_CACHE_DIR = config.RESPONSE_CACHE_DIR
+
+def cache_key(model, system_prompt, prompt, media=None, max_tokens=300, json_mode=False, stop=None, row_id=None):
+    """Fingerprint of everything that determines a request. `media` identifies the image, if any.
+
+    `row_id` makes the key per row, so rows whose requests are identical (B1 rows sharing a GIF)
+    each get their own sample instead of one cached caption.
+    """
+    fields = [model, system_prompt, prompt, media, max_tokens, json_mode]
+    # Only appended when set, so keys of requests without them are unchanged
+    if stop:
+        fields.append(stop)
+    if row_id is not None:
+        fields.append(['row', str(row_id)])
+    payload = json.dumps(fields, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _path(key):
+    return os.path.join(RESPONSE_CACHE_DIR, key[:2], f"{key}.json")
+
+def get(key):
+    """Returns the cached reply text for a key, or None."""
+    try:
+        with open(_path(key), "r", encoding="utf-8") as f:
+            return json.load(f)['text']
+    except (OSError, json.JSONDecodeError, KeyError):
+        return None
+
+def put(key, text, **meta):
+    """Stores a successful reply. Writes are atomic so concurrent readers never see partial files.
+
+    Never raises: a reply that could not be cached is still a good reply.
+    """
+    path = _path(key)
+    tmp_path = None
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # A unique temp file per write, so concurrent puts from any thread or process never share one
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({'text': text, 'ts': time.time(), **meta}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"[WARN] Could not write response cache entry {key[:12]}: {e}")
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
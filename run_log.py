@@ -0,0 +1,31 @@
+import os
+import json
+import config
+
+RUNS_DIR = config.RUNS_DIR
+
+def log_path(filename):
+    """Returns the JSONL run log path for a task file (e.g. task-b1.tsv -> runs/task-b1.jsonl)."""
+    return os.path.join(RUNS_DIR, os.path.splitext(os.path.basename(filename))[0] + ".jsonl")
+
+def append(filename, record):
+    os.makedirs(RUNS_DIR, exist_ok=True)
+    with open(log_path(filename), "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+def load(filename):
+    """Returns every record logged for a task, oldest first. Unreadable lines are skipped."""
+    path = log_path(filename)
+    if not os.path.exists(path):
+        return []
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return records
@@ -0,0 +1,89 @@
+import os
+import re
+import json
+import time
+import hashlib
+import tempfile
+import threading
+import config
+
+INDEX_PATH = os.path.join(config.CACHE_DIR, "scene_descriptions.json")
+
+DESCRIBE_PROMPT = """Describe this GIF for a comedy writer who cannot see it.
+Cover the setting, who or what appears, what happens across the frames, facial expressions and body language, the overall mood, and any visible text.
+Be factual and specific, do not make jokes, and keep it under 100 words."""
+
+# Changing the describe prompt invalidates every stored description
+PROMPT_VERSION = hashlib.md5(DESCRIBE_PROMPT.encode()).hexdigest()[:8]
+
+_index = None
+# Guards _index and the index file against the other threads of this process
+_lock = threading.Lock()
+
+def media_key(url):
+    """Identifies the underlying media of a URL, so Giphy renditions of the same GIF share one entry."""
+    match = re.search(r'giphy\.com/media/(?:v1\.[^/]+/)?([A-Za-z0-9]+)/[^/]+$', url)
+    if match:
+        return f"giphy:{match.group(1)}"
+    return "url:" + hashlib.md5(url.encode()).hexdigest()
+
+def _read_file():
+    if not os.path.exists(INDEX_PATH):
+        return {}
+    try:
+        with open(INDEX_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+def load_index():
+    global _index
+    with _lock:
+        if _index is None:
+            _index = _read_file()
+        return _index
+
+def save_index():
+    """Writes the index, merged with whatever other processes (queue workers) stored since it was read.
+
+    Of two entries for the same media the newer one wins. Never raises: a description that could
+    not be saved is described again next time.
+    """
+    tmp_path = None
+    with _lock:
+        try:
+            for key, entry in _read_file().items():
+                if key not in _index or entry.get('ts', 0) > _index[key].get('ts', 0):
+                    _index[key] = entry
+            os.makedirs(os.path.dirname(INDEX_PATH), exist_ok=True)
+            # A unique temp file per write, so concurrent saves from any thread or process never share one
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(INDEX_PATH), suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(_index, f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, INDEX_PATH)
+        except OSError as e:
+            print(f"[WARN] Could not save the scene index: {e}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+def get_description(url):
+    entry = load_index().get(media_key(url))
+    if entry and entry.get('prompt_version') == PROMPT_VERSION:
+        return entry['description']
+    return None
+
+def put_description(url, description, model):
+    index = load_index()
+    with _lock:
+        index[media_key(url)] = {
+            'description': description,
+            'url': url,
+            'model': model,
+            'prompt_version': PROMPT_VERSION,
+            'ts': time.time()
+        }
+    save_index()
+
+def with_description(user_input, description):
+    """Appends a stored scene description to a Task B user_input for a text-only request."""
+    return f"{user_input}\n\nGIF description (the GIF itself is not attached): {description}"
@@ -0,0 +1,97 @@
+import os
+import time
+import socket
+import itertools
+import threading
+from collections import Counter
+from contextlib import contextmanager
+import config
+
+# Priority classes, highest first
+INTERACTIVE = 0
+REGENERATE = 1
+BULK = 2
+
+# Requests in flight per process
+MAX_IN_FLIGHT = int(os.getenv("MWAHAHA_MAX_IN_FLIGHT", "8"))
+POLL_SECONDS = 0.2
+# Lower classes wait at most this long for higher ones, so a stuck editor can't stall a batch forever
+MAX_YIELD = 60
+# Markers left behind by crashed processes are ignored after this long
+STALE_SECONDS = 180
+
+def signal_dir():
+    """Directory of in-flight markers; shared by every process that uses the same queue directory."""
+    return os.path.join(config.QUEUE_DIR, "priority")
+
+def _higher_priority_active(priority):
+    try:
+        names = os.listdir(signal_dir())
+    except FileNotFoundError:
+        return False
+    now = time.time()
+    for name in names:
+        if not (name.startswith("p") and name[1:2].isdigit()) or int(name[1]) >= priority:
+            continue
+        try:
+            if now - os.path.getmtime(os.path.join(signal_dir(), name)) < STALE_SECONDS:
+                return True
+        except FileNotFoundError:
+            continue
+    return False
+
+def yield_to_higher(priority):
+    """Blocks while a request of a higher class is in flight in any process (up to MAX_YIELD seconds)."""
+    deadline = time.time() + MAX_YIELD
+    while _higher_priority_active(priority) and time.time() < deadline:
+        time.sleep(POLL_SECONDS)
+
+class Scheduler:
+    """Hands out request slots in priority order, and within a class to the task served least so far."""
+    def __init__(self, slots=MAX_IN_FLIGHT):
+        self.slots = slots
+        self.in_flight = 0
+        self.served = Counter()
+        self._waiting = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def _next(self):
+        return min(self._waiting, key=lambda t: (t[0], self.served[t[1]], t[2]))
+
+    @contextmanager
+    def slot(self, priority=BULK, task=None):
+        # Check other processes first so a yielding request doesn't hold one of this process's slots
+        yield_to_higher(priority)
+        ticket = (priority, task, next(self._seq))
+        with self._cond:
+            self._waiting.append(ticket)
+            while self.in_flight >= self.slots or self._next() is not ticket:
+                self._cond.wait()
+            self._waiting.remove(ticket)
+            self.in_flight += 1
+            self.served[task] += 1
+            self._cond.notify_all()
+
+        marker = None
+        if priority < BULK:
+            os.makedirs(signal_dir(), exist_ok=True)
+            marker = os.path.join(signal_dir(), f"p{priority}-{socket.gethostname()}-{os.getpid()}-{ticket[2]}")
+            open(marker, "w").close()
+        try:
+            yield
+        finally:
+            if marker:
+                try:
+                    os.remove(marker)
+                except FileNotFoundError:
+                    pass
+            with self._cond:
+                self.in_flight -= 1
+                self._cond.notify_all()
+
+_scheduler = Scheduler()
+
+def slot(priority=BULK, task=None):
+    """Context manager around one API request: waits for higher-priority work, then for a free slot."""
+    return _scheduler.slot(priority, task)
@@ -0,0 +1,317 @@
+"""Local generation service: one long-running process that owns the API clients, key pool, caches,
+scheduler and run logs, so Streamlit sessions and CLI runs share warm connections and one
+throughput budget.
+
+    python mwahaha.py serve                # listens on 127.0.0.1:8765 (MWAHAHA_SERVICE_URL)
+
+The client functions at the bottom use the service when it is running and fall back to
+generating in-process when it is not.
+"""
+import os
+import json
+import time
+import uuid
+import threading
+import urllib.request
+from urllib.parse import urlparse, parse_qs
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import config
+import client_pool
+
+SERVICE_URL = os.getenv("MWAHAHA_SERVICE_URL", "http://127.0.0.1:8765")
+# Whole-task jobs run side by side; their requests still share the scheduler's slots
+JOB_WORKERS = 4
+# Finished jobs kept for status queries
+KEEP_FINISHED = 100
+# Longest a progress query blocks waiting for a change
+MAX_WAIT = 30
+# How long a health check result is trusted by clients
+AVAILABILITY_TTL = 5
+# Client-side limit for one remote generation: the HTTP timeout plus time queued behind other users
+REMOTE_TIMEOUT = client_pool.TIMEOUT * 3
+
+# --- Server ---
+
+class Job:
+    def __init__(self, kind, params):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.params = params
+        self.state = "queued"
+        self.done = 0
+        self.total = None
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+
+    def snapshot(self):
+        # Never echo the API key back
+        params = {k: v for k, v in self.params.items() if k != 'api_key'}
+        return {'id': self.id, 'kind': self.kind, 'params': params, 'state': self.state, 'done': self.done,
+                'total': self.total, 'result': self.result, 'error': self.error, 'created': self.created,
+                'finished': self.finished}
+
+class JobStore:
+    def __init__(self, workers=JOB_WORKERS):
+        self.jobs = {}
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+
+    def submit(self, kind, params):
+        if kind not in RUNNERS:
+            raise ValueError(f"unknown job kind: {kind}")
+        job = Job(kind, params)
+        with self._cond:
+            self.jobs[job.id] = job
+            finished = sorted((j for j in self.jobs.values() if j.finished), key=lambda j: j.finished)
+            for old in finished[:max(0, len(finished) - KEEP_FINISHED)]:
+                del self.jobs[old.id]
+        self._executor.submit(self._run, job)
+        return job
+
+    def snapshots(self):
+        with self._cond:
+            return sorted((job.snapshot() for job in self.jobs.values()), key=lambda j: j['created'])
+
+    def update(self, job, **fields):
+        with self._cond:
+            for name, value in fields.items():
+                setattr(job, name, value)
+            self._cond.notify_all()
+
+    def _run(self, job):
+        self.update(job, state="running")
+        try:
+            result = RUNNERS[job.kind](job, self)
+            self.update(job, state="done", result=result, finished=time.time())
+        except Exception as e:
+            print(f"[ERROR] Job {job.id} ({job.kind}) failed: {e}")
+            self.update(job, state="failed", error=str(e), finished=time.time())
+
+    def wait(self, job_id, done=None, timeout=0):
+        """Returns the job once its progress differs from `done` or it has finished, waiting up to `timeout` seconds."""
+        with self._cond:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            self._cond.wait_for(lambda: job.done != done or job.finished is not None, timeout=min(timeout, MAX_WAIT))
+            return job.snapshot()
+
+def _run_task(job, store):
+    import dataset
+    import baseline_generator as gen
+    p = job.params
+    total = len(dataset.load_input(p['filename'], ['id']))
+    store.update(job, total=min(total, p['limit']) if p.get('limit') else total)
+    gen.process_task(p['filename'], p.get('template_name') or config.TASK_TEMPLATES[p['filename']], limit=p.get('limit'),
+                     pack_size=p.get('pack_size'), scene_descriptions=p.get('scene_descriptions', False),
+                     model=p.get('model'), api_key=p.get('api_key'), on_progress=lambda n: store.update(job, done=n))
+    return {'rows': job.total, 'output': os.path.join(config.OUTPUT_DIR, p['filename'])}
+
+def _run_regenerate(job, store):
+    import baseline_generator as gen
+    p = job.params
+    rows = gen.regenerate(p['filename'], p.get('template_name') or config.TASK_TEMPLATES[p['filename']], ids=p.get('ids'),
+                          model=p.get('model'), api_key=p.get('api_key'))
+    return {'rows': rows}
+
+def _run_build(job, store):
+    import build
+    p = job.params
+    plan = build.build(p['filename'], model=p.get('model'), scene_descriptions=p.get('scene_descriptions', False),
+                       pack_size=p.get('pack_size'), api_key=p.get('api_key'))
+    return {'stale': len(plan['stale']), 'cleanup': len(plan['cleanup']), 'fresh': len(plan['fresh'])}
+
+RUNNERS = {'task': _run_task, 'regenerate': _run_regenerate, 'build': _run_build}
+
+class Handler(BaseHTTPRequestHandler):
+    store = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        parts = url.path.strip("/").split("/")
+        if url.path == "/health":
+            self._send(200, {'ok': True, 'pid': os.getpid(), 'output_dir': config.OUTPUT_DIR})
+        elif parts == ["jobs"]:
+            self._send(200, self.store.snapshots())
+        elif len(parts) == 2 and parts[0] == "jobs":
+            done = int(query['done'][0]) if 'done' in query else None
+            snapshot = self.store.wait(parts[1], done, float(query.get('wait', [0])[0]))
+            if snapshot is None:
+                self._send(404, {'error': "no such job"})
+            else:
+                self._send(200, snapshot)
+        else:
+            self._send(404, {'error': "not found"})
+
+    def do_POST(self):
+        try:
+            payload = self._body()
+            if self.path == "/jobs":
+                job = self.store.submit(payload.pop('kind'), payload)
+                self._send(202, job.snapshot())
+            elif self.path == "/generate":
+                self._generate(payload)
+            else:
+                self._send(404, {'error': "not found"})
+        except (KeyError, TypeError, ValueError) as e:
+            self._send(400, {'error': str(e)})
+
+    def _generate(self, payload):
+        """One prompt. With "stream": true the reply is newline-delimited JSON: {"delta"} lines, then {"stats"}.
+
+        A bad payload is a 400. Once the stream has started, an error ends it with an {"error"} line.
+        """
+        import baseline_generator as gen
+        stats = {}
+        if not payload.pop('stream', False):
+            text = gen.generate_humor(payload.pop('prompt'), stats=stats, **payload)
+            self._send(200, {'text': text, 'stats': stats})
+            return
+        # Binds the arguments (a TypeError here is still a 400); the request itself starts on the first delta
+        deltas = gen.generate_humor(payload.pop('prompt'), stats=stats, stream=True, **payload)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        try:
+            for delta in deltas:
+                self.wfile.write((json.dumps({'delta': delta}, ensure_ascii=False) + "\n").encode("utf-8"))
+                self.wfile.flush()
+            message = {'stats': stats}
+        except Exception as e:
+            message = {'error': str(e)}
+        self.wfile.write((json.dumps(message, default=str) + "\n").encode("utf-8"))
+
+def serve(url=SERVICE_URL):
+    """Runs the service until interrupted. Binds to the host in `url`, which should stay a loopback address."""
+    import baseline_generator  # noqa: F401  (load clients, templates and caches before the first request)
+    address = urlparse(url)
+    Handler.store = JobStore()
+    server = ThreadingHTTPServer((address.hostname, address.port), Handler)
+    server.daemon_threads = True
+    print(f"[SUCCESS] Generation service listening on {url} (pid {os.getpid()})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+# --- Client ---
+
+_available = {'checked': 0.0, 'ok': False}
+
+def _request(method, path, payload=None, timeout=None):
+    data = json.dumps(payload).encode("utf-8") if payload is not None else None
+    request = urllib.request.Request(SERVICE_URL + path, data=data, method=method,
+                                     headers={"Content-Type": "application/json"})
+    return urllib.request.urlopen(request, timeout=timeout)
+
+def available():
+    """True if the service answers a health check and writes to the same output directory as this process."""
+    now = time.time()
+    if now - _available['checked'] > AVAILABILITY_TTL:
+        try:
+            with _request("GET", "/health", timeout=0.5) as response:
+                health = json.load(response)
+            _available['ok'] = health.get('output_dir') == config.OUTPUT_DIR
+        except (OSError, ValueError):
+            _available['ok'] = False
+        _available['checked'] = now
+    return _available['ok']
+
+def submit(kind, **params):
+    """Queues a job ('task', 'regenerate' or 'build') and returns its snapshot."""
+    with _request("POST", "/jobs", dict(params, kind=kind), timeout=10) as response:
+        return json.load(response)
+
+def jobs():
+    with _request("GET", "/jobs", timeout=10) as response:
+        return json.load(response)
+
+def watch(job_id):
+    """Yields the job's snapshot every time its progress changes, ending with the finished job."""
+    done = None
+    while True:
+        with _request("GET", f"/jobs/{job_id}?wait={MAX_WAIT}" + (f"&done={done}" if done is not None else ""),
+                      timeout=MAX_WAIT + 10) as response:
+            snapshot = json.load(response)
+        if snapshot['done'] != done or snapshot['finished']:
+            yield snapshot
+        done = snapshot['done']
+        if snapshot['finished']:
+            return
+
+def run_task(filename, template_name, limit=None, pack_size=None, scene_descriptions=False, model=None, api_key=None,
+             on_progress=None, local=False):
+    """Generates a whole task on the service (or in this process if it is not running) and waits for it.
+
+    `on_progress` is called with the number of finished rows, like in `generate_rows`.
+    """
+    if local or not available():
+        import baseline_generator as gen
+        return gen.process_task(filename, template_name, limit=limit, pack_size=pack_size,
+                                scene_descriptions=scene_descriptions, model=model, api_key=api_key, on_progress=on_progress)
+    job = submit('task', filename=filename, template_name=template_name, limit=limit, pack_size=pack_size,
+                 scene_descriptions=scene_descriptions, model=model, api_key=api_key)
+    print(f"Submitted {filename} to the generation service (job {job['id']})")
+    shown = None
+    for snapshot in watch(job['id']):
+        if snapshot['done'] == shown:
+            continue
+        shown = snapshot['done']
+        if on_progress:
+            on_progress(snapshot['done'])
+        else:
+            print(f"  {filename}: {snapshot['done']}/{snapshot['total'] or '?'} rows")
+    if snapshot['state'] == "failed":
+        raise RuntimeError(f"job {job['id']} failed: {snapshot['error']}")
+    return snapshot
+
+def generate_humor(prompt, stream=False, stats=None, **kwargs):
+    """Same as baseline_generator.generate_humor, served by the service when it is running."""
+    if not available():
+        import baseline_generator as gen
+        return gen.generate_humor(prompt, stream=stream, stats=stats, **kwargs)
+    if stream:
+        return _stream_remote(prompt, stats, kwargs)
+    try:
+        with _request("POST", "/generate", dict(kwargs, prompt=prompt), timeout=REMOTE_TIMEOUT) as response:
+            reply = json.load(response)
+    except (OSError, ValueError) as e:
+        return f"ERROR: generation service: {e}"
+    if stats is not None:
+        stats.update(reply['stats'])
+    return reply['text']
+
+def _stream_remote(prompt, stats, kwargs):
+    try:
+        with _request("POST", "/generate", dict(kwargs, prompt=prompt, stream=True), timeout=REMOTE_TIMEOUT) as response:
+            for line in response:
+                message = json.loads(line)
+                if 'delta' in message:
+                    yield message['delta']
+                elif 'error' in message:
+                    yield f"ERROR: generation service: {message['error']}"
+                elif stats is not None:
+                    stats.update(message['stats'])
+    except (OSError, ValueError) as e:
+        yield f"ERROR: generation service: {e}"
@@ -1,50 +1,48 @@
 import streamlit as st
 import pandas as pd
 import os
+import time
+import random
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import baseline_generator as gen
-import requests
-import hashlib
+import config
+import dataset
+import cost_estimator
+import scene_index
+import scheduler
+import profiling
+import model_router
+import backends
+import packing
+import generation_limits
+import key_pool
+import service
+import prefetch
+import compliance
+import template_eval
 from pathlib import Path
 from jinja2 import Environment
 
 st.set_page_config(page_title="MWAHAHA Interactive Visualizer", layout="wide")
 
-DATA_DIR = "data"
-OUTPUT_DIR = "output"
-TEMPLATE_DIR = "templates"
-CACHE_DIR = "gif_cache"
+DATA_DIR = config.DATA_DIR
+OUTPUT_DIR = config.OUTPUT_DIR
+TEMPLATE_DIR = config.TEMPLATE_DIR
+CACHE_DIR = config.CACHE_DIR
+
+# Rows generated at once by the Multi-Row Test
+MULTI_TEST_WORKERS = scheduler.MAX_IN_FLIGHT
+MULTI_TEST_MAX_ROWS = 100
 
 # Create cache directory if it doesn't exist
 os.makedirs(CACHE_DIR, exist_ok=True)
 
 def get_cached_gif(url):
     """Downloads a GIF and returns the local path. Returns the URL if download fails."""
-    if not url or not isinstance(url, str) or not url.startswith("http"):
-        return url
-    
-    # Create hash of URL for unique filename
-    url_hash = hashlib.md5(url.encode()).hexdigest()
-    # Try to guess extension or default to .gif
-    ext = os.path.splitext(url)[1]
-    if not ext or len(ext) > 5:
-        ext = ".gif"
-    
-    local_filename = f"{url_hash}{ext}"
-    local_path = os.path.join(CACHE_DIR, local_filename)
-    
-    if os.path.exists(local_path):
-        return local_path
-    
     try:
-        response = requests.get(url, stream=True, timeout=10)
-        if response.status_code == 200:
-            with open(local_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-            return local_path
+        return prefetch.download_gif(url)
     except Exception as e:
         st.warning(f"Failed to cache GIF: {e}")
-    
     return url
 
 def load_template(filename):
@@ -60,9 +58,115 @@ def save_template(filename, content):
         f.write(content)
     st.success(f"Saved to {filename}")
 
+def test_row(row, filename, template_content, scene_descriptions, gen_settings):
+    """Generates one Multi-Row Test output with the edited template. Runs on a worker thread, so no Streamlit calls."""
+    user_input = gen.format_user_input(row, filename)
+    vision_url = row.get('url') if "task-b" in filename else None
+    if vision_url:
+        try:
+            prefetch.download_gif(vision_url)
+        except Exception:
+            pass  # generate_humor sends the URL instead
+    if vision_url and scene_descriptions:
+        description = gen.describe_media(vision_url, priority=scheduler.INTERACTIVE, **gen_settings)
+        if description:
+            user_input = scene_index.with_description(user_input, description)
+            vision_url = None
+    prompt = gen.get_rendered_prompt(None, user_input, template_content=template_content)
+    stats = {}
+    start = time.time()
+    text = service.generate_humor(prompt, vision_url=vision_url, stats=stats, priority=scheduler.INTERACTIVE, task=filename,
+                              **generation_limits.profile(filename), **gen_settings)
+    return gen.clean_output(text), time.time() - start, stats.get('cached', False)
+
+def flags(text, filename, row):
+    problems = compliance.violations(text, filename, row)
+    return ", ".join(problems) if problems else "✓"
+
+def multi_row_panel(display_df, filename, selected_rows, scene_descriptions, gen_settings, profile_actions=False):
+    """Runs the edited template on many rows at once and compares the results with the saved outputs."""
+    st.markdown("### 🧪 Multi-Row Test")
+    c1, c2, c3 = st.columns([2, 1, 1])
+    source = c1.radio("Rows", ["Selected rows", "Random N", "Stratified N"], horizontal=True,
+                      help="Stratified N samples evenly across prompt shapes (word pair/headline, blank/open prompt).")
+    n = c2.number_input("N", min_value=1, max_value=MULTI_TEST_MAX_ROWS, value=10, disabled=source == "Selected rows")
+    if c3.button("🚀 Test Rows", use_container_width=True):
+        if source == "Selected rows":
+            rows = [display_df.iloc[i] for i in selected_rows[:MULTI_TEST_MAX_ROWS]]
+        elif source == "Random N":
+            rows = [row for _, row in display_df.sample(min(n, len(display_df))).iterrows()]
+        else:
+            rows = template_eval.stratified_sample(display_df, filename, n, seed=random.randrange(2**32))
+
+        records = []
+        for row in rows:
+            saved = row.get('text')
+            saved = saved if isinstance(saved, str) and saved else ""
+            records.append({'id': row['id'], 'saved': saved, 'saved_flags': flags(saved, filename, row) if saved else "",
+                            'new': "…", 'new_flags': "", 'latency': None, 'cached': False})
+        grid = st.empty()
+        progress = st.progress(0.0, text=f"Testing {len(rows)} rows...")
+        template_content = st.session_state.template_content
+        with profiling.run("multi_test", os.path.splitext(filename)[0], enabled=profile_actions) as profile:
+            with ThreadPoolExecutor(max_workers=MULTI_TEST_WORKERS) as pool:
+                futures = {pool.submit(profiling.bind(test_row), row, filename, template_content, scene_descriptions, gen_settings): i
+                           for i, row in enumerate(rows)}
+                # Results fill in as they finish, in whatever order that is
+                for done, future in enumerate(as_completed(futures), 1):
+                    i = futures[future]
+                    try:
+                        text, latency, cached = future.result()
+                    except Exception as e:
+                        # e.g. a syntax error in the edited template
+                        text, latency, cached = f"ERROR: {e}", None, False
+                    records[i].update({'new': text, 'new_flags': flags(text, filename, rows[i]), 'latency': latency,
+                                       'cached': cached})
+                    grid.dataframe(pd.DataFrame(records), hide_index=True, use_container_width=True)
+                    progress.progress(done / len(rows), text=f"{done}/{len(rows)} rows")
+        if profile:
+            st.session_state.profile_report = profile['report']
+        grid.empty()
+        progress.empty()
+        st.session_state.multi_results = records
+
+    records = st.session_state.get('multi_results')
+    if records:
+        results = pd.DataFrame(records)
+        saved = results[results['saved'] != ""]
+        m1, m2, m3, m4 = st.columns(4)
+        m1.metric("New Compliant", f"{(results['new_flags'] == '✓').mean():.0%}")
+        m2.metric("Saved Compliant", f"{(saved['saved_flags'] == '✓').mean():.0%}" if len(saved) else "-")
+        m3.metric("Mean Latency", f"{results['latency'].mean():.2f}s")
+        m4.metric("Cache Hits", f"{int(results['cached'].sum())}/{len(results)}")
+        st.dataframe(results, hide_index=True, use_container_width=True, column_config={
+            "id": st.column_config.TextColumn("ID", width="small"),
+            "saved": st.column_config.TextColumn("Saved Output", width="large"),
+            "saved_flags": st.column_config.TextColumn("Saved Rules"),
+            "new": st.column_config.TextColumn("New Output", width="large"),
+            "new_flags": st.column_config.TextColumn("New Rules"),
+            "latency": st.column_config.NumberColumn("Latency", format="%.2f s"),
+            "cached": st.column_config.CheckboxColumn("Cached"),
+        })
+
+def get_prefetcher():
+    # One per session: its background work and speculative budget live across reruns
+    if 'prefetcher' not in st.session_state:
+        st.session_state.prefetcher = prefetch.Prefetcher()
+    return st.session_state.prefetcher
+
+def schedule_prefetch(display_df, indices, filename, template_content, scene_descriptions, gen_settings):
+    """Warms the given rows in the background; skipped when nothing changed since the last rerun."""
+    key = (filename, tuple(indices), template_content, scene_descriptions, tuple(sorted((gen_settings or {}).items())))
+    if st.session_state.get('prefetch_key') == key:
+        return
+    st.session_state.prefetch_key = key
+    get_prefetcher().schedule(display_df, indices, filename, template_content, scene_descriptions, gen_settings,
+                              gen.TASK_TEMPLATES[filename])
+
 def on_task_change():
     # Clear session state when task changes
-    for key in ['test_result', 'rendered_prompt', 'selected_row_index', 'last_selected_row', 'template_content']:
+    for key in ['test_result', 'rendered_prompt', 'selected_row_index', 'last_selected_row', 'template_content', 'pending_test', 'test_timing',
+                'multi_results']:
         if key in st.session_state:
             del st.session_state[key]
 
@@ -74,15 +178,22 @@ def main():
     
     # OpenAI API Key Input
     env_key = os.getenv("OPENAI_API_KEY", "")
-    placeholder = f"SK-{env_key[:4]}..." if env_key else "Enter OpenAI API Key"
+    pool = key_pool.get_pool()
+    if pool and len(pool.keys) > 1:
+        placeholder = f"{len(pool.keys)} pooled keys"
+    else:
+        placeholder = f"SK-{env_key[:4]}..." if env_key else "Enter OpenAI API Key"
     api_key = st.sidebar.text_input("OpenAI API Key", type="password", placeholder=placeholder)
     
     # Model Selection
-    model_choice = st.sidebar.selectbox("Model Selection", ["gpt-4o-mini", "gpt-4o", "gpt-3.5-turbo"], index=0)
+    model_choice = st.sidebar.selectbox("Model Selection", ["gpt-4o-mini", "gpt-4o", "gpt-3.5-turbo", model_router.AUTO, backends.LOCAL],
+                                        index=0,
+                                        help="'auto' picks a model per row from the routing rules; Run All also retries failed rows on a stronger model. "
+                                             "'local' drafts Task A on this machine's CPU with MWAHAHA_LOCAL_MODEL (no API key, text only).")
     
-    # Update Backend Config
-    if api_key or model_choice:
-        gen.set_config(api_key=api_key if api_key else env_key, model=model_choice)
+    # Settings are passed per call; the backend reuses one pooled client per key across reruns and sessions
+    # Without a key typed in, requests are spread over the keys from .env / api_keys.txt (key_pool.py)
+    gen_settings = {'model': model_choice, 'api_key': api_key or None}
 
     st.sidebar.divider()
     st.sidebar.header("Task Selection")
@@ -97,6 +208,29 @@ def main():
     task_label = st.sidebar.selectbox("Choose Task", list(task_files.keys()), index=0, on_change=on_task_change)
     filename = task_files[task_label]
     
+    pack_size = None
+    if filename and "task-a" in filename:
+        pack_size = st.sidebar.number_input("Rows per Request (Run All)", min_value=1, max_value=packing.max_pack_size(), value=1,
+                                            help=f"Pack several Task A rows into one JSON-mode request. Missing or malformed rows are retried individually. "
+                                                 f"At most {packing.max_pack_size()} rows, so each keeps {packing.ROW_TOKENS} of the "
+                                                 f"{packing.MAX_PACKED_TOKENS} completion tokens a packed request may use.")
+    
+    scene_descriptions = False
+    if filename and "task-b" in filename:
+        scene_descriptions = st.sidebar.checkbox("Use Scene Descriptions", value=False,
+                                                 help="Describe each GIF once (stored in the scene index) and caption from the description as a text-only request.")
+    
+    speculative = st.sidebar.checkbox("Speculative Generation", value=False,
+                                      help=f"Generate the rows next to the selected one with the current template in the background, "
+                                           f"so Test Prompt answers from the cache. At most {prefetch.SPECULATIVE_BUDGET} requests per session.")
+    if speculative:
+        st.sidebar.caption(f"Speculative requests used: {get_prefetcher().spent}/{get_prefetcher().budget}")
+    
+    # Per session: passed to each profiling.run rather than changing the process-wide setting
+    profile_actions = st.sidebar.checkbox("Profile Actions", value=profiling.enabled(),
+                                          help="Time each pipeline stage of Test Prompt and Run All and record peak memory. "
+                                               "Reports are written to runs/profiles/.")
+    
     if filename is None:
         # --- Landing Page ---
         with st.container(border=True):
@@ -122,28 +256,20 @@ def main():
             """)
         return
     
-    template_map = {
-        "task-a-en.tsv": "task_a_en.j2",
-        "task-a-es.tsv": "task_a_es.j2",
-        "task-a-zh.tsv": "task_a_zh.j2",
-        "task-b1.tsv": "task_b1.j2",
-        "task-b2.tsv": "task_b2.j2"
-    }
-    template_filename = template_map[filename]
+    template_filename = gen.TASK_TEMPLATES[filename]
     
     # Load Data
-    input_df = pd.read_csv(os.path.join(DATA_DIR, filename), sep='\t')
+    input_df = dataset.load_input(filename)
     
     # Load Output Data if exists to show in table
     output_path = os.path.join(OUTPUT_DIR, filename)
-    if os.path.exists(output_path):
-        try:
-            out_df = pd.read_csv(output_path, sep='\t')
-            # Merge to show current saved text
-            display_df = input_df.merge(out_df, on='id', how='left')
-        except:
-            display_df = input_df.copy()
-            display_df['text'] = ""
+    try:
+        out_df = dataset.load_output(filename, ['id', 'text'])
+    except Exception:
+        out_df = None
+    if out_df is not None:
+        # Merge to show current saved text
+        display_df = input_df.merge(out_df, on='id', how='left')
     else:
         display_df = input_df.copy()
         display_df['text'] = ""
@@ -185,13 +311,17 @@ def main():
         use_container_width=True,
         hide_index=True,
         on_select="rerun",
-        selection_mode="single-row"
+        selection_mode="multi-row",
+        key=f"table-{filename}"  # one selection per task; also lets benchmarks/ui_bench.py select rows
     )
 
     selected_rows = event.get("selection", {}).get("rows", [])
     
     if not selected_rows:
-        st.info("👆 Select a row in the table above to test prompts.")
+        st.info("👆 Select a row in the table above to test prompts (or several for a Multi-Row Test).")
+        # Warm the first rows of the table, without spending on speculative generation
+        schedule_prefetch(display_df, list(range(min(prefetch.FIRST_PAGE, len(display_df)))), filename,
+                          st.session_state.get('template_content') or load_template(template_filename), scene_descriptions, None)
     else:
         # Process Selection
         row_idx = selected_rows[0]
@@ -224,6 +354,9 @@ def main():
                     st.image(cached_path, caption="Input GIF (Cached)", use_container_width=True)
                     if "b2" in filename:
                         st.info(f"**Context Prompt:** {selected_row['prompt']}")
+                    description = scene_index.get_description(selected_row['url'])
+                    if description:
+                        st.caption(f"**Scene Description:** {description}")
                 else:
                     for col in display_df.columns:
                         if col not in ['id', 'text', 'url']:
@@ -239,22 +372,31 @@ def main():
         with col_edit:
             new_template = st.text_area("Jinja2 Template Editor", value=st.session_state.template_content, height=250)
             st.session_state.template_content = new_template
+            # Warm the next and previous rows with this template while this one is being looked at
+            schedule_prefetch(display_df, prefetch.neighbors(row_idx, len(display_df)), filename, new_template,
+                              scene_descriptions, gen_settings if speculative else None)
             
             if st.button("🚀 Test Prompt", use_container_width=True):
-                with st.spinner("Generating..."):
-                    user_input = gen.format_user_input(selected_row, filename)
-                    prompt = gen.get_rendered_prompt(template_filename, user_input, template_content=st.session_state.template_content)
-                    
+                with st.spinner("Preparing prompt..."):
                     vision_url = selected_row.get('url') if "task-b" in filename else None
                     if vision_url:
-                        vision_url = get_cached_gif(vision_url)
+                        # Warm the local cache; generate_humor sends the cached copy
+                        get_cached_gif(vision_url)
+                    if vision_url and scene_descriptions:
+                        # Stores the description, which prepare() then uses
+                        gen.describe_media(vision_url, priority=scheduler.INTERACTIVE, **gen_settings)
+                    # Usually already rendered by the prefetcher
+                    prompt, vision_url = get_prefetcher().prepare(selected_row, filename, st.session_state.template_content,
+                                                                  scene_descriptions, template_filename)
                     
-                    result = gen.generate_humor(prompt, vision_url=vision_url)
-                    st.session_state.test_result = result
+                    st.session_state.pending_test = {'prompt': prompt, 'vision_url': vision_url}
                     st.session_state.rendered_prompt = prompt
+                    st.session_state.pop('test_result', None)
+
+        multi_row_panel(display_df, filename, selected_rows, scene_descriptions, gen_settings, profile_actions)
 
         # --- 3. Results Section ---
-        if 'test_result' in st.session_state:
+        if 'test_result' in st.session_state or 'pending_test' in st.session_state:
             st.markdown("---")
             res_c1, res_c2 = st.columns([1, 1])
             with res_c1:
@@ -262,10 +404,36 @@ def main():
                 st.code(st.session_state.rendered_prompt, language="text")
             with res_c2:
                 st.markdown("**LLM Output:**")
+                if 'pending_test' in st.session_state:
+                    # Stream tokens into the pane as they arrive
+                    pending = st.session_state.pop('pending_test')
+                    stats = {}
+                    placeholder = st.empty()
+                    text = ""
+                    with profiling.run("test_prompt", os.path.splitext(filename)[0], enabled=profile_actions) as profile:
+                        # Interactive priority: batch runs in this or any other process yield to this request.
+                        # Served by the generation service when it runs (shared connections and budget)
+                        for delta in service.generate_humor(pending['prompt'], vision_url=pending['vision_url'], stats=stats,
+                                                            stream=True, priority=scheduler.INTERACTIVE, task=filename,
+                                                            **generation_limits.profile(filename), **gen_settings):
+                            text += delta
+                            placeholder.markdown(text + "▌")
+                    if profile:
+                        st.session_state.profile_report = profile['report']
+                    placeholder.empty()
+                    st.session_state.test_result = gen.clean_output(text.strip())
+                    st.session_state.test_timing = stats
                 if st.session_state.test_result.startswith("ERROR"):
                     st.error(st.session_state.test_result)
                 else:
                     st.success(st.session_state.test_result)
+                timing = st.session_state.get('test_timing', {})
+                if timing.get('cached'):
+                    st.caption("Served from response cache")
+                elif 'latency' in timing:
+                    st.caption(f"Time to first token: {timing.get('ttft', timing['latency']):.2f}s · Total: {timing['latency']:.2f}s")
+                if timing.get('finish_reason') == 'length':
+                    st.warning(f"Output was cut off at the task's max_tokens ({generation_limits.profile(filename)['max_tokens']}).")
 
             # --- 4. Action Buttons (Save/Run All) ---
             st.divider()
@@ -278,10 +446,38 @@ def main():
             if act_c2.button("🔥 Run All & Save Output", use_container_width=True):
                 with st.spinner(f"Processing all {len(input_df)} rows..."):
                     save_template(template_filename, st.session_state.template_content)
-                    gen.process_task(filename, template_filename)
+                    progress = st.progress(0.0)
+                    with profiling.run("run_all", os.path.splitext(filename)[0], enabled=profile_actions) as profile:
+                        # Runs as a job on the generation service if one is up, so it survives reruns of this page
+                        service.run_task(filename, template_filename, pack_size=pack_size, scene_descriptions=scene_descriptions,
+                                         on_progress=lambda n: progress.progress(min(1.0, n / len(input_df)),
+                                                                                 text=f"{n}/{len(input_df)} rows"),
+                                         **gen_settings)
+                    if profile:
+                        st.session_state.profile_report = profile['report']
                     st.balloons()
                     st.success(f"Batch processing complete! Output saved to `{output_path}`")
                     st.rerun() # Rerun to refresh the main table with new outputs
 
+            with act_c2.expander("💰 Pre-flight Estimate"):
+                if st.button("Estimate Run All", use_container_width=True):
+                    est = cost_estimator.estimate_task(filename, template_filename,
+                                                       template_content=st.session_state.template_content,
+                                                       model=model_choice, pack_size=pack_size,
+                                                       scene_descriptions=scene_descriptions)
+                    m1, m2, m3 = st.columns(3)
+                    m1.metric("Input Tokens", f"{est['input_tokens'] + est['image_tokens']:,}")
+                    m2.metric("Est. Cost", f"${est['cost']:.3f}", help=f"Worst case (all max_tokens): ${est['max_cost']:.3f}")
+                    m3.metric("Est. Duration", cost_estimator.format_duration(est['seconds']))
+                    st.caption(f"{est['rows']} rows in {est['requests']} requests · {est['image_tokens']:,} image tokens · "
+                               f"~{est['output_tokens']:,} output tokens · {est['latency']:.1f}s/request ({est['latency_source']})")
+                    images = est['vision_rows'] + est['describe_calls']
+                    if images and est['measured_images'] < images:
+                        st.caption(f"{images - est['measured_images']} GIFs not cached yet; their size was assumed.")
+
+            if 'profile_report' in st.session_state:
+                with st.expander("⏱ Last Profile"):
+                    st.code(st.session_state.profile_report, language="text")
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,152 @@
+import os
+import math
+import time
+import random
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import config
+import dataset
+import compliance
+import scene_index
+import generation_limits
+import baseline_generator as gen
+
+BATCH_SIZE = 8
+MIN_ROWS = 16
+MAX_ROWS = 96
+# Stricter than 1.96 because the comparison is repeated after every batch
+Z_CRITICAL = 2.8
+# Variants whose compliance rates are provably within this of each other count as equivalent
+EQUIVALENCE_MARGIN = 0.05
+WORKERS = 4
+
+def stratum(row, filename, median_length):
+    """Sampling stratum of an input row: the prompt shape that is most likely to change how a template behaves."""
+    if "task-a" in filename:
+        shape = "pair" if row.get('word1', '-') != '-' and row.get('word2', '-') != '-' else "headline"
+        length = "long" if len(str(row.get('headline', ''))) > median_length else "short"
+        return f"{shape}/{length}"
+    if "b2" in filename:
+        return "blank" if "___" in str(row.get('prompt', '')) else "open"
+    return "gif"
+
+def stratified_sample(df, filename, n, seed=0):
+    """Returns up to `n` rows interleaved across strata, so every prefix of the sample covers every stratum."""
+    median_length = df['headline'].astype(str).str.len().median() if 'headline' in df else 0
+    rng = random.Random(seed)
+    groups = {}
+    for _, row in df.iterrows():
+        groups.setdefault(stratum(row, filename, median_length), []).append(row)
+    for rows in groups.values():
+        rng.shuffle(rows)
+    # Proportional allocation, at least one row per stratum
+    quotas = {name: max(1, round(n * len(rows) / len(df))) for name, rows in groups.items()}
+    sample = []
+    for i in range(max(quotas.values())):
+        for name in sorted(groups):
+            if i < quotas[name] and i < len(groups[name]):
+                row = groups[name][i].copy()
+                row['stratum'] = name
+                sample.append(row)
+    return sample[:n]
+
+def load_variant(variant):
+    """Reads a template variant, given as a path or as a file name in the templates directory."""
+    path = variant if os.path.exists(variant) else os.path.join(config.TEMPLATE_DIR, variant)
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+def generate(row, filename, template_content, description=None, model=None, api_key=None):
+    """One output for one row and variant, with the task's generation profile. Kept out of the task's run log."""
+    user_input = gen.format_user_input(row, filename)
+    vision_url = row.get('url') if "task-b" in filename else None
+    if description:
+        user_input = scene_index.with_description(user_input, description)
+        vision_url = None
+    prompt = gen.get_rendered_prompt(None, user_input, template_content=template_content)
+    return gen.clean_output(gen.generate_humor(prompt, vision_url=vision_url, model=model, api_key=api_key, task=filename,
+                                                row_id=row['id'], **generation_limits.profile(filename)))
+
+def compare(scores_a, scores_b):
+    """Paired difference of mean scores and its standard error."""
+    diffs = [a - b for a, b in zip(scores_a, scores_b)]
+    n = len(diffs)
+    mean = sum(diffs) / n
+    var = sum((d - mean) ** 2 for d in diffs) / (n - 1) if n > 1 else 0.0
+    return mean, math.sqrt(var / n)
+
+def decide(scores, min_rows=MIN_ROWS):
+    """Returns ('winner', name), ('equivalent', None) or (None, None) if more rows are needed."""
+    n = len(next(iter(scores.values())))
+    if n < min_rows:
+        return None, None
+    ranked = sorted(scores, key=lambda name: sum(scores[name]), reverse=True)
+    best = ranked[0]
+    bounds = [compare(scores[best], scores[other]) for other in ranked[1:]]
+    if all(diff - Z_CRITICAL * se > 0 for diff, se in bounds):
+        return 'winner', best
+    if all(abs(diff) + Z_CRITICAL * se < EQUIVALENCE_MARGIN for diff, se in bounds):
+        return 'equivalent', None
+    return None, None
+
+def evaluate(filename, variants, batch_size=BATCH_SIZE, max_rows=MAX_ROWS, min_rows=MIN_ROWS, seed=0,
+             scene_descriptions=False, workers=WORKERS, model=None, api_key=None):
+    """Runs template variants side by side on a stratified sample until one is clearly more compliant.
+
+    Every variant sees the same rows (a paired comparison). After each batch the best variant is
+    compared against the others; evaluation stops as soon as it wins, or all are equivalent, or
+    `max_rows` is reached. Per-row outputs are written to runs/eval-<task>-<time>.tsv.
+    """
+    if len(set(variants)) < 2:
+        raise ValueError("at least two distinct template variants are needed")
+    templates = {variant: load_variant(variant) for variant in variants}
+    sample = stratified_sample(dataset.load_input(filename), filename, max_rows, seed)
+    scores = {variant: [] for variant in variants}
+    records = []
+    decision, winner = None, None
+    print(f"Evaluating {len(variants)} variants of {filename} on up to {len(sample)} rows...")
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for start in range(0, len(sample), batch_size):
+            batch = sample[start:start + batch_size]
+            descriptions = {}
+            if scene_descriptions and "task-b" in filename:
+                # One description per GIF, shared by every variant
+                descriptions = dict(zip([row['id'] for row in batch],
+                                        pool.map(lambda row: gen.describe_media(row['url'], model, api_key), batch)))
+            jobs = [(row, variant) for row in batch for variant in variants]
+            texts = pool.map(lambda job: generate(job[0], filename, templates[job[1]], descriptions.get(job[0]['id']),
+                                                  model, api_key), jobs)
+            for (row, variant), text in zip(jobs, texts):
+                problems = compliance.violations(text, filename, row)
+                scores[variant].append(0 if problems else 1)
+                records.append({'id': row['id'], 'stratum': row['stratum'], 'variant': variant, 'text': text,
+                                'compliant': not problems, 'violations': ",".join(problems)})
+            n = len(scores[variants[0]])
+            print(f"  {n} rows: " + ", ".join(f"{v} {sum(s) / n:.0%}" for v, s in scores.items()))
+            decision, winner = decide(scores, min_rows)
+            if decision:
+                break
+
+    results = pd.DataFrame(records)
+    os.makedirs(config.RUNS_DIR, exist_ok=True)
+    stem = os.path.splitext(filename)[0]
+    results_path = os.path.join(config.RUNS_DIR, f"eval-{stem}-{time.strftime('%Y%m%d-%H%M%S')}.tsv")
+    results.to_csv(results_path, sep='\t', index=False)
+    return {'task': filename, 'decision': decision, 'winner': winner, 'rows': len(scores[variants[0]]),
+            'requests': len(records), 'scores': scores, 'results': results, 'results_path': results_path}
+
+def print_report(report):
+    print(f"\n=== {report['task']}: {report['rows']} rows, {report['requests']} generations ===")
+    by_stratum = report['results'].pivot_table(index='stratum', columns='variant', values='compliant', aggfunc='mean')
+    for variant, scores in report['scores'].items():
+        print(f"  {variant:<40} {sum(scores) / len(scores):.1%} compliant")
+    print("\n  By stratum:")
+    print("  " + by_stratum.map(lambda x: f"{x:.0%}").to_string().replace("\n", "\n  "))
+    if report['decision'] == 'winner':
+        print(f"\n[RESULT] {report['winner']} is more compliant.")
+    elif report['decision'] == 'equivalent':
+        print("\n[RESULT] No meaningful difference in compliance; choose on humor.")
+    else:
+        print("\n[RESULT] No clear difference within the row budget.")
+    print(f"Outputs: {report['results_path']}")
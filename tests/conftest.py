@@ -0,0 +1,11 @@
+"""Points every directory at a scratch directory before any module reads config, and keeps requests off the network."""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks import synthetic
+
+synthetic.isolated_environment(tempfile.mkdtemp(prefix="mwahaha-tests-"), ROOT)
@@ -0,0 +1,62 @@
+"""Rewriting a task's output outside `build` must leave provenance that matches the new output."""
+import itertools
+import shutil
+import pytest
+import config
+import backends
+import baseline_generator as gen
+import build
+import provenance
+import work_queue
+from benchmarks import synthetic
+
+class FakeBackend(backends.OpenAIBackend):
+    """Answers every request with "<label> <n>", so each generation is told apart."""
+    resilient = False
+    label = "first"
+
+    def __init__(self):
+        self.counter = itertools.count()
+
+    def complete(self, messages, model, max_tokens, temperature, stop=None, json_mode=False, timeout=None, api_key=None,
+                 stats=None):
+        return backends.Reply(f"{self.label} {next(self.counter)}", "stop", 10, 5)
+
+@pytest.fixture
+def backend(monkeypatch):
+    fake = FakeBackend()
+    monkeypatch.setattr(gen.backends, "get", lambda model: fake)
+    monkeypatch.setattr(gen, "REQUEST_PAUSE", 0)
+    return fake
+
+def regenerate_outside_build(backend, filename, n):
+    """Generates a task with process_task, then clears the response cache so the next run gets new replies."""
+    synthetic.write_task(filename, n, config.DATA_DIR, config.OUTPUT_DIR)
+    gen.process_task(filename, config.TASK_TEMPLATES[filename], limit=n)
+    shutil.rmtree(config.RESPONSE_CACHE_DIR, ignore_errors=True)
+    backend.label = "second"
+
+def raws(filename):
+    return {record['raw'] for record in provenance.load(filename).values()}
+
+def test_stream_then_build(backend):
+    filename = "task-b2.tsv"
+    regenerate_outside_build(backend, filename, 3)
+    gen.stream_task(filename, config.TASK_TEMPLATES[filename], limit=3, chunk_size=2)
+
+    assert raws(filename) == {"second 3", "second 4", "second 5"}
+    build_plan = build.build(filename)
+    assert not build_plan['stale']
+    # Re-cleaned from the streamed replies, not the ones process_task recorded
+    assert raws(filename) == {"second 3", "second 4", "second 5"}
+
+def test_merge_then_build(backend):
+    filename = "task-a-en.tsv"
+    regenerate_outside_build(backend, filename, 6)
+    work_queue.create(filename, config.TASK_TEMPLATES[filename], shard_size=4)
+    work_queue.work(filename, wait=False)
+    assert work_queue.merge(filename)
+
+    assert raws(filename) == {f"second {i}" for i in range(6, 12)}
+    build_plan = build.plan(filename)
+    assert len(build_plan['fresh']) == 6
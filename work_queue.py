@@ -0,0 +1,274 @@
+import os
+import json
+import time
+import socket
+import sqlite3
+import hashlib
+import tempfile
+import multiprocessing
+from contextlib import closing
+import pandas as pd
+import config
+import dataset
+import provenance
+
+SHARD_SIZE = 100
+# A worker renews its lease every third of this; a crashed worker's shard is reclaimed once it runs out
+LEASE_SECONDS = 300
+POLL_SECONDS = 10
+# Shards that were claimed this many times without finishing are left for a human to look at
+MAX_ATTEMPTS = 3
+
+class _LeaseLost(Exception):
+    pass
+
+def queue_dir(filename):
+    return os.path.join(config.QUEUE_DIR, os.path.splitext(os.path.basename(filename))[0])
+
+def db_path(filename):
+    return os.path.join(queue_dir(filename), "queue.sqlite")
+
+def shard_path(filename, shard):
+    return os.path.join(queue_dir(filename), f"shard-{shard:05d}.tsv")
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def _connect(filename):
+    conn = sqlite3.connect(db_path(filename), timeout=60, isolation_level=None)
+    # Rollback journal rather than WAL: WAL needs shared memory, which network filesystems don't provide
+    conn.execute("PRAGMA journal_mode=DELETE")
+    return conn
+
+def _input_ids(filename, rows=None):
+    ids = dataset.load_input(filename, ['id'])['id'].tolist()
+    return ids[:rows] if rows else ids
+
+def create(filename, template_name, shard_size=SHARD_SIZE, limit=None, pack_size=None, scene_descriptions=False,
+           model=None, reset=False):
+    """Splits a task into shards of `shard_size` input rows. Returns the number of shards, or None on error.
+
+    An existing queue with the same settings and input is kept, so re-running this resumes an
+    interrupted run. A queue with different settings is only replaced with `reset`.
+    """
+    ids = _input_ids(filename, limit)
+    settings = {
+        'template': template_name, 'rows': len(ids), 'shard_size': shard_size, 'pack_size': pack_size,
+        'scene_descriptions': scene_descriptions, 'model': model,
+        'ids_sha256': hashlib.sha256("\n".join(map(str, ids)).encode()).hexdigest()
+    }
+    os.makedirs(queue_dir(filename), exist_ok=True)
+    with closing(_connect(filename)) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("CREATE TABLE IF NOT EXISTS job (key TEXT PRIMARY KEY, value TEXT)")
+        conn.execute("""CREATE TABLE IF NOT EXISTS shards (
+            shard INTEGER PRIMARY KEY, start INTEGER, stop INTEGER, status TEXT,
+            worker TEXT, lease_expires REAL, attempts INTEGER DEFAULT 0, finished REAL)""")
+        row = conn.execute("SELECT value FROM job WHERE key = 'settings'").fetchone()
+        if row and json.loads(row[0]) == settings and not reset:
+            conn.execute("COMMIT")
+            count = conn.execute("SELECT COUNT(*) FROM shards").fetchone()[0]
+            print(f"Resuming existing queue for {filename} ({count} shards).")
+            return count
+        if row and not reset:
+            conn.execute("ROLLBACK")
+            print(f"[ERROR] A queue with different settings or input exists for {filename}; use reset to replace it.")
+            return None
+        conn.execute("DELETE FROM shards")
+        for name in os.listdir(queue_dir(filename)):
+            if name.startswith("shard-"):
+                os.remove(os.path.join(queue_dir(filename), name))
+        shards = [(i, start, min(start + shard_size, len(ids)), 'pending')
+                  for i, start in enumerate(range(0, len(ids), shard_size))]
+        conn.executemany("INSERT INTO shards (shard, start, stop, status) VALUES (?, ?, ?, ?)", shards)
+        conn.execute("INSERT OR REPLACE INTO job (key, value) VALUES ('settings', ?)", (json.dumps(settings),))
+        conn.execute("COMMIT")
+    print(f"Queued {filename}: {len(ids)} rows in {len(shards)} shards.")
+    return len(shards)
+
+def load_settings(filename):
+    if not os.path.exists(db_path(filename)):
+        return None
+    with closing(_connect(filename)) as conn:
+        row = conn.execute("SELECT value FROM job WHERE key = 'settings'").fetchone()
+    return json.loads(row[0]) if row else None
+
+def claim(filename, worker, lease_seconds=LEASE_SECONDS):
+    """Leases the first pending shard (or one whose lease expired). Returns (shard, start, stop) or None."""
+    now = time.time()
+    with closing(_connect(filename)) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute("""SELECT shard, start, stop FROM shards
+            WHERE (status = 'pending' OR (status = 'leased' AND lease_expires < ?)) AND attempts < ?
+            ORDER BY shard LIMIT 1""", (now, MAX_ATTEMPTS)).fetchone()
+        if row:
+            conn.execute("""UPDATE shards SET status = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1
+                WHERE shard = ?""", (worker, now + lease_seconds, row[0]))
+        conn.execute("COMMIT")
+    return row
+
+def renew(filename, shard, worker, lease_seconds=LEASE_SECONDS):
+    """Extends a lease. Returns False if the shard has been taken over by another worker."""
+    with closing(_connect(filename)) as conn:
+        cur = conn.execute("UPDATE shards SET lease_expires = ? WHERE shard = ? AND worker = ? AND status = 'leased'",
+                           (time.time() + lease_seconds, shard, worker))
+        return cur.rowcount == 1
+
+def release(filename, shard, worker):
+    """Hands a leased shard back to the queue straight away instead of waiting for the lease to expire."""
+    with closing(_connect(filename)) as conn:
+        conn.execute("""UPDATE shards SET status = 'pending', worker = NULL, lease_expires = NULL
+            WHERE shard = ? AND worker = ? AND status = 'leased'""", (shard, worker))
+
+def complete(filename, shard, worker, results):
+    """Writes a shard's results and marks it done. Returns False if the lease was lost meanwhile.
+
+    The shard file is replaced atomically, so if a worker whose lease expired finishes at the same
+    time as the one that took over, the file still holds one complete set of results.
+    """
+    path = shard_path(filename, shard)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + ".", suffix=".tmp")
+    os.close(fd)
+    pd.DataFrame(results, columns=['id', 'text']).to_csv(tmp_path, sep='\t', index=False)
+    with closing(_connect(filename)) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        cur = conn.execute("""UPDATE shards SET status = 'done', lease_expires = NULL, finished = ?
+            WHERE shard = ? AND worker = ? AND status = 'leased'""", (time.time(), shard, worker))
+        if cur.rowcount == 1:
+            os.replace(tmp_path, path)
+        conn.execute("COMMIT")
+    if cur.rowcount != 1:
+        os.remove(tmp_path)
+        return False
+    return True
+
+def status(filename):
+    """Returns shard counts by state: pending, leased, expired, failed and done."""
+    counts = {'pending': 0, 'leased': 0, 'expired': 0, 'failed': 0, 'done': 0}
+    if not os.path.exists(db_path(filename)):
+        return None
+    now = time.time()
+    with closing(_connect(filename)) as conn:
+        for state, lease_expires, attempts in conn.execute("SELECT status, lease_expires, attempts FROM shards"):
+            if state != 'done' and attempts >= MAX_ATTEMPTS and (state == 'pending' or lease_expires < now):
+                state = 'failed'
+            elif state == 'leased' and lease_expires < now:
+                state = 'expired'
+            counts[state] += 1
+    return counts
+
+def print_status(filename):
+    counts = status(filename)
+    if counts is None:
+        print(f"  {filename:<16} no queue")
+        return
+    total = sum(counts.values())
+    print(f"  {filename:<16} {counts['done']}/{total} shards done, {counts['leased']} leased, "
+          f"{counts['pending']} pending, {counts['expired']} expired, {counts['failed']} failed")
+
+def work(filename, worker=None, lease_seconds=LEASE_SECONDS, wait=True, api_key=None):
+    """Claims and generates shards until none are left. Returns the number of shards this worker finished.
+
+    With `wait`, the worker keeps polling while other workers still hold leases, so it can pick up
+    the shards of any worker that crashed once their leases expire.
+    """
+    import baseline_generator as gen
+    settings = load_settings(filename)
+    if settings is None:
+        print(f"[ERROR] No queue for {filename}; create one first.")
+        return 0
+    worker = worker or worker_id()
+    df = dataset.load_input(filename).head(settings['rows'])
+    finished = 0
+    while True:
+        shard = claim(filename, worker, lease_seconds)
+        if shard is None:
+            counts = status(filename)
+            if wait and counts['leased'] + counts['expired']:
+                time.sleep(POLL_SECONDS)
+                continue
+            break
+        shard_id, start, stop = shard
+        print(f"[{worker}] {filename} shard {shard_id} (rows {start}-{stop - 1})")
+        last_renewal = [time.time()]
+
+        def heartbeat(_):
+            if time.time() - last_renewal[0] > lease_seconds / 3:
+                if not renew(filename, shard_id, worker, lease_seconds):
+                    raise _LeaseLost()
+                last_renewal[0] = time.time()
+
+        try:
+            results = gen.generate_rows(df.iloc[start:stop], filename, settings['template'], settings['pack_size'],
+                                        settings['scene_descriptions'], model=settings['model'], api_key=api_key,
+                                        on_progress=heartbeat)
+        except _LeaseLost:
+            print(f"[{worker}] Lost the lease on shard {shard_id}; another worker has it.")
+            continue
+        except BaseException:
+            release(filename, shard_id, worker)
+            raise
+        if complete(filename, shard_id, worker, results):
+            finished += 1
+        else:
+            print(f"[{worker}] Shard {shard_id} was finished by another worker.")
+    return finished
+
+def run_workers(filename, workers, lease_seconds=LEASE_SECONDS, wait=True):
+    """Runs `workers` local worker processes against a task's queue and waits for them."""
+    # Spawned children re-import config, so hand any directory overrides down through the environment
+    os.environ.update({"MWAHAHA_DATA_DIR": config.DATA_DIR, "MWAHAHA_OUTPUT_DIR": config.OUTPUT_DIR,
+                       "MWAHAHA_QUEUE_DIR": config.QUEUE_DIR})
+    processes = [multiprocessing.Process(target=work, args=(filename,), kwargs={'lease_seconds': lease_seconds, 'wait': wait})
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    return all(process.exitcode == 0 for process in processes)
+
+def merge(filename, allow_partial=False):
+    """Writes output/<task>.tsv from the finished shards, in input order. Returns True if written.
+
+    With `allow_partial`, rows of unfinished shards are left empty so `regenerate` can fill them later.
+    The merged rows' provenance replaces the task's earlier records, as with process_task.
+    """
+    import baseline_generator as gen
+    settings = load_settings(filename)
+    if settings is None:
+        print(f"[ERROR] No queue for {filename}.")
+        return False
+    counts = status(filename)
+    if counts['done'] < sum(counts.values()) and not allow_partial:
+        print(f"[ERROR] {filename}: only {counts['done']} of {sum(counts.values())} shards are done.")
+        return False
+
+    texts = {}
+    with closing(_connect(filename)) as conn:
+        done = [row[0] for row in conn.execute("SELECT shard FROM shards WHERE status = 'done' ORDER BY shard")]
+    for shard in done:
+        shard_df = pd.read_csv(shard_path(filename, shard), sep='\t')
+        texts.update(zip(shard_df['id'], shard_df['text']))
+
+    input_df = dataset.load_input(filename)
+    if settings['rows']:
+        input_df = input_df.head(settings['rows'])
+    final_df = pd.DataFrame({'id': input_df['id']})
+    final_df['text'] = final_df['id'].map(texts)
+    os.makedirs(config.OUTPUT_DIR, exist_ok=True)
+    output_path = os.path.join(config.OUTPUT_DIR, filename)
+    # A unique temp file, so concurrent merges from any thread or process never write the same one
+    fd, tmp_path = tempfile.mkstemp(dir=config.OUTPUT_DIR, prefix=filename + ".", suffix=".tmp")
+    os.close(fd)
+    try:
+        final_df.to_csv(tmp_path, sep='\t', index=False)
+        # mkstemp files are private to the owner; the output is read like any other
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    provenance.record(filename, input_df, texts, settings['template'],
+                      gen.generation_params(filename, settings['model'], settings['scene_descriptions']), replace=True)
+    print(f"[SUCCESS] Merged {len(done)} shards into {output_path} ({final_df['text'].notna().sum()}/{len(final_df)} rows).")
+    return True